@@ -0,0 +1,122 @@
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from emush_rag_chatbot.config import settings
+from emush_rag_chatbot.index_manifest import index_version
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def answer_cache_version() -> str:
+    """Return the version of the settings and indexed chunks an answer depends on, to invalidate stale cached answers"""
+    index = index_version(settings.INDEX_MANIFEST_PATH)
+    return f"{settings.PROMPT_VERSION}:{settings.CHAT_MODEL}:{settings.EMBEDDING_MODEL}:{settings.TOP_K}:{index}"
+
+
+class SemanticAnswerCache:
+    """Caches answers to queries without chat history, matching new queries by embedding cosine similarity"""
+
+    def __init__(
+        self,
+        similarity_threshold: float = settings.ANSWER_CACHE_SIMILARITY_THRESHOLD,
+        max_size: int = settings.ANSWER_CACHE_SIZE,
+    ):
+        self.similarity_threshold = similarity_threshold
+        self.max_size = max_size
+        self.version: Optional[str] = None
+        self.hits = 0
+        self.misses = 0
+        self._embeddings: Optional[np.ndarray] = None
+        self._answers: Dict[int, Tuple[str, List[Document]]] = {}
+        self._lru: OrderedDict[int, None] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def stats(self) -> Dict[str, float]:
+        """Return cache hit/miss counters"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._answers),
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def clear(self) -> None:
+        """Remove all cached answers"""
+        self._embeddings = None
+        self._answers.clear()
+        self._lru.clear()
+
+    def _ensure_version(self, version: str) -> None:
+        """Drop every cached answer if the version they were computed with changed"""
+        if version != self.version:
+            if self._answers:
+                logger.info(f"Answer cache version changed from {self.version} to {version}, clearing cache")
+            self.clear()
+            self.version = version
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, embedding: List[float], version: str) -> Optional[Tuple[str, List[Document]]]:
+        """
+        Find the cached answer of the most similar previous query
+
+        Args:
+            embedding: Embedding of the new query
+            version: Current answer cache version
+
+        Returns:
+            Cached response and sources if a previous query is within the similarity threshold, None otherwise
+        """
+        with self._lock:
+            self._ensure_version(version)
+            if not self._answers or self._embeddings is None:
+                self.misses += 1
+                return None
+
+            # Slots are filled contiguously, so the first rows hold every cached query
+            similarities = self._embeddings[: len(self._answers)] @ self._normalize(embedding)
+            slot = int(np.argmax(similarities))
+            if similarities[slot] < self.similarity_threshold:
+                self.misses += 1
+                return None
+
+            self._lru.move_to_end(slot)
+            self.hits += 1
+            return self._answers[slot]
+
+    def store(self, embedding: List[float], version: str, response: str, sources: List[Document]) -> None:
+        """
+        Cache the answer to a query, evicting the least recently used answer if the cache is full
+
+        Args:
+            embedding: Embedding of the query
+            version: Current answer cache version
+            response: Generated response
+            sources: Documents used to generate the response
+        """
+        with self._lock:
+            self._ensure_version(version)
+            vector = self._normalize(embedding)
+            if self._embeddings is None or self._embeddings.shape[1] != vector.shape[0]:
+                self.clear()
+                self._embeddings = np.zeros((self.max_size, vector.shape[0]), dtype=np.float32)
+
+            if len(self._answers) < self.max_size:
+                slot = len(self._answers)
+            else:
+                slot, _ = self._lru.popitem(last=False)
+
+            self._embeddings[slot] = vector
+            self._answers[slot] = (response, sources)
+            self._lru[slot] = None
@@ -1,38 +1,104 @@
+import asyncio
+import json
 import logging
-from typing import Dict, List, Optional
+import threading
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional
 
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+from fastapi import Depends, FastAPI, HTTPException
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from langchain_core.documents import Document
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from pydantic import BaseModel, Field, model_validator
 
+from emush_rag_chatbot.answer_cache import SemanticAnswerCache
+from emush_rag_chatbot.config import settings
+from emush_rag_chatbot.conversation_store import ConversationStore
 from emush_rag_chatbot.llm import OpenAILLM
+from emush_rag_chatbot.metrics import REQUEST_DURATION, REQUESTS_IN_FLIGHT
 from emush_rag_chatbot.rag_chain import RAGChain
-from emush_rag_chatbot.vector_store import ChromaVectorStore
+from emush_rag_chatbot.vector_store import create_vector_store
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="eMush RAG Chatbot")
 
-# Initialize RAG chain lazily
+async def warm_up(app: FastAPI) -> None:
+    """Build the RAG chain and load its index, then run the warm-up queries, marking the app ready once done"""
+    try:
+        build_rag_chain = app.dependency_overrides.get(get_rag_chain, get_rag_chain)
+        rag_chain = await asyncio.to_thread(build_rag_chain)
+        await rag_chain.warm_up(settings.WARMUP_QUERIES, answer=settings.WARMUP_ANSWERS)
+        app.state.status = "ready"
+        logger.info("RAG chain warmed up, ready to serve requests")
+    except Exception as e:
+        logger.error(f"Error warming up RAG chain: {e}")
+        app.state.status = "failed"
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """Warm the RAG chain up in the background at startup, so that the server answers probes meanwhile"""
+    app.state.status = "warming up"
+    warm_up_task = asyncio.create_task(warm_up(app))
+    yield
+    warm_up_task.cancel()
+
+
+app = FastAPI(title="eMush RAG Chatbot", lifespan=lifespan)
+
+# Initialize RAG chain at startup, or lazily on the first request when the app runs without lifespan
 _rag_chain = None
+_rag_chain_lock = threading.Lock()
 
 
 def get_rag_chain() -> RAGChain:
     """Get or create RAG chain instance"""
     global _rag_chain
+    # The chain is built in a worker thread by the warm-up, and FastAPI runs this dependency in a worker thread too
     if _rag_chain is None:
-        _rag_chain = RAGChain(
-            vector_store=ChromaVectorStore(),
-            llm=OpenAILLM(),
-        )
+        with _rag_chain_lock:
+            if _rag_chain is None:
+                _rag_chain = RAGChain(
+                    vector_store=create_vector_store(),
+                    llm=OpenAILLM(),
+                    answer_cache=SemanticAnswerCache() if settings.ANSWER_CACHE_ENABLED else None,
+                )
     return _rag_chain
 
 
+_conversation_store = None
+_conversation_store_lock = threading.Lock()
+
+
+def get_conversation_store() -> ConversationStore:
+    """Get or create conversation store instance"""
+    global _conversation_store
+    # FastAPI runs this dependency in worker threads, which must not open the database twice
+    if _conversation_store is None:
+        with _conversation_store_lock:
+            if _conversation_store is None:
+                _conversation_store = ConversationStore()
+    return _conversation_store
+
+
 class ChatRequest(BaseModel):
-    """Schema for chat requests"""
+    """
+    Schema for chat requests
+
+    Clients either send the whole `chat_history`, or a `conversation_id` of their choice for which the server keeps
+    the history.
+    """
 
     query: str
     chat_history: Optional[List[Dict[str, str]]] = None
+    conversation_id: Optional[str] = None
+
+    @model_validator(mode="after")
+    def check_history_source(self) -> "ChatRequest":
+        if self.chat_history is not None and self.conversation_id is not None:
+            raise ValueError("Send either chat_history or conversation_id, not both")
+        return self
 
 
 class SourceDocument(BaseModel):
@@ -49,6 +115,45 @@ class ChatResponse(BaseModel):
 
     response: str
     sources: List[SourceDocument]
+    conversation_id: Optional[str] = None
+
+
+class BatchChatRequest(BaseModel):
+    """Schema for batch chat requests, answering independent queries without chat history"""
+
+    queries: List[str] = Field(min_length=1, max_length=settings.BATCH_MAX_QUERIES)
+
+
+class BatchChatResult(BaseModel):
+    """Schema for the result of one query of a batch, with either a response or an error"""
+
+    response: Optional[str] = None
+    sources: List[SourceDocument] = Field(default_factory=list)
+    error: Optional[str] = None
+
+
+class BatchChatResponse(BaseModel):
+    """Schema for batch chat responses, with results in the order of the queries"""
+
+    results: List[BatchChatResult]
+
+
+def to_source_documents(docs: List[Document]) -> List[SourceDocument]:
+    """Convert retrieved documents to source documents returned to clients"""
+    return [
+        SourceDocument(
+            content=doc.page_content,
+            title=doc.metadata.get("title", ""),
+            source=doc.metadata.get("source", ""),
+            link=doc.metadata.get("link", ""),
+        )
+        for doc in docs
+    ]
+
+
+def format_sse(event: str, data: object) -> str:
+    """Format a Server-Sent Event with JSON-encoded data"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
 
 
 @app.get("/health")
@@ -57,33 +162,139 @@ async def health_check():
     return {"status": "healthy"}
 
 
+@app.get("/ready")
+async def readiness_check() -> JSONResponse:
+    """Readiness endpoint, failing until the RAG chain is built and warmed up"""
+    status = getattr(app.state, "status", "not started")
+    return JSONResponse({"status": status}, status_code=200 if status == "ready" else 503)
+
+
+@app.get("/metrics")
+async def metrics() -> Response:
+    """Metrics endpoint exposing request, pipeline stage and cache metrics in the Prometheus text format"""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+async def get_chat_history(
+    request: ChatRequest, conversation_store: ConversationStore
+) -> Optional[List[Dict[str, str]]]:
+    """Get the chat history sent with the request, or kept server-side for its conversation"""
+    if request.conversation_id is not None:
+        # The store may read SQLite, which must not block the event loop
+        return await asyncio.to_thread(conversation_store.get, request.conversation_id)
+    return request.chat_history
+
+
 @app.post("/chat", response_model=ChatResponse)
-async def chat_endpoint(request: ChatRequest):
+async def chat_endpoint(
+    request: ChatRequest,
+    rag_chain: RAGChain = Depends(get_rag_chain),
+    conversation_store: ConversationStore = Depends(get_conversation_store),
+):
     """
     Chat endpoint that processes queries using RAG
 
     Args:
         request: ChatRequest containing query and optional parameters
+        rag_chain: RAG chain answering the query
+        conversation_store: Store of the conversations kept server-side
 
     Returns:
         Generated response with source citations
     """
     try:
-        rag_chain = get_rag_chain()
-        response, sources = await rag_chain.generate_response(query=request.query, chat_history=request.chat_history)
-
-        source_documents = [
-            SourceDocument(
-                content=doc.page_content,
-                title=doc.metadata.get("title", ""),
-                source=doc.metadata.get("source", ""),
-                link=doc.metadata.get("link", ""),
+        with REQUESTS_IN_FLIGHT.labels("/chat").track_inprogress(), REQUEST_DURATION.labels("/chat").time():
+            response, sources = await rag_chain.generate_response(
+                query=request.query, chat_history=await get_chat_history(request, conversation_store)
             )
-            for doc in sources
-        ]
+            if request.conversation_id is not None:
+                await asyncio.to_thread(conversation_store.append, request.conversation_id, request.query, response)
 
-        return ChatResponse(response=response, sources=source_documents)
+        return ChatResponse(
+            response=response, sources=to_source_documents(sources), conversation_id=request.conversation_id
+        )
 
     except Exception as e:
         logger.error(f"Error processing chat request: {e}")
         raise HTTPException(status_code=500, detail=f"Error generating response: {str(e)}")
+
+
+@app.post("/chat/batch", response_model=BatchChatResponse)
+async def chat_batch_endpoint(request: BatchChatRequest, rag_chain: RAGChain = Depends(get_rag_chain)):
+    """
+    Chat endpoint answering several queries at once
+
+    Queries share a single embedding request and retrieval pass. A query failing does not fail the others: its
+    result holds the error instead of a response.
+
+    Args:
+        request: BatchChatRequest containing the queries
+        rag_chain: RAG chain answering the queries
+
+    Returns:
+        Generated response with source citations, or error, for each query in order
+    """
+    with REQUESTS_IN_FLIGHT.labels("/chat/batch").track_inprogress(), REQUEST_DURATION.labels("/chat/batch").time():
+        results = await rag_chain.generate_responses(request.queries)
+
+    return BatchChatResponse(
+        results=[
+            BatchChatResult(error=f"Error generating response: {str(result)}")
+            if isinstance(result, Exception)
+            else BatchChatResult(response=result[0], sources=to_source_documents(result[1]))
+            for result in results
+        ]
+    )
+
+
+@app.post("/chat/stream")
+async def chat_stream_endpoint(
+    request: ChatRequest,
+    rag_chain: RAGChain = Depends(get_rag_chain),
+    conversation_store: ConversationStore = Depends(get_conversation_store),
+) -> StreamingResponse:
+    """
+    Chat endpoint streaming the response as Server-Sent Events
+
+    Sends a `sources` event with the source documents, `token` events as the response is generated,
+    then a `done` event. Errors occurring once the stream started are sent as an `error` event.
+
+    Args:
+        request: ChatRequest containing query and optional parameters
+        rag_chain: RAG chain answering the query
+        conversation_store: Store of the conversations kept server-side
+
+    Returns:
+        Streaming response of Server-Sent Events
+    """
+
+    async def event_stream() -> AsyncIterator[str]:
+        # The request is in flight until the whole stream is sent
+        with (
+            REQUESTS_IN_FLIGHT.labels("/chat/stream").track_inprogress(),
+            REQUEST_DURATION.labels("/chat/stream").time(),
+        ):
+            async for chunk in stream_events():
+                yield chunk
+
+    async def stream_events() -> AsyncIterator[str]:
+        try:
+            tokens = []
+            chat_history = await get_chat_history(request, conversation_store)
+            async for event in rag_chain.stream_response(query=request.query, chat_history=chat_history):
+                if event["event"] == "sources":
+                    yield format_sse("sources", [source.model_dump() for source in to_source_documents(event["data"])])
+                else:
+                    tokens.append(event["data"])
+                    yield format_sse(event["event"], event["data"])
+            # Only complete exchanges are kept
+            if request.conversation_id is not None:
+                await asyncio.to_thread(
+                    conversation_store.append, request.conversation_id, request.query, "".join(tokens)
+                )
+            yield format_sse("done", {})
+        except Exception as e:
+            logger.error(f"Error streaming chat response: {e}")
+            yield format_sse("error", {"detail": f"Error generating response: {str(e)}"})
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
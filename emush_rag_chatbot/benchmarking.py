@@ -0,0 +1,73 @@
+import csv
+import logging
+import statistics
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+from langchain_core.embeddings import DeterministicFakeEmbedding, Embeddings
+
+from emush_rag_chatbot import embeddings as embedding_models
+from emush_rag_chatbot.config import settings
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def load_questions(test_files: List[Path]) -> List[str]:
+    """
+    Load the distinct questions of test sets
+
+    The first version of the test set is comma-separated, while later ones are semicolon-separated.
+
+    Args:
+        test_files: CSV test sets with a `question` column
+
+    Returns:
+        Questions in order of first appearance
+    """
+    questions: List[str] = []
+    for test_file in test_files:
+        with open(test_file, "r", encoding="utf-8") as f:
+            delimiter = ";" if ";" in f.readline() else ","
+            f.seek(0)
+            questions.extend(case["question"] for case in csv.DictReader(f, delimiter=delimiter))
+    return list(dict.fromkeys(questions))
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Return the `q` quantile (between 0 and 1) of values, or 0 without values"""
+    values = sorted(values)
+    return values[min(int(len(values) * q), len(values) - 1)] if values else 0.0
+
+
+def summarize_latencies(latencies: List[float]) -> Dict[str, float]:
+    """Summarize latencies in milliseconds by their mean, median and 95th percentile"""
+    return {
+        "mean_ms": statistics.mean(latencies),
+        "p50_ms": percentile(latencies, 0.5),
+        "p95_ms": percentile(latencies, 0.95),
+    }
+
+
+def can_embed_queries() -> bool:
+    """Whether the configured embedding model can be called, being local or having its API key"""
+    return bool(settings.OPENAI_API_KEY) or embedding_models.is_local_model()
+
+
+def create_embeddings() -> Embeddings:
+    """Create the configured embedding model, or a placeholder when it needs a missing API key"""
+    if can_embed_queries():
+        return embedding_models.create_embeddings()
+    # Searches use precomputed query embeddings, so the placeholder is never called
+    return DeterministicFakeEmbedding(size=1)
+
+
+def embed_questions(embeddings: Embeddings, questions: List[str], dimension: int) -> List[List[float]]:
+    """Embed questions with the configured model, or draw random unit vectors when it needs a missing API key"""
+    if can_embed_queries():
+        return embeddings.embed_documents(questions)
+
+    logger.warning("OPENAI_API_KEY is not set, using random query vectors: only latencies are meaningful")
+    vectors = np.random.default_rng(settings.SEED).normal(size=(len(questions), dimension))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).tolist()
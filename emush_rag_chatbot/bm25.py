@@ -0,0 +1,243 @@
+import hashlib
+import json
+import logging
+import math
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+STOPWORDS = {
+    # French
+    "au", "aux", "avec", "ce", "ces", "cette", "dans", "de", "des", "du", "elle", "en", "est", "et", "il", "ils",
+    "je", "la", "le", "les", "leur", "mais", "me", "ne", "nous", "on", "ou", "par", "pas", "pour", "qu", "que",
+    "qui", "sa", "se", "ses", "son", "sur", "ta", "te", "tu", "un", "une", "vous",
+    # English
+    "an", "and", "are", "as", "at", "be", "by", "do", "for", "from", "how", "in", "is", "it", "of", "on", "or",
+    "that", "the", "this", "to", "what", "with",
+}  # fmt: skip
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+K1 = 1.5
+B = 0.75
+PARAMETERS_FILE = "bm25.json"
+TERM_HASHES_FILE = "bm25_term_hashes.npy"
+POSTING_OFFSETS_FILE = "bm25_posting_offsets.npy"
+POSTING_ROWS_FILE = "bm25_posting_rows.npy"
+POSTING_FREQUENCIES_FILE = "bm25_posting_frequencies.npy"
+DOC_LENGTHS_FILE = "bm25_doc_lengths.npy"
+SOURCES_FILE = "bm25_sources.npy"
+ARRAY_FILES = [
+    TERM_HASHES_FILE, POSTING_OFFSETS_FILE, POSTING_ROWS_FILE, POSTING_FREQUENCIES_FILE, DOC_LENGTHS_FILE, SOURCES_FILE,
+]  # fmt: skip
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercase, accent-free terms, dropping stopwords"""
+    text = unicodedata.normalize("NFKD", text.casefold())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return [token for token in TOKEN_PATTERN.findall(text) if len(token) > 1 and token not in STOPWORDS]
+
+
+def term_hash(term: str) -> int:
+    """Hash a term to 64 bits, identically across processes unlike the built-in `hash`"""
+    return int.from_bytes(hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class BM25Postings:
+    """
+    Posting lists of documents added in row order, without the documents themselves
+
+    Only term frequencies, document lengths and sources are kept, so that an index can be built while its documents
+    are streamed to the NumPy index, which stores them in the same rows.
+    """
+
+    def __init__(self) -> None:
+        self.postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self.doc_lengths: List[int] = []
+        self.source_ids: Dict[str, int] = {}
+        self.sources: List[int] = []
+
+    def add_documents(self, documents: Iterable[Document]) -> None:
+        """Add the terms of the title and content of documents, in the rows following the previous ones"""
+        for doc in documents:
+            row = len(self.doc_lengths)
+            terms = tokenize(f"{doc.metadata.get('title', '')} {doc.page_content}")
+            for term, frequency in Counter(terms).items():
+                self.postings[term].append((row, frequency))
+            self.doc_lengths.append(len(terms))
+            source = doc.metadata.get("source", "")
+            self.sources.append(self.source_ids.setdefault(source, len(self.source_ids)))
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        """
+        Return the postings as arrays
+
+        Terms are sorted by hash, and the postings of the i-th term are the `POSTING_OFFSETS_FILE[i]` to
+        `POSTING_OFFSETS_FILE[i + 1]` rows and frequencies, in row order.
+        """
+        terms = sorted(self.postings, key=term_hash)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum([len(self.postings[term]) for term in terms], out=offsets[1:])
+        postings = np.array([posting for term in terms for posting in self.postings[term]], dtype=np.int32)
+        postings = postings.reshape(-1, 2)
+        return {
+            TERM_HASHES_FILE: np.array([term_hash(term) for term in terms], dtype=np.uint64),
+            POSTING_OFFSETS_FILE: offsets,
+            POSTING_ROWS_FILE: np.ascontiguousarray(postings[:, 0]),
+            POSTING_FREQUENCIES_FILE: np.ascontiguousarray(postings[:, 1]),
+            DOC_LENGTHS_FILE: np.array(self.doc_lengths, dtype=np.int32),
+            SOURCES_FILE: np.array(self.sources, dtype=np.int32),
+        }
+
+    def save(self, directory: Path, k1: float = K1, b: float = B) -> None:
+        """Write the postings as arrays, along with the BM25 parameters and the source names"""
+        for file, array in self.arrays().items():
+            np.save(directory / file, array)
+        with open(directory / PARAMETERS_FILE, "w", encoding="utf-8") as f:
+            json.dump({"k1": k1, "b": b, "sources": list(self.source_ids)}, f, ensure_ascii=False)
+
+
+class BM25Index:
+    """
+    Okapi BM25 inverted index over document chunks, searchable offline
+
+    Postings are searched as arrays. An index loaded from disk memory-maps them, and looks documents up by row in the
+    NumPy index it is stored with, so worker processes serving it share it through the OS page cache.
+    """
+
+    def __init__(self, documents: List[Document] | None = None, k1: float = K1, b: float = B):
+        self.k1 = k1
+        self.b = b
+        self.documents: Sequence[Document] = []
+        self._postings: BM25Postings | None = BM25Postings()
+        self._set_arrays(self._postings.arrays(), [])
+        self.add_documents(documents or [])
+
+    def _set_arrays(self, arrays: Dict[str, np.ndarray], sources: List[str]) -> None:
+        self.term_hashes = arrays[TERM_HASHES_FILE]
+        self.posting_offsets = arrays[POSTING_OFFSETS_FILE]
+        self.posting_rows = arrays[POSTING_ROWS_FILE]
+        self.posting_frequencies = arrays[POSTING_FREQUENCIES_FILE]
+        self.doc_lengths = arrays[DOC_LENGTHS_FILE]
+        self.sources = arrays[SOURCES_FILE]
+        self.source_ids = {source: i for i, source in enumerate(sources)}
+        self.average_doc_length = float(self.doc_lengths.mean()) if len(self.doc_lengths) else 0.0
+
+    def add_documents(self, documents: List[Document]) -> None:
+        """Add documents to the inverted index, indexing their title and content"""
+        if not documents:
+            return
+        if self._postings is None:
+            raise ValueError("BM25 indexes loaded from disk are read-only: index documents again to add documents")
+        self._postings.add_documents(documents)
+        self.documents = [*self.documents, *documents]
+        self._set_arrays(self._postings.arrays(), list(self._postings.source_ids))
+
+    def _postings_of(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Return the rows of the documents containing a term, with the frequency of the term in each"""
+        hashed_term = np.uint64(term_hash(term))
+        i = int(np.searchsorted(self.term_hashes, hashed_term))
+        if i == len(self.term_hashes) or self.term_hashes[i] != hashed_term:
+            return self.posting_rows[:0], self.posting_frequencies[:0]
+        start, end = self.posting_offsets[i], self.posting_offsets[i + 1]
+        return self.posting_rows[start:end], self.posting_frequencies[start:end]
+
+    def _scores(self, query: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Compute the BM25 score of every document matching at least one query term, by increasing row"""
+        matched_rows = []
+        matched_scores = []
+        for term in set(tokenize(query)):
+            rows, frequencies = self._postings_of(term)
+            if not len(rows):
+                continue
+            idf = math.log(1 + (len(self.doc_lengths) - len(rows) + 0.5) / (len(rows) + 0.5))
+            length_norm = 1 - self.b + self.b * self.doc_lengths[rows] / self.average_doc_length
+            matched_rows.append(rows)
+            matched_scores.append(idf * frequencies * (self.k1 + 1) / (frequencies + self.k1 * length_norm))
+        if not matched_rows:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        rows, inverse = np.unique(np.concatenate(matched_rows), return_inverse=True)
+        return rows, np.bincount(inverse, weights=np.concatenate(matched_scores))
+
+    def _top_k(self, rows: np.ndarray, scores: np.ndarray, k: int) -> List[Tuple[Document, float]]:
+        """Return the documents of the k best scores, best first and by row among ties"""
+        order = np.lexsort((rows, -scores))[:k]
+        return [(self.documents[int(rows[i])], float(scores[i])) for i in order]
+
+    def search(self, query: str, k: int) -> List[Tuple[Document, float]]:
+        """
+        Search the documents best matching the query terms
+
+        Args:
+            query: Search query
+            k: Number of results to return
+
+        Returns:
+            Documents with their BM25 score, best first
+        """
+        return self._top_k(*self._scores(query), k)
+
+    def search_by_sources(self, query: str, k: int, sources: List[str]) -> Dict[str, List[Tuple[Document, float]]]:
+        """
+        Search the documents best matching the query terms in each source
+
+        Args:
+            query: Search query
+            k: Number of results to return per source
+            sources: Sources to search in
+
+        Returns:
+            Documents with their BM25 score grouped by source, best first
+        """
+        rows, scores = self._scores(query)
+        row_sources = self.sources[rows]
+        results: Dict[str, List[Tuple[Document, float]]] = {}
+        for source in sources:
+            in_source = row_sources == self.source_ids.get(source, -1)
+            results[source] = self._top_k(rows[in_source], scores[in_source], k)
+        return results
+
+    def save(self, directory: Path) -> None:
+        """Write the postings as arrays, for documents stored in the same rows of the NumPy index in the directory"""
+        if self._postings is None:
+            raise ValueError("BM25 indexes loaded from disk are already saved")
+        self._postings.save(directory, self.k1, self.b)
+
+    @staticmethod
+    def exists(directory: Path) -> bool:
+        """Whether an index was saved in a directory"""
+        return (directory / PARAMETERS_FILE).exists()
+
+    @classmethod
+    def load(cls, directory: Path, documents: Sequence[Document]) -> "BM25Index":
+        """
+        Memory-map an index saved with `save`
+
+        Args:
+            directory: Directory the index was saved to
+            documents: Indexed documents, in the rows they were added in
+
+        Returns:
+            Read-only index
+        """
+        with open(directory / PARAMETERS_FILE, "r", encoding="utf-8") as f:
+            parameters = json.load(f)
+        index = cls(k1=parameters["k1"], b=parameters["b"])
+        index._postings = None
+        index._set_arrays(
+            {file: np.load(directory / file, mmap_mode="r") for file in ARRAY_FILES}, parameters["sources"]
+        )
+        if len(documents) != len(index.doc_lengths):
+            raise ValueError(f"BM25 index in {directory} has {len(index.doc_lengths)} documents, not {len(documents)}")
+        index.documents = documents
+        logger.info(f"Loaded BM25 index of {len(documents)} documents from {directory}")
+        return index
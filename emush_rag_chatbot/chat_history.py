@@ -0,0 +1,194 @@
+import asyncio
+import hashlib
+import json
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.messages import HumanMessage
+
+from emush_rag_chatbot.config import settings
+from emush_rag_chatbot.llm import LLM
+from emush_rag_chatbot.metrics import CACHE_LOOKUPS
+from emush_rag_chatbot.tokens import estimate_tokens
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SUMMARY_TEMPLATE = """Summarize the following conversation between a player of the eMush game and an assistant.
+Keep the facts, game terms and open questions needed to understand follow-up questions, in at most {max_words} words.
+Write the summary in the language of the conversation.
+
+Summary of the earlier conversation:
+{summary}
+
+New exchanges:
+{exchanges}
+"""
+
+
+def format_exchange(exchange: Dict[str, str]) -> str:
+    return f"Human: {exchange['human']}\nAssistant: {exchange['assistant']}"
+
+
+def prefix_keys(history: List[Dict[str, str]]) -> List[str]:
+    """Chained hashes identifying each prefix of a conversation: the i-th key covers the first i + 1 exchanges"""
+    keys = []
+    key = ""
+    for exchange in history:
+        payload = json.dumps([key, exchange["human"], exchange["assistant"]], ensure_ascii=False)
+        key = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+        keys.append(key)
+    return keys
+
+
+class ChatHistoryManager:
+    """
+    Bounds the chat history sent to the LLM
+
+    The last exchanges are kept verbatim within a turn and token budget, and older ones are folded into a rolling
+    summary. Summaries are cached by conversation prefix and extended incrementally in the background, one step ahead
+    of the conversation, so formatting never waits for the LLM. Until a summary catches up, the exchanges it does not
+    cover yet stay verbatim as long as they fit the token budget.
+    """
+
+    def __init__(
+        self,
+        llm: LLM,
+        max_turns: int = settings.CHAT_HISTORY_MAX_TURNS,
+        max_tokens: int = settings.CHAT_HISTORY_MAX_TOKENS,
+        summary_cache_size: int = settings.CHAT_SUMMARY_CACHE_SIZE,
+        summary_max_words: int = settings.CHAT_SUMMARY_MAX_WORDS,
+    ):
+        self.llm = llm
+        self.max_turns = max_turns
+        self.max_tokens = max_tokens
+        self.summary_cache_size = summary_cache_size
+        self.summary_max_words = summary_max_words
+        self._summaries: OrderedDict[str, str] = OrderedDict()
+        self._pending: Dict[str, asyncio.Task[str]] = {}
+
+    def _split(self, history: List[Dict[str, str]]) -> int:
+        """Return the number of older exchanges to summarize, the remaining ones fitting the verbatim budget"""
+        start = max(0, len(history) - self.max_turns)
+        tokens = sum(estimate_tokens(format_exchange(exchange)) for exchange in history[start:])
+        while start < len(history) and tokens > self.max_tokens:
+            tokens -= estimate_tokens(format_exchange(history[start]))
+            start += 1
+        return start
+
+    def _extend_verbatim(self, history: List[Dict[str, str]], covered: int, older: int) -> int:
+        """
+        Return the first exchange to send verbatim when the summary only covers the first `covered` exchanges
+
+        Exchanges the summary does not cover yet are kept verbatim, newest first, as long as all verbatim exchanges fit
+        the token budget, regardless of the turn budget.
+        """
+        tokens = sum(estimate_tokens(format_exchange(exchange)) for exchange in history[older:])
+        start = older
+        while start > covered:
+            exchange_tokens = estimate_tokens(format_exchange(history[start - 1]))
+            if tokens + exchange_tokens > self.max_tokens:
+                break
+            tokens += exchange_tokens
+            start -= 1
+        return start
+
+    def _cached_summary(self, keys: List[str]) -> Tuple[int, Optional[str]]:
+        """Find the summary covering the longest prefix of the given conversation prefixes"""
+        for covered in range(len(keys), 0, -1):
+            summary = self._summaries.get(keys[covered - 1])
+            if summary is not None:
+                self._summaries.move_to_end(keys[covered - 1])
+                return covered, summary
+        return 0, None
+
+    def _store(self, key: str, summary: str) -> None:
+        self._summaries[key] = summary
+        self._summaries.move_to_end(key)
+        while len(self._summaries) > self.summary_cache_size:
+            self._summaries.popitem(last=False)
+
+    async def summarize(self, history: List[Dict[str, str]]) -> str:
+        """
+        Summarize a conversation, extending the cached summary of its longest already summarized prefix
+
+        Args:
+            history: Exchanges to summarize
+
+        Returns:
+            Summary of the whole conversation
+        """
+        keys = prefix_keys(history)
+        covered, summary = self._cached_summary(keys)
+        if covered == len(history) and summary is not None:
+            return summary
+
+        prompt = SUMMARY_TEMPLATE.format(
+            max_words=self.summary_max_words,
+            summary=summary or "None.",
+            exchanges="\n".join(format_exchange(exchange) for exchange in history[covered:]),
+        )
+        try:
+            summary = await self.llm.invoke([HumanMessage(content=prompt)])
+        except Exception as e:
+            logger.error(f"Error summarizing chat history: {e}")
+            raise
+        self._store(keys[-1], summary)
+        return summary
+
+    def _schedule_summary(self, history: List[Dict[str, str]], key: str) -> None:
+        """Summarize a conversation prefix in the background, once"""
+        if key in self._summaries or key in self._pending:
+            return
+        try:
+            task = asyncio.get_running_loop().create_task(self.summarize(history))
+        except RuntimeError:
+            # Formatting outside of an event loop, with nothing to run the summary
+            return
+        self._pending[key] = task
+        task.add_done_callback(lambda done: self._summary_done(key, done))
+
+    def _summary_done(self, key: str, task: "asyncio.Task[str]") -> None:
+        """Forget a finished background summary, retrieving its exception so that it is not reported as unhandled"""
+        self._pending.pop(key, None)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Background summary failed, it will be retried on the next exchange: {task.exception()}")
+
+    async def wait_for_summaries(self) -> None:
+        """Wait for the summaries being computed in the background"""
+        await asyncio.gather(*self._pending.values(), return_exceptions=True)
+
+    def format(self, history: Optional[List[Dict[str, str]]] = None) -> str:
+        """
+        Format chat history for context, summarizing older exchanges
+
+        Args:
+            history: Conversation history, oldest exchange first
+
+        Returns:
+            Summary of the older exchanges followed by the last exchanges
+        """
+        if not history:
+            return "No previous conversation."
+
+        older = self._split(history)
+        keys = prefix_keys(history)
+        lines = []
+        verbatim = older
+        if older:
+            covered, summary = self._cached_summary(keys[:older])
+            CACHE_LOOKUPS.labels("chat_summary", "hit" if covered == older else "miss").inc()
+            if covered < older:
+                # The summary is late: exchanges it does not cover yet are kept verbatim within the token budget
+                verbatim = self._extend_verbatim(history, covered, older)
+                if verbatim > covered:
+                    logger.info(f"Summary of exchanges {covered + 1} to {verbatim} is late and over the token budget")
+            if summary is not None:
+                lines.append(f"Summary of the earlier conversation: {summary}")
+        if older or len(history) >= self.max_turns:
+            # The next exchange will fold the oldest verbatim one: start summarizing it now
+            target = min(older + 1, len(history))
+            self._schedule_summary(history[:target], keys[target - 1])
+        lines.extend(format_exchange(exchange) for exchange in history[verbatim:])
+        return "\n".join(lines)
@@ -1,4 +1,5 @@
 from pathlib import Path
+from typing import List, Optional
 
 from pydantic_settings import BaseSettings  # type: ignore
 
@@ -14,19 +15,93 @@ class Settings(BaseSettings):
     OPENAI_API_KEY: str = ""
 
     # Vector store settings
+    VECTOR_STORE: str = "chroma"  # "chroma" or "numpy"
     CHROMA_PERSIST_DIR: Path = BASE_DIR / "chroma_db"
+    NUMPY_INDEX_DIR: Path = BASE_DIR / "numpy_index"
+    NUMPY_INDEX_DTYPE: str = "float32"  # "float32" or "float16"
+    # Search candidates on "int8" or "binary" quantized vectors and rescore the best ones in full precision. The
+    # quantized or shortened vectors are only written at indexing time for the configured search
+    NUMPY_INDEX_QUANTIZATION: str = "none"  # "none", "int8" or "binary"
+    NUMPY_INDEX_RESCORE_CANDIDATES: int = 50  # Candidates rescored per source
+    # Search candidates on the L2-renormalized first dimensions of the vectors and rescore the best ones in full
+    # precision (text-embedding-3-* embeddings are trained to be shortened this way)
+    NUMPY_INDEX_PREFIX_SEARCH: bool = False
+    NUMPY_INDEX_PREFIX_DIMENSIONS: int = 256  # Written at indexing time
+    INDEX_MANIFEST_PATH: Path = BASE_DIR / "index_manifest.json"
+
+    # Lexical search settings
+    BM25_ENABLED: bool = True  # Write a BM25 index with the NumPy index, and fuse its results with vector results
+    HYBRID_CANDIDATES: int = 10
+    RRF_K: int = 60
+    # Skip the query embedding when BM25 is decisive (never happens when the answer cache is enabled,
+    # as it needs the query embedding)
+    BM25_FAST_PATH_ENABLED: bool = False
+    BM25_FAST_PATH_MIN_SCORE: float = 15.0
+    BM25_FAST_PATH_MIN_RATIO: float = 1.5
+
+    # Indexing settings
+    LOADER_WORKERS: int = 1  # Split documents in a process pool when greater than 1
+    LOADER_RECORDS_PER_TASK: int = 64
+    EMBEDDING_CONCURRENCY: int = 4
+    EMBEDDING_REQUESTS_PER_MINUTE: int = 3_000
+    EMBEDDING_TOKENS_PER_MINUTE: int = 1_000_000
+    EMBEDDING_BATCH_MAX_TOKENS: int = 50_000
+    EMBEDDING_BATCH_MAX_DOCUMENTS: int = 512
+    EMBEDDING_MAX_RETRIES: int = 6
+    INDEX_WRITE_BATCH_SIZE: int = 1_000
+
+    # Query embedding cache settings
+    EMBEDDING_CACHE_SIZE: int = 1024
+    EMBEDDING_CACHE_TTL_SECONDS: Optional[float] = None
+    EMBEDDING_CACHE_PATH: Optional[Path] = None
+
+    # Answer cache settings
+    ANSWER_CACHE_ENABLED: bool = True
+    ANSWER_CACHE_SIZE: int = 1024
+    ANSWER_CACHE_SIMILARITY_THRESHOLD: float = 0.95
 
     # Model settings
-    EMBEDDING_MODEL: str = "text-embedding-3-large"
+    EMBEDDING_MODEL: str = "text-embedding-3-large"  # OpenAI model, or "hashing-<dimensions>" for local CPU embeddings
     CHAT_MODEL: str = "gpt-4o-mini"
     EVALUATION_MODEL: str = "gpt-4o-mini"
     TOP_K: int = 3
+    SOURCES: List[str] = ["Twinpedia", "Mushpedia", "Aide aux Bolets", "Mush Forums"]
     TEMPERATURE: float = 0
     SEED: int = 42
     PROMPT_VERSION: str = "V7"
 
+    # Context packing settings
+    CONTEXT_MAX_TOKENS: int = 8_000  # Estimated token budget of the retrieved documents in prompts
+    CONTEXT_MIN_EXCERPT_TOKENS: int = 200  # Documents which would get a smaller excerpt are dropped
+
+    # Chat history settings
+    CHAT_HISTORY_MAX_TURNS: int = 4  # Last exchanges sent verbatim, older ones are summarized
+    CHAT_HISTORY_MAX_TOKENS: int = 1_500
+    CHAT_SUMMARY_CACHE_SIZE: int = 1024
+    CHAT_SUMMARY_MAX_WORDS: int = 150
+
+    # Warm-up settings
+    WARMUP_QUERIES: List[str] = []  # Embedded and retrieved at startup
+    WARMUP_ANSWERS: bool = False  # Also answer warm-up queries at startup, to fill the answer cache
+
+    # Batch chat settings
+    BATCH_MAX_QUERIES: int = 100
+    BATCH_CONCURRENCY: int = 8  # Concurrent LLM calls of a batch
+
+    # Conversation settings
+    CONVERSATION_CACHE_SIZE: int = 10_000
+    CONVERSATION_TTL_SECONDS: Optional[float] = 24 * 3600  # Since the last exchange
+    CONVERSATION_STORE_PATH: Optional[Path] = None  # SQLite file persisting conversations across restarts
+
+    # Web interface settings
+    CHATBOT_API_URL: str = "http://localhost:8000"
+    CHATBOT_API_CONNECT_TIMEOUT_SECONDS: float = 5.0
+    # Maximum wait between two chunks of a streamed answer, not for the whole answer
+    CHATBOT_API_READ_TIMEOUT_SECONDS: float = 120.0
+
     # Evaluation settings
     EVALUATION_DATASET: str = "test_set_v3.csv"
+    EVALUATION_CONCURRENCY: int = 4
 
     class Config:
         env_file = ".env"
@@ -0,0 +1,200 @@
+import hashlib
+import logging
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Set, Tuple
+
+from langchain_core.documents import Document
+
+from emush_rag_chatbot.bm25 import tokenize
+from emush_rag_chatbot.config import settings
+from emush_rag_chatbot.metrics import CONTEXT_TOKENS_SAVED
+from emush_rag_chatbot.tokens import CHARS_PER_TOKEN, estimate_tokens
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Standalone lines of the MediaWiki navigation scraped with wiki pages
+BOILERPLATE_LINES = {
+    "Actions", "Contents", "Create accountLog in", "Disclaimers", "Discussion", "Help", "Main page", "Namespaces",
+    "Navigation", "Navigation menu", "News", "Page", "Page information", "Permanent link", "Personal tools",
+    "Printable version", "Privacy policy", "Random page", "Read", "Recent changes", "Related changes", "Search",
+    "Special pages", "Tools", "Variants", "View history", "View source", "Views", "What links here",
+}  # fmt: skip
+BOILERPLATE_PATTERN = re.compile(
+    r"^(Jump to: navigation, search|From \w+|About \w+|This page (was last modified|has been accessed) .*)$"
+)
+# Everything after the MediaWiki footer is navigation
+FOOTER_PATTERN = re.compile(r'^Retrieved from ".*', re.MULTILINE | re.DOTALL)
+HORIZONTAL_WHITESPACE = re.compile(r"[^\S\n]+")
+BLANK_LINES = re.compile(r"\n{3,}")
+
+EXCERPT_MARKER = " [...]"
+MIN_OVERLAP_CHARS = 20
+
+
+def clean_content(content: str) -> str:
+    """Remove wiki navigation boilerplate and collapse whitespace"""
+    content = FOOTER_PATTERN.sub("", content)
+    lines = []
+    for line in HORIZONTAL_WHITESPACE.sub(" ", content).split("\n"):
+        line = line.strip()
+        if line in BOILERPLATE_LINES or BOILERPLATE_PATTERN.match(line):
+            continue
+        lines.append(line)
+    return BLANK_LINES.sub("\n\n", "\n".join(lines)).strip()
+
+
+def strip_overlap(previous: str, current: str, max_overlap: int) -> str:
+    """Remove the beginning of a chunk repeating the end of the previous chunk of the same document"""
+    for length in range(min(max_overlap, len(previous), len(current)), MIN_OVERLAP_CHARS - 1, -1):
+        if previous.endswith(current[:length]):
+            return current[length:].lstrip()
+    return current
+
+
+def excerpt(content: str, query: str, max_chars: int) -> str:
+    """
+    Keep the paragraphs sharing the most terms with the query, in their original order, within a length budget
+
+    Args:
+        content: Text to excerpt
+        query: User question
+        max_chars: Maximum length of the excerpt, marker included
+
+    Returns:
+        Excerpt ending with a marker, or an empty string if nothing fits
+    """
+    max_chars -= len(EXCERPT_MARKER)
+    paragraphs = [paragraph for paragraph in content.split("\n\n") if paragraph]
+    query_terms = set(tokenize(query))
+    ranked = sorted(range(len(paragraphs)), key=lambda i: (-len(query_terms & set(tokenize(paragraphs[i]))), i))
+
+    selected: Set[int] = set()
+    length = 0
+    for i in ranked:
+        paragraph_length = len(paragraphs[i]) + 2
+        if length + paragraph_length <= max_chars:
+            selected.add(i)
+            length += paragraph_length
+    if not selected:
+        # Even the best paragraph is too long: cut it at a word boundary
+        best = paragraphs[ranked[0]] if paragraphs else ""
+        cut = best[:max_chars].rsplit(" ", 1)[0] if max_chars > 0 else ""
+        return cut + EXCERPT_MARKER if cut else ""
+    return "\n\n".join(paragraphs[i] for i in sorted(selected)) + EXCERPT_MARKER
+
+
+@dataclass
+class PackingStats:
+    """Token counts before and after packing"""
+
+    original_tokens: int
+    packed_tokens: int
+    dropped_documents: int
+    excerpted_documents: int
+
+    @property
+    def saved_tokens(self) -> int:
+        return self.original_tokens - self.packed_tokens
+
+
+class ContextPacker:
+    """Fits retrieved documents in a token budget, keeping the best-ranked content first"""
+
+    def __init__(
+        self,
+        max_tokens: int = settings.CONTEXT_MAX_TOKENS,
+        min_excerpt_tokens: int = settings.CONTEXT_MIN_EXCERPT_TOKENS,
+        max_overlap_chars: int = 500,
+    ):
+        self.max_tokens = max_tokens
+        self.min_excerpt_tokens = min_excerpt_tokens
+        self.max_overlap_chars = max_overlap_chars
+
+    @staticmethod
+    def _priorities(docs: List[Document]) -> List[int]:
+        """Order documents by rank within their source, then by source priority, so every source keeps its best"""
+        ranks: Dict[str, int] = {}
+        keys = []
+        for i, doc in enumerate(docs):
+            source = doc.metadata.get("source", "")
+            keys.append((ranks.get(source, 0), i))
+            ranks[source] = ranks.get(source, 0) + 1
+        return [i for _, i in sorted(keys)]
+
+    def pack(self, docs: List[Document], query: str = "") -> Tuple[List[Document], PackingStats]:
+        """
+        Clean, deduplicate and trim documents to fit the token budget
+
+        Documents are taken by priority: those that fit are kept whole, the first that does not fit is excerpted
+        around the query terms, and the remaining ones are dropped. The beginning of a chunk repeating the end of the
+        previous chunk of its document is only removed when that previous chunk is already packed whole.
+
+        Args:
+            docs: Retrieved documents, ordered by source priority then rank
+            query: User question, used to pick excerpts
+
+        Returns:
+            Packed documents in their original order, and packing statistics
+        """
+        original_tokens = sum(estimate_tokens(doc.page_content) for doc in docs)
+        order = self._priorities(docs)
+        cleaned: Dict[int, str] = {}
+        seen_hashes: Set[str] = set()
+
+        # Visit chunks by priority so that duplicates keep the best-ranked copy
+        for i in order:
+            content = clean_content(docs[i].page_content)
+            content_hash = hashlib.sha256(content.encode("utf-8")).hexdigest()
+            if not content or content_hash in seen_hashes:
+                continue
+            seen_hashes.add(content_hash)
+            cleaned[i] = content
+
+        # Drop chunks contained in another kept chunk, such as a short page quoted by a longer one
+        for i, content in list(cleaned.items()):
+            if any(j != i and len(other) > len(content) and content in other for j, other in cleaned.items()):
+                del cleaned[i]
+
+        packed: Dict[int, str] = {}
+        # Whole packed chunks by document and chunk index, to strip the overlap of the next chunk of their document
+        packed_by_position: Dict[Tuple[str, int], str] = {}
+        budget = self.max_tokens
+        excerpted = 0
+        for i in (i for i in order if i in cleaned):
+            link, chunk = docs[i].metadata.get("link", ""), docs[i].metadata.get("chunk", 0)
+            content = cleaned[i]
+            previous = packed_by_position.get((link, chunk - 1))
+            if previous is not None:
+                content = strip_overlap(previous, content, self.max_overlap_chars)
+                if not content:
+                    continue
+            tokens = estimate_tokens(content)
+            if tokens <= budget:
+                packed[i] = content
+                packed_by_position[(link, chunk)] = cleaned[i]
+                budget -= tokens
+            elif budget >= self.min_excerpt_tokens:
+                content = excerpt(content, query, budget * CHARS_PER_TOKEN)
+                if content:
+                    packed[i] = content
+                    budget -= estimate_tokens(content)
+                    excerpted += 1
+
+        packed_docs = [
+            Document(page_content=packed[i], metadata=docs[i].metadata) for i in range(len(docs)) if i in packed
+        ]
+        stats = PackingStats(
+            original_tokens=original_tokens,
+            packed_tokens=sum(estimate_tokens(doc.page_content) for doc in packed_docs),
+            dropped_documents=len(docs) - len(packed_docs),
+            excerpted_documents=excerpted,
+        )
+        CONTEXT_TOKENS_SAVED.inc(stats.saved_tokens)
+        logger.info(
+            f"Packed context from {stats.original_tokens} to {stats.packed_tokens} tokens "
+            f"({stats.saved_tokens} saved, {stats.dropped_documents} documents dropped, "
+            f"{stats.excerpted_documents} excerpted)"
+        )
+        return packed_docs, stats
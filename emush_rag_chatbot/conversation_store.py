@@ -0,0 +1,163 @@
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from emush_rag_chatbot.config import settings
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class ConversationStore:
+    """
+    Stores conversation histories server-side, with LRU/TTL eviction and optional SQLite persistence
+
+    Methods block on SQLite when persistence is enabled, so async callers run them in a thread. Expired persisted
+    conversations are deleted when the store is opened, then at most once per TTL when exchanges are appended.
+    """
+
+    def __init__(
+        self,
+        max_size: int = settings.CONVERSATION_CACHE_SIZE,
+        ttl_seconds: Optional[float] = settings.CONVERSATION_TTL_SECONDS,
+        persist_path: Optional[Path] = settings.CONVERSATION_STORE_PATH,
+    ):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._conversations: OrderedDict[str, Tuple[List[Dict[str, str]], float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._next_purge = 0.0
+        self._connection = self._initialize_persistence(persist_path) if persist_path else None
+        if self._connection is not None:
+            self._purge_expired()
+
+    def _initialize_persistence(self, persist_path: Path) -> sqlite3.Connection:
+        """Open the SQLite file backing the store"""
+        persist_path.parent.mkdir(parents=True, exist_ok=True)
+        connection = sqlite3.connect(str(persist_path), check_same_thread=False)
+        connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS conversations (
+                conversation_id TEXT PRIMARY KEY,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS exchanges (
+                conversation_id TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                human TEXT NOT NULL,
+                assistant TEXT NOT NULL,
+                PRIMARY KEY (conversation_id, position)
+            );
+            CREATE INDEX IF NOT EXISTS conversations_updated_at ON conversations (updated_at);
+            """
+        )
+        connection.commit()
+        return connection
+
+    def _is_expired(self, updated_at: float) -> bool:
+        return self.ttl_seconds is not None and time.time() - updated_at > self.ttl_seconds
+
+    def _put_in_memory(self, conversation_id: str, history: List[Dict[str, str]], updated_at: float) -> None:
+        self._conversations[conversation_id] = (history, updated_at)
+        self._conversations.move_to_end(conversation_id)
+        while len(self._conversations) > self.max_size:
+            self._conversations.popitem(last=False)
+
+    def _load(self, conversation_id: str) -> Optional[Tuple[List[Dict[str, str]], float]]:
+        """Load a conversation from the persistent store, deleting it if it expired"""
+        assert self._connection is not None
+        row = self._connection.execute(
+            "SELECT updated_at FROM conversations WHERE conversation_id = ?", (conversation_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        if self._is_expired(row[0]):
+            self._delete(conversation_id)
+            return None
+        exchanges = self._connection.execute(
+            "SELECT human, assistant FROM exchanges WHERE conversation_id = ? ORDER BY position", (conversation_id,)
+        ).fetchall()
+        return [{"human": human, "assistant": assistant} for human, assistant in exchanges], row[0]
+
+    def _delete(self, conversation_id: str) -> None:
+        assert self._connection is not None
+        self._connection.execute("DELETE FROM exchanges WHERE conversation_id = ?", (conversation_id,))
+        self._connection.execute("DELETE FROM conversations WHERE conversation_id = ?", (conversation_id,))
+        self._connection.commit()
+
+    def _purge_expired(self) -> None:
+        """Delete the persisted conversations which expired, including the ones never requested again"""
+        assert self._connection is not None
+        if self.ttl_seconds is None:
+            return
+        now = time.time()
+        self._next_purge = now + self.ttl_seconds
+        expired_before = now - self.ttl_seconds
+        self._connection.execute(
+            "DELETE FROM exchanges WHERE conversation_id IN "
+            "(SELECT conversation_id FROM conversations WHERE updated_at < ?)",
+            (expired_before,),
+        )
+        deleted = self._connection.execute(
+            "DELETE FROM conversations WHERE updated_at < ?", (expired_before,)
+        ).rowcount
+        self._connection.commit()
+        if deleted:
+            logger.info(f"Deleted {deleted} expired conversations")
+
+    def get(self, conversation_id: str) -> List[Dict[str, str]]:
+        """
+        Get the history of a conversation
+
+        Args:
+            conversation_id: Conversation identifier chosen by the client
+
+        Returns:
+            Exchanges of the conversation, oldest first, or an empty list for unknown and expired conversations
+        """
+        with self._lock:
+            entry = self._conversations.get(conversation_id)
+            if entry is not None and self._is_expired(entry[1]):
+                del self._conversations[conversation_id]
+                entry = None
+            if entry is None and self._connection is not None:
+                entry = self._load(conversation_id)
+                if entry is not None:
+                    self._put_in_memory(conversation_id, *entry)
+            if entry is None:
+                return []
+            self._conversations.move_to_end(conversation_id)
+            return list(entry[0])
+
+    def append(self, conversation_id: str, human: str, assistant: str) -> None:
+        """Append an exchange to a conversation, creating it if needed"""
+        updated_at = time.time()
+        with self._lock:
+            entry = self._conversations.get(conversation_id)
+            if entry is not None and self._is_expired(entry[1]):
+                del self._conversations[conversation_id]
+                entry = None
+                if self._connection is not None:
+                    self._delete(conversation_id)
+            if entry is None and self._connection is not None:
+                entry = self._load(conversation_id)
+            history = entry[0] if entry is not None else []
+            history.append({"human": human, "assistant": assistant})
+            self._put_in_memory(conversation_id, history, updated_at)
+
+            if self._connection is not None:
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO conversations (conversation_id, updated_at) VALUES (?, ?)",
+                    (conversation_id, updated_at),
+                )
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO exchanges (conversation_id, position, human, assistant) VALUES (?, ?, ?, ?)",
+                    (conversation_id, len(history) - 1, human, assistant),
+                )
+                self._connection.commit()
+                if updated_at >= self._next_purge:
+                    self._purge_expired()
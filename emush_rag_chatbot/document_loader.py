@@ -1,14 +1,25 @@
 import json
 import logging
+import re
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Deque, Dict, Iterator, List, Tuple
 
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from pydantic import BaseModel, Field
+from langchain_core.documents import Document as LangchainDocument
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from pydantic import BaseModel, Field, ValidationError
+
+from emush_rag_chatbot.config import settings
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+READ_SIZE = 1 << 16
+# A record cut by the end of the buffer stops in a number, or in one of these literals
+TRUNCATED_NUMBER = re.compile(r"[-+.eE0-9]*")
+LITERALS = ["true", "false", "null", "NaN", "Infinity", "-Infinity"]
+
 
 class Document(BaseModel):
     """Schema for eMush game documentation"""
@@ -20,79 +31,270 @@ class Document(BaseModel):
     metadata: Dict[str, Any] = Field(default_factory=dict)
 
 
+def to_langchain_document(doc: Document) -> LangchainDocument:
+    """Convert a loaded document chunk to a Langchain document"""
+    return LangchainDocument(
+        page_content=doc.content,
+        metadata={
+            "title": doc.title,
+            "source": doc.source,
+            "link": doc.link,
+            "chunk": doc.metadata.get("chunk", 0),
+        },
+    )
+
+
+def is_truncated(error: json.JSONDecodeError) -> bool:
+    """Whether a decoding error comes from the end of the buffer cutting a record, rather than from invalid JSON"""
+    tail = error.doc[error.pos :]
+    if error.msg.startswith("Unterminated string"):
+        return True
+    if error.msg.startswith("Invalid \\uXXXX escape"):
+        return len(tail) <= 5
+    return bool(TRUNCATED_NUMBER.fullmatch(tail)) or any(literal.startswith(tail) for literal in LITERALS)
+
+
+def iter_json_records(file_path: Path, read_size: int = READ_SIZE) -> Iterator[Any]:
+    """
+    Parse the records of a JSON file incrementally, without loading the whole file
+
+    Args:
+        file_path: JSON file holding a single record, an array of records, or one record per line (`.jsonl`)
+        read_size: Number of characters read from the file at once
+
+    Yields:
+        Parsed records, in file order
+    """
+    with open(file_path, "r", encoding="utf-8") as f:
+        if file_path.suffix == ".jsonl":
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+            return
+
+        decoder = json.JSONDecoder()
+        buffer = ""
+        position = 0
+        eof = False
+        in_array = False
+        # Grows while a record spans past the buffer, so that long records are parsed a logarithmic number of times
+        retry_read_size = read_size
+
+        while True:
+            # Skip whitespace and separators between records
+            while position < len(buffer) and (buffer[position].isspace() or (in_array and buffer[position] == ",")):
+                position += 1
+            if position == len(buffer):
+                if eof:
+                    if in_array:
+                        raise json.JSONDecodeError("Unterminated array", buffer, position)
+                    return
+                buffer, position = f.read(read_size), 0
+                eof = not buffer
+                continue
+
+            if not in_array and buffer[position] == "[":
+                in_array = True
+                position += 1
+                continue
+            if in_array and buffer[position] == "]":
+                return
+
+            try:
+                record, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError as e:
+                if not is_truncated(e):
+                    raise
+                # The record spans past the buffer: read more of it
+                chunk = f.read(retry_read_size) if not eof else ""
+                if not chunk:
+                    raise
+                buffer, position = buffer[position:] + chunk, 0
+                retry_read_size *= 2
+                continue
+            retry_read_size = read_size
+            yield record
+            if not in_array:
+                return
+            buffer, position = buffer[end:], 0
+
+
+def batched_records(records: Iterator[Any], size: int) -> Iterator[Tuple[Any, ...]]:
+    """
+    Group records into batches like `itertools.batched`, but yield the records read before an error before raising it
+
+    Args:
+        records: Records to batch
+        size: Maximum number of records per batch
+
+    Yields:
+        Batches of records, in order
+    """
+    batch: List[Any] = []
+    try:
+        for record in records:
+            batch.append(record)
+            if len(batch) == size:
+                yield tuple(batch)
+                batch = []
+    except Exception:
+        if batch:
+            yield tuple(batch)
+        raise
+    if batch:
+        yield tuple(batch)
+
+
 class DocumentLoader:
     """Loads and processes eMush game documentation from JSON files"""
 
-    def __init__(self, data_dir: str = "data", chunk_size: int = 10_000, chunk_overlap: int = 100):
+    def __init__(
+        self,
+        data_dir: str = "data",
+        chunk_size: int = 10_000,
+        chunk_overlap: int = 100,
+        workers: int = settings.LOADER_WORKERS,
+        records_per_task: int = settings.LOADER_RECORDS_PER_TASK,
+    ):
         self.data_dir = Path(data_dir)
         self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.workers = workers
+        self.records_per_task = records_per_task
+        self.failed_files: List[Path] = []
         self.text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=chunk_size,
             chunk_overlap=chunk_overlap,
             length_function=len,
         )
 
-    def load_documents(self) -> List[Document]:
+    def split_record(self, record: Dict[str, Any]) -> List[Document]:
         """
-        Load JSON documents from the data directory
+        Normalize a raw record and split it into chunks of at most `chunk_size` characters
+
+        Args:
+            record: Raw document with title, link, source and content
 
         Returns:
-            List[Document]: List of parsed game documentation
+            List[Document]: Chunks of the document
         """
+        metadata = {
+            "source": record.get("source", ""),
+            "link": record.get("link", ""),
+            "title": record.get("title", ""),
+        }
+        if len(record["content"]) <= self.chunk_size:
+            return [Document(**record)]
+
+        splits = self.text_splitter.split_text(record["content"])
+        return [
+            Document(
+                **{
+                    **record,
+                    "content": split_content,
+                    "metadata": {**metadata, "chunk": i, "total_chunks": len(splits)},
+                }
+            )
+            for i, split_content in enumerate(splits)
+        ]
+
+    def split_records(self, records: Tuple[Dict[str, Any], ...]) -> List[Document]:
+        """Split records into chunks, skipping invalid records"""
+        documents = []
+        for record in records:
+            try:
+                documents.extend(self.split_record(record))
+            except (AttributeError, KeyError, TypeError, ValidationError) as e:
+                logger.error(f"Skipping invalid document {str(record)[:100]}: {e}")
+        return documents
+
+    def _iter_file_documents(self, file_path: Path, executor: Executor | None) -> Iterator[Document]:
+        """Stream chunks of a file, splitting its records in the executor when one is given"""
+        record_batches = batched_records(iter_json_records(file_path), self.records_per_task)
+        if executor is None:
+            for records in record_batches:
+                yield from self.split_records(records)
+            return
+
+        # Keep a bounded number of batches in flight and yield them in submission order, so the output is the same
+        # as in serial mode
+        pending: Deque[Future[List[Document]]] = deque()
         try:
-            json_files = list(self.data_dir.glob("*.json"))
-            if not json_files:
-                logger.warning(f"No JSON files found in {self.data_dir}")
-                return []
+            for records in record_batches:
+                pending.append(executor.submit(_split_records, records))
+                if len(pending) >= 2 * self.workers:
+                    yield from pending.popleft().result()
+        except Exception:
+            # Yield the records read before a parsing error, as in serial mode
+            while pending:
+                yield from pending.popleft().result()
+            raise
+        while pending:
+            yield from pending.popleft().result()
 
-            documents = []
-            for file_path in json_files:
-                try:
-                    with open(file_path, "r", encoding="utf-8") as f:
-                        data = json.load(f)
-                        # Handle both single document and list of documents
-                        if isinstance(data, list):
-                            for doc in data:
-                                metadata = {
-                                    "source": doc.get("source", ""),
-                                    "link": doc.get("link", ""),
-                                    "title": doc.get("title", ""),
-                                }
-                                # Split long documents
-                                if len(doc["content"]) > self.chunk_size:
-                                    splits = self.text_splitter.split_text(doc["content"])
-                                    for i, split_content in enumerate(splits):
-                                        split_doc = doc.copy()
-                                        split_doc["content"] = split_content
-                                        split_doc["metadata"] = {**metadata, "chunk": i, "total_chunks": len(splits)}
-                                        documents.append(Document(**split_doc))
-                                else:
-                                    documents.append(Document(**doc))
-                        else:
-                            metadata = {
-                                "source": data.get("source", ""),
-                                "link": data.get("link", ""),
-                                "title": data.get("title", ""),
-                            }
-                            # Split long documents
-                            if len(data["content"]) > self.chunk_size:
-                                splits = self.text_splitter.split_text(data["content"])
-                                for i, split_content in enumerate(splits):
-                                    split_doc = data.copy()
-                                    split_doc["content"] = split_content
-                                    split_doc["metadata"] = {**metadata, "chunk": i, "total_chunks": len(splits)}
-                                    documents.append(Document(**split_doc))
-                            else:
-                                documents.append(Document(**split_doc))
+    def iter_documents(self) -> Iterator[Document]:
+        """
+        Stream chunks of the JSON and JSONL documents of the data directory
+
+        Records are parsed and split a batch at a time, so memory does not grow with the size of the files. With more
+        than one worker, batches are split in a process pool. Files which could not be read to the end are recorded in
+        `failed_files`.
 
+        Yields:
+            Document: Chunks of game documentation, in file order
+        """
+        self.failed_files = []
+        files = sorted([*self.data_dir.glob("*.json"), *self.data_dir.glob("*.jsonl")])
+        if not files:
+            logger.warning(f"No JSON files found in {self.data_dir}")
+            return
+
+        executor = (
+            ProcessPoolExecutor(
+                self.workers, initializer=_initialize_worker, initargs=(self.chunk_size, self.chunk_overlap)
+            )
+            if self.workers > 1
+            else None
+        )
+        try:
+            for file_path in files:
+                chunks = 0
+                try:
+                    for document in self._iter_file_documents(file_path, executor):
+                        chunks += 1
+                        yield document
                 except json.JSONDecodeError as e:
                     logger.error(f"Error parsing JSON from {file_path}: {e}")
+                    self.failed_files.append(file_path)
                 except Exception as e:
                     logger.error(f"Error processing document {file_path}: {e}")
+                    self.failed_files.append(file_path)
+                logger.info(f"Loaded {chunks} chunks from {file_path}")
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+
+    def load_documents(self) -> List[Document]:
+        """
+        Load JSON documents from the data directory
+
+        Returns:
+            List[Document]: List of parsed game documentation
+        """
+        documents = list(self.iter_documents())
+        logger.info(f"Successfully loaded {len(documents)} documents")
+        return documents
+
+
+_worker_loader: DocumentLoader | None = None
+
+
+def _initialize_worker(chunk_size: int, chunk_overlap: int) -> None:
+    """Build the text splitter once per worker process"""
+    global _worker_loader
+    _worker_loader = DocumentLoader(chunk_size=chunk_size, chunk_overlap=chunk_overlap, workers=1)
 
-            logger.info(f"Successfully loaded {len(documents)} documents")
-            return documents
 
-        except Exception as e:
-            logger.error(f"Error loading documents: {e}")
-            return []
+def _split_records(records: Tuple[Dict[str, Any], ...]) -> List[Document]:
+    assert _worker_loader is not None
+    return _worker_loader.split_records(records)
@@ -0,0 +1,193 @@
+import logging
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.embeddings import Embeddings
+
+from emush_rag_chatbot.config import settings
+from emush_rag_chatbot.metrics import CACHE_LOOKUPS
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def normalize_query(query: str) -> str:
+    """Normalize a query so that trivially different spellings share the same cache entry"""
+    return " ".join(unicodedata.normalize("NFKC", query).casefold().split())
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Caches query embeddings in front of an embedding model, with LRU/TTL eviction and optional persistence
+
+    The persisted table is pruned when the cache is opened and on each write: expired embeddings are deleted, then the
+    oldest ones beyond `max_size`.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        model: str = settings.EMBEDDING_MODEL,
+        max_size: int = settings.EMBEDDING_CACHE_SIZE,
+        ttl_seconds: Optional[float] = settings.EMBEDDING_CACHE_TTL_SECONDS,
+        persist_path: Optional[Path] = settings.EMBEDDING_CACHE_PATH,
+    ):
+        self.embeddings = embeddings
+        self.model = model
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._cache: OrderedDict[str, Tuple[List[float], float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._connection = self._initialize_persistence(persist_path) if persist_path else None
+        if self._connection is not None:
+            with self._lock:
+                self._prune()
+                self._connection.commit()
+
+    def _initialize_persistence(self, persist_path: Path) -> sqlite3.Connection:
+        """Open the SQLite file backing the cache"""
+        persist_path.parent.mkdir(parents=True, exist_ok=True)
+        connection = sqlite3.connect(str(persist_path), check_same_thread=False)
+        connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS query_embeddings (
+                model TEXT NOT NULL,
+                query TEXT NOT NULL,
+                embedding BLOB NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (model, query)
+            );
+            CREATE INDEX IF NOT EXISTS query_embeddings_created_at ON query_embeddings (created_at);
+            """
+        )
+        connection.commit()
+        return connection
+
+    def _prune(self) -> None:
+        """Delete the persisted embeddings which expired, then the oldest ones beyond the maximum size"""
+        assert self._connection is not None
+        deleted = 0
+        if self.ttl_seconds is not None:
+            deleted += self._connection.execute(
+                "DELETE FROM query_embeddings WHERE created_at < ?", (time.time() - self.ttl_seconds,)
+            ).rowcount
+        deleted += self._connection.execute(
+            "DELETE FROM query_embeddings WHERE rowid IN "
+            "(SELECT rowid FROM query_embeddings ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_size,),
+        ).rowcount
+        if deleted:
+            logger.info(f"Deleted {deleted} persisted query embeddings")
+
+    def stats(self) -> Dict[str, float]:
+        """Return cache hit/miss counters"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._cache),
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def _is_expired(self, created_at: float) -> bool:
+        return self.ttl_seconds is not None and time.time() - created_at > self.ttl_seconds
+
+    def _get(self, key: str) -> Optional[List[float]]:
+        """Look the key up in memory, then in the persistent store"""
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None and not self._is_expired(entry[1]):
+                self._cache.move_to_end(key)
+                self.hits += 1
+                CACHE_LOOKUPS.labels("embedding", "hit").inc()
+                return entry[0]
+            if entry is not None:
+                del self._cache[key]
+
+            if self._connection is not None:
+                row = self._connection.execute(
+                    "SELECT embedding, created_at FROM query_embeddings WHERE model = ? AND query = ?",
+                    (self.model, key),
+                ).fetchone()
+                if row is not None and not self._is_expired(row[1]):
+                    embedding = array("d", row[0]).tolist()
+                    self._put_in_memory(key, embedding, row[1])
+                    self.hits += 1
+                    CACHE_LOOKUPS.labels("embedding", "hit").inc()
+                    return embedding
+
+            self.misses += 1
+            CACHE_LOOKUPS.labels("embedding", "miss").inc()
+            return None
+
+    def _put_in_memory(self, key: str, embedding: List[float], created_at: float) -> None:
+        self._cache[key] = (embedding, created_at)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+
+    def _put(self, key: str, embedding: List[float]) -> None:
+        """Store the embedding in memory and in the persistent store"""
+        created_at = time.time()
+        with self._lock:
+            self._put_in_memory(key, embedding, created_at)
+            if self._connection is not None:
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO query_embeddings (model, query, embedding, created_at) VALUES (?, ?, ?, ?)",
+                    (self.model, key, array("d", embedding).tobytes(), created_at),
+                )
+                self._prune()
+                self._connection.commit()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed documents without caching, as they are only embedded at indexing time"""
+        return self.embeddings.embed_documents(texts)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed documents without caching, as they are only embedded at indexing time"""
+        return await self.embeddings.aembed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a query, calling the underlying model only on cache misses"""
+        key = normalize_query(text)
+        embedding = self._get(key)
+        if embedding is None:
+            embedding = self.embeddings.embed_query(text)
+            self._put(key, embedding)
+        return embedding
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Embed several queries, calling the underlying model once for all cache misses"""
+        keys = [normalize_query(text) for text in texts]
+        embeddings: Dict[str, List[float]] = {}
+        for key in dict.fromkeys(keys):
+            embedding = self._get(key)
+            if embedding is not None:
+                embeddings[key] = embedding
+
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in embeddings:
+                missing.setdefault(key, text)
+        if missing:
+            for key, embedding in zip(missing, self.embeddings.embed_documents(list(missing.values()))):
+                self._put(key, embedding)
+                embeddings[key] = embedding
+        return [embeddings[key] for key in keys]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """Embed a query, calling the underlying model only on cache misses"""
+        key = normalize_query(text)
+        embedding = self._get(key)
+        if embedding is None:
+            embedding = await self.embeddings.aembed_query(text)
+            self._put(key, embedding)
+        return embedding
@@ -0,0 +1,106 @@
+import functools
+import hashlib
+import logging
+from collections import Counter
+from typing import List, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_openai import OpenAIEmbeddings
+
+from emush_rag_chatbot.bm25 import tokenize
+from emush_rag_chatbot.config import settings
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+HASHING_MODEL_PREFIX = "hashing"
+
+
+@functools.lru_cache(maxsize=1 << 18)
+def _feature_hash(feature: str) -> int:
+    """Hash a feature to 64 bits, identically across processes unlike the built-in `hash`"""
+    return int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    Local CPU embeddings hashing the words and character n-grams of texts into a fixed number of dimensions
+
+    Features are the accent-free terms used by BM25 and their character n-grams, so that spelling variants and
+    inflections still match. Each feature adds its sublinear term frequency to one dimension, with a sign also given by
+    its hash to cancel collisions out on average. No model file nor network access is needed, and texts are embedded
+    in batches with a single scatter-add into the embedding matrix.
+    """
+
+    def __init__(self, size: int = 1024, char_ngram_range: Tuple[int, int] = (3, 5)):
+        self.size = size
+        self.char_ngram_range = char_ngram_range
+
+    def _features(self, text: str) -> Counter[str]:
+        """Count the terms of a text and the character n-grams of each term"""
+        features: Counter[str] = Counter()
+        min_n, max_n = self.char_ngram_range
+        for term in tokenize(text):
+            features[term] += 1
+            padded = f"<{term}>"
+            for n in range(min_n, max_n + 1):
+                features.update(f"#{padded[i : i + n]}" for i in range(len(padded) - n + 1))
+        return features
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed texts in one batch
+
+        Args:
+            texts: Texts to embed
+
+        Returns:
+            L2-normalized embeddings, one per text
+        """
+        rows: List[int] = []
+        hashes: List[int] = []
+        counts: List[int] = []
+        for row, text in enumerate(texts):
+            for feature, count in self._features(text).items():
+                rows.append(row)
+                hashes.append(_feature_hash(feature))
+                counts.append(count)
+
+        feature_hashes = np.array(hashes, dtype=np.uint64)
+        columns = (feature_hashes % np.uint64(self.size)).astype(np.int64)
+        signs = np.where(feature_hashes >> np.uint64(63), -1.0, 1.0)
+        matrix = np.zeros((len(texts), self.size), dtype=np.float32)
+        np.add.at(matrix, (np.array(rows, dtype=np.int64), columns), signs * (1 + np.log(np.array(counts))))
+
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return (matrix / np.where(norms == 0, 1, norms)).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a query"""
+        return self.embed_documents([text])[0]
+
+
+def is_local_model(model: str = settings.EMBEDDING_MODEL) -> bool:
+    """Whether the embedding model runs locally, without network access nor API key"""
+    return model == HASHING_MODEL_PREFIX or model.startswith(f"{HASHING_MODEL_PREFIX}-")
+
+
+def create_embeddings(model: str = settings.EMBEDDING_MODEL) -> Embeddings:
+    """
+    Create an embedding model from its name
+
+    Args:
+        model: OpenAI embedding model name, or "hashing" optionally followed by a number of dimensions
+            (e.g. "hashing-1024") for local CPU embeddings
+
+    Returns:
+        Embedding model
+    """
+    if is_local_model(model):
+        size = model.removeprefix(HASHING_MODEL_PREFIX).removeprefix("-")
+        return HashingEmbeddings(size=int(size) if size else 1024)
+    return OpenAIEmbeddings(
+        model=model,
+        openai_api_key=settings.OPENAI_API_KEY,  # type: ignore[call-arg]
+    )
@@ -0,0 +1,161 @@
+import logging
+from typing import Any, Dict, List, Tuple
+
+from langchain_core.documents import Document
+
+from emush_rag_chatbot.bm25 import BM25Index
+from emush_rag_chatbot.config import settings
+from emush_rag_chatbot.vector_store import VectorStore
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def _document_key(doc: Document) -> str:
+    return f"{doc.metadata.get('link', '')}:{doc.metadata.get('chunk', '')}:{doc.page_content}"
+
+
+def reciprocal_rank_fusion(rankings: List[List[Document]], k: int, rrf_k: int = settings.RRF_K) -> List[Document]:
+    """
+    Fuse several rankings of documents with reciprocal rank fusion
+
+    Args:
+        rankings: Rankings of documents, best first
+        k: Number of documents to return
+        rrf_k: Smoothing constant dampening the weight of top ranks
+
+    Returns:
+        Documents ranked by the sum of their reciprocal ranks, best first
+    """
+    scores: Dict[str, float] = {}
+    documents: Dict[str, Document] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking):
+            key = _document_key(doc)
+            scores[key] = scores.get(key, 0.0) + 1 / (rrf_k + rank + 1)
+            documents.setdefault(key, doc)
+    return [documents[key] for key in sorted(scores, key=lambda key: scores[key], reverse=True)[:k]]
+
+
+class HybridVectorStore(VectorStore):
+    """Fuses lexical BM25 results with the results of a vector store, skipping embeddings when BM25 is decisive"""
+
+    def __init__(
+        self,
+        vector_store: VectorStore,
+        bm25_index: BM25Index,
+        candidates: int = settings.HYBRID_CANDIDATES,
+        fast_path_enabled: bool = settings.BM25_FAST_PATH_ENABLED,
+        fast_path_min_score: float = settings.BM25_FAST_PATH_MIN_SCORE,
+        fast_path_min_ratio: float = settings.BM25_FAST_PATH_MIN_RATIO,
+    ):
+        self.vector_store = vector_store
+        self.bm25_index = bm25_index
+        self.candidates = candidates
+        self.fast_path_enabled = fast_path_enabled
+        self.fast_path_min_score = fast_path_min_score
+        self.fast_path_min_ratio = fast_path_min_ratio
+        self.fast_path_hits = 0
+
+    async def add_documents(self, documents: List[Document]) -> None:
+        """Add documents to the vector store and to the BM25 index"""
+        await self.vector_store.add_documents(documents)
+        self.bm25_index.add_documents(documents)
+
+    def similarity_search(self, query: str, k: int, filter_metadata: Dict[str, Any] | None = None) -> List[Document]:
+        """Perform similarity search with optional metadata filtering on the vector store"""
+        return self.vector_store.similarity_search(query, k=k, filter_metadata=filter_metadata)
+
+    def embed_query(self, query: str) -> List[float]:
+        """Embed a query with the embedding model of the vector store"""
+        return self.vector_store.embed_query(query)
+
+    def embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """Embed several queries with the embedding model of the vector store"""
+        return self.vector_store.embed_queries(queries)
+
+    def warm_up(self) -> None:
+        """Load the index of the vector store in memory, the BM25 index being loaded at startup"""
+        self.vector_store.warm_up()
+
+    def is_decisive(self, lexical_results: Dict[str, List[Tuple[Document, float]]]) -> bool:
+        """Whether the best lexical match is strong enough, and far enough ahead of the others, to skip embeddings"""
+        scores = sorted((score for results in lexical_results.values() for _, score in results), reverse=True)
+        if not scores or scores[0] < self.fast_path_min_score:
+            return False
+        return len(scores) == 1 or scores[0] >= self.fast_path_min_ratio * scores[1]
+
+    def similarity_search_by_sources(
+        self, query: str, k: int, sources: List[str], query_embedding: List[float] | None = None
+    ) -> Dict[str, List[Document]]:
+        """
+        Perform hybrid search returning the top-k documents of each source
+
+        Args:
+            query: Search query
+            k: Number of results to return per source
+            sources: Sources to search in
+            query_embedding: Optional precomputed query embedding
+
+        Returns:
+            Relevant documents grouped by source, in the order of `sources`
+        """
+        try:
+            candidates = max(k, self.candidates)
+            lexical_results = self.bm25_index.search_by_sources(query, k=candidates, sources=sources)
+
+            if self.fast_path_enabled and query_embedding is None and self.is_decisive(lexical_results):
+                self.fast_path_hits += 1
+                logger.info("Decisive lexical match, skipping query embedding")
+                return {source: [doc for doc, _ in lexical_results[source][:k]] for source in sources}
+
+            vector_results = self.vector_store.similarity_search_by_sources(
+                query, k=candidates, sources=sources, query_embedding=query_embedding
+            )
+            return {
+                source: reciprocal_rank_fusion(
+                    [vector_results[source], [doc for doc, _ in lexical_results[source]]], k=k
+                )
+                for source in sources
+            }
+        except Exception as e:
+            logger.error(f"Error performing hybrid search by sources: {e}")
+            raise
+
+    def similarity_search_by_sources_batch(
+        self, queries: List[str], k: int, sources: List[str], query_embeddings: List[List[float]] | None = None
+    ) -> List[Dict[str, List[Document]]]:
+        """
+        Perform hybrid search returning the top-k documents of each source, for several queries
+
+        Queries are all embedded, as the embedding request is shared, so the lexical fast path is not used.
+
+        Args:
+            queries: Search queries
+            k: Number of results to return per source and query
+            sources: Sources to search in
+            query_embeddings: Optional precomputed query embeddings
+
+        Returns:
+            Relevant documents grouped by source, for each query in order
+        """
+        try:
+            candidates = max(k, self.candidates)
+            vector_results = self.vector_store.similarity_search_by_sources_batch(
+                queries, k=candidates, sources=sources, query_embeddings=query_embeddings
+            )
+            results = []
+            for query, vector_docs in zip(queries, vector_results):
+                lexical_results = self.bm25_index.search_by_sources(query, k=candidates, sources=sources)
+                results.append(
+                    {
+                        source: reciprocal_rank_fusion(
+                            [vector_docs[source], [doc for doc, _ in lexical_results[source]]], k=k
+                        )
+                        for source in sources
+                    }
+                )
+            return results
+        except Exception as e:
+            logger.error(f"Error performing batch hybrid search by sources: {e}")
+            raise
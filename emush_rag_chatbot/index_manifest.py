@@ -0,0 +1,222 @@
+import hashlib
+import json
+import logging
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, Set, Tuple
+
+from langchain_core.documents import Document
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Version of the manifest of each path, with the modification time and size of the file it was read from
+_index_versions: Dict[Path, Tuple[Tuple[int, int], str]] = {}
+
+
+def chunk_id(doc: Document) -> str:
+    """Identify a chunk by a hash of its title, link, chunk index and content"""
+    key = json.dumps(
+        [doc.metadata.get("title", ""), doc.metadata.get("link", ""), doc.metadata.get("chunk", 0), doc.page_content],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def manifest_entry(doc: Document) -> Dict[str, Any]:
+    """Describe an indexed chunk in the manifest"""
+    return {
+        "title": doc.metadata.get("title", ""),
+        "link": doc.metadata.get("link", ""),
+        "chunk": doc.metadata.get("chunk", 0),
+    }
+
+
+def summarize_changes(added: int, removed: int, removed_links: int, unchanged: int) -> str:
+    """Describe the changes brought to the index, in a log line"""
+    return (
+        f"{added} new or changed chunks, {removed} stale chunks ({removed_links} documents removed), "
+        f"{unchanged} unchanged chunks"
+    )
+
+
+@dataclass
+class IndexDiff:
+    """Chunks to embed and chunks to delete to bring the index up to date"""
+
+    added: Dict[str, Document] = field(default_factory=dict)
+    removed: Set[str] = field(default_factory=set)
+    unchanged: Set[str] = field(default_factory=set)
+    removed_links: Set[str] = field(default_factory=set)
+
+    def summary(self) -> str:
+        return summarize_changes(len(self.added), len(self.removed), len(self.removed_links), len(self.unchanged))
+
+
+class IndexManifest:
+    """Records the content hash of every indexed chunk, so re-indexing only embeds what changed"""
+
+    def __init__(
+        self,
+        chunks: Dict[str, Dict[str, Any]] | None = None,
+        embedding_model: str | None = None,
+        dimension: int | None = None,
+    ):
+        self.chunks = chunks or {}
+        self.embedding_model = embedding_model
+        self.dimension = dimension
+
+    @classmethod
+    def load(cls, path: Path) -> "IndexManifest":
+        """Load the manifest, or an empty one if the index was never built"""
+        if not path.exists():
+            return cls()
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["chunks"], data.get("embedding_model"), data.get("dimension"))
+
+    def uses_embeddings(self, embedding_model: str, dimension: int) -> bool:
+        """
+        Whether the indexed chunks were embedded with an embedding model, and can be compared with its embeddings
+
+        Manifests written before the embedding model was recorded are assumed to use it.
+
+        Args:
+            embedding_model: Name of the embedding model
+            dimension: Dimension of its embeddings
+
+        Returns:
+            False when the model or the dimension differs, in which case every chunk must be embedded again
+        """
+        return self.embedding_model in (None, embedding_model) and self.dimension in (None, dimension)
+
+    @property
+    def version(self) -> str:
+        """Hash of the identifiers of the indexed chunks, which changes whenever a chunk is added, changed or removed"""
+        return hashlib.sha256("\n".join(sorted(self.chunks)).encode("utf-8")).hexdigest()[:16]
+
+    def save(self, path: Path) -> None:
+        """Persist the manifest to a JSON file"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path.with_suffix(".tmp"), "w", encoding="utf-8") as f:
+            json.dump(
+                {"embedding_model": self.embedding_model, "dimension": self.dimension, "chunks": self.chunks},
+                f,
+                ensure_ascii=False,
+                indent=2,
+            )
+        os.replace(path.with_suffix(".tmp"), path)
+
+    def diff(self, documents: Iterable[Document], indexed_ids: Set[str] | None = None) -> IndexDiff:
+        """
+        Compare the chunks to index with the indexed ones
+
+        Args:
+            documents: Chunks to index
+            indexed_ids: Identifiers of the indexed chunks, defaults to the ones recorded in the manifest
+
+        Returns:
+            Chunks to add and to remove
+        """
+        update = IndexUpdate(self, indexed_ids)
+        added = dict(update.new_chunks(documents))
+        return IndexDiff(
+            added=added, removed=update.removed, unchanged=update.unchanged, removed_links=update.removed_links
+        )
+
+    def apply(self, diff: IndexDiff) -> None:
+        """Record the chunks added and removed by a diff"""
+        for id in diff.removed:
+            self.chunks.pop(id, None)
+        for id, doc in diff.added.items():
+            self.chunks[id] = manifest_entry(doc)
+
+
+def index_version(path: Path) -> str:
+    """
+    Return the version of the index recorded by a manifest, read again only when the manifest file changes
+
+    Args:
+        path: Path of the manifest
+
+    Returns:
+        Hash of the indexed chunk identifiers, empty if the index has no manifest
+    """
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return ""
+    file_state = (stat.st_mtime_ns, stat.st_size)
+    cached = _index_versions.get(path)
+    if cached is None or cached[0] != file_state:
+        cached = (file_state, IndexManifest.load(path).version)
+        _index_versions[path] = cached
+    return cached[1]
+
+
+class IndexUpdate:
+    """
+    Streaming comparison of the chunks to index with the indexed ones
+
+    Only chunk identifiers and manifest entries are kept in memory, so chunks can be streamed from the loader to the
+    embedding pipeline. Stale chunks are known once `new_chunks` is exhausted.
+    """
+
+    def __init__(self, manifest: IndexManifest, indexed_ids: Set[str] | None = None):
+        self.manifest = manifest
+        self.indexed_ids = set(manifest.chunks) if indexed_ids is None else indexed_ids
+        self.seen_ids: Set[str] = set()
+        self.current_links: Set[str] = set()
+        self.added: Dict[str, Dict[str, Any]] = {}
+
+    def new_chunks(self, documents: Iterable[Document]) -> Iterator[Tuple[str, Document]]:
+        """
+        Yield the chunks which are not indexed yet, skipping duplicates
+
+        Args:
+            documents: Chunks to index
+
+        Yields:
+            (identifier, chunk) pairs to embed
+        """
+        for doc in documents:
+            id = chunk_id(doc)
+            if id in self.seen_ids:
+                continue
+            self.seen_ids.add(id)
+            self.current_links.add(doc.metadata.get("link", ""))
+            if id not in self.indexed_ids:
+                self.added[id] = manifest_entry(doc)
+                yield id, doc
+
+    @property
+    def removed(self) -> Set[str]:
+        return self.indexed_ids - self.seen_ids
+
+    @property
+    def unchanged(self) -> Set[str]:
+        return self.indexed_ids & self.seen_ids
+
+    @property
+    def removed_links(self) -> Set[str]:
+        return {
+            self.manifest.chunks[id]["link"]
+            for id in self.removed
+            if id in self.manifest.chunks and self.manifest.chunks[id]["link"] not in self.current_links
+        }
+
+    def summary(self) -> str:
+        return summarize_changes(len(self.added), len(self.removed), len(self.removed_links), len(self.unchanged))
+
+    def apply(self, remove_stale: bool = True) -> None:
+        """
+        Record the chunks added and removed in the manifest
+
+        Args:
+            remove_stale: Whether to forget stale chunks, which must be kept when some chunks could not be loaded
+        """
+        if remove_stale:
+            for id in self.removed:
+                self.manifest.chunks.pop(id, None)
+        self.manifest.chunks.update(self.added)
@@ -0,0 +1,225 @@
+import asyncio
+import logging
+import random
+import time
+from dataclasses import dataclass
+from typing import Callable, Iterable, Iterator, List, Protocol, Set, Tuple
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from emush_rag_chatbot.config import settings
+from emush_rag_chatbot.tokens import estimate_tokens
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingWriter(Protocol):
+    """Store accepting precomputed embeddings"""
+
+    def add_embeddings(self, documents: List[Document], embeddings: List[List[float]], ids: List[str]) -> None:
+        """Insert documents with their embeddings"""
+        ...
+
+
+@dataclass
+class IngestionStats:
+    """Throughput of an ingestion run"""
+
+    chunks: int = 0
+    tokens: int = 0
+    requests: int = 0
+    retries: int = 0
+    elapsed_seconds: float = 0.0
+
+    @property
+    def chunks_per_second(self) -> float:
+        return self.chunks / self.elapsed_seconds if self.elapsed_seconds else 0.0
+
+    @property
+    def tokens_per_second(self) -> float:
+        return self.tokens / self.elapsed_seconds if self.elapsed_seconds else 0.0
+
+    def summary(self) -> str:
+        return (
+            f"{self.chunks} chunks ({self.tokens} tokens) embedded in {self.elapsed_seconds:.1f}s with "
+            f"{self.requests} requests and {self.retries} retries: "
+            f"{self.chunks_per_second:.1f} chunks/s, {self.tokens_per_second:.0f} tokens/s"
+        )
+
+
+def token_batches(
+    documents: Iterable[Tuple[str, Document]], max_tokens: int, max_documents: int
+) -> Iterator[List[Tuple[str, Document, int]]]:
+    """
+    Group documents into batches bounded by an estimated token count and a document count
+
+    Args:
+        documents: (identifier, document) pairs to batch
+        max_tokens: Maximum estimated number of tokens per batch
+        max_documents: Maximum number of documents per batch
+
+    Yields:
+        Batches of (identifier, document, estimated tokens)
+    """
+    batch: List[Tuple[str, Document, int]] = []
+    batch_tokens = 0
+    for id, doc in documents:
+        tokens = estimate_tokens(doc.page_content)
+        if batch and (batch_tokens + tokens > max_tokens or len(batch) >= max_documents):
+            yield batch
+            batch, batch_tokens = [], 0
+        batch.append((id, doc, tokens))
+        batch_tokens += tokens
+    if batch:
+        yield batch
+
+
+class RateLimiter:
+    """Token buckets enforcing requests-per-minute and tokens-per-minute budgets"""
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int, clock: Callable[[], float] = time.monotonic):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.clock = clock
+        self.available_requests = float(requests_per_minute)
+        self.available_tokens = float(tokens_per_minute)
+        self.updated_at = clock()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = self.clock()
+        elapsed = now - self.updated_at
+        self.updated_at = now
+        self.available_requests = min(
+            self.requests_per_minute, self.available_requests + elapsed * self.requests_per_minute / 60
+        )
+        self.available_tokens = min(
+            self.tokens_per_minute, self.available_tokens + elapsed * self.tokens_per_minute / 60
+        )
+
+    async def acquire(self, tokens: int) -> None:
+        """Wait until one request of `tokens` tokens fits in both budgets, then consume it"""
+        # A request larger than the whole budget can never fit, so it only waits for a full bucket
+        tokens = min(tokens, self.tokens_per_minute)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.available_requests >= 1 and self.available_tokens >= tokens:
+                    self.available_requests -= 1
+                    self.available_tokens -= tokens
+                    return
+                wait = max(
+                    (1 - self.available_requests) * 60 / self.requests_per_minute,
+                    (tokens - self.available_tokens) * 60 / self.tokens_per_minute,
+                )
+                await asyncio.sleep(wait)
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """Whether an error is an HTTP 429 Too Many Requests answer"""
+    return getattr(error, "status_code", None) == 429
+
+
+class EmbeddingPipeline:
+    """Embeds documents with bounded concurrency under rate limits, writing them to the store in bulk"""
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        writer: EmbeddingWriter,
+        concurrency: int = settings.EMBEDDING_CONCURRENCY,
+        requests_per_minute: int = settings.EMBEDDING_REQUESTS_PER_MINUTE,
+        tokens_per_minute: int = settings.EMBEDDING_TOKENS_PER_MINUTE,
+        max_batch_tokens: int = settings.EMBEDDING_BATCH_MAX_TOKENS,
+        max_batch_documents: int = settings.EMBEDDING_BATCH_MAX_DOCUMENTS,
+        write_batch_size: int = settings.INDEX_WRITE_BATCH_SIZE,
+        max_retries: int = settings.EMBEDDING_MAX_RETRIES,
+        initial_backoff_seconds: float = 1.0,
+    ):
+        self.embeddings = embeddings
+        self.writer = writer
+        self.concurrency = concurrency
+        self.rate_limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_documents = max_batch_documents
+        self.write_batch_size = write_batch_size
+        self.max_retries = max_retries
+        self.initial_backoff_seconds = initial_backoff_seconds
+
+    async def _embed_with_backoff(self, texts: List[str], tokens: int, stats: IngestionStats) -> List[List[float]]:
+        """Embed texts, backing off exponentially with jitter when rate limited"""
+        for attempt in range(self.max_retries + 1):
+            await self.rate_limiter.acquire(tokens)
+            stats.requests += 1
+            try:
+                return await self.embeddings.aembed_documents(texts)
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt == self.max_retries:
+                    raise
+                stats.retries += 1
+                backoff = self.initial_backoff_seconds * 2**attempt * (1 + random.random())
+                logger.warning(f"Embedding request rate limited, retrying in {backoff:.1f}s")
+                await asyncio.sleep(backoff)
+        raise RuntimeError("Unreachable")
+
+    async def run(
+        self, documents: Iterable[Tuple[str, Document]], on_progress: Callable[[int], None] | None = None
+    ) -> IngestionStats:
+        """
+        Embed documents and write them to the store
+
+        Documents are consumed lazily: at most `concurrency` batches are in flight at any time.
+
+        Args:
+            documents: (identifier, document) pairs to index
+            on_progress: Optional callback receiving the number of chunks embedded by each request
+
+        Returns:
+            Throughput statistics of the run
+        """
+        stats = IngestionStats()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        pending: List[Tuple[str, Document, List[float]]] = []
+        in_flight: Set[asyncio.Task] = set()
+        start = time.perf_counter()
+
+        def flush() -> None:
+            if pending:
+                ids, docs, vectors = zip(*pending)
+                self.writer.add_embeddings(list(docs), list(vectors), list(ids))
+                pending.clear()
+
+        async def embed_batch(batch: List[Tuple[str, Document, int]]) -> None:
+            try:
+                tokens = sum(batch_tokens for _, _, batch_tokens in batch)
+                vectors = await self._embed_with_backoff([doc.page_content for _, doc, _ in batch], tokens, stats)
+                pending.extend((id, doc, vector) for (id, doc, _), vector in zip(batch, vectors))
+                stats.chunks += len(batch)
+                stats.tokens += tokens
+                if len(pending) >= self.write_batch_size:
+                    flush()
+                if on_progress:
+                    on_progress(len(batch))
+            finally:
+                semaphore.release()
+
+        try:
+            for batch in token_batches(documents, self.max_batch_tokens, self.max_batch_documents):
+                await semaphore.acquire()
+                # Surface failures of finished batches before scheduling more work
+                for task in [task for task in in_flight if task.done()]:
+                    in_flight.discard(task)
+                    task.result()
+                in_flight.add(asyncio.create_task(embed_batch(batch)))
+            await asyncio.gather(*in_flight)
+        except BaseException:
+            for task in in_flight:
+                task.cancel()
+            raise
+        flush()
+
+        stats.elapsed_seconds = time.perf_counter() - start
+        logger.info(f"Ingestion finished: {stats.summary()}")
+        return stats
@@ -1,10 +1,13 @@
 import logging
-from typing import Any, Dict, Protocol, runtime_checkable
+import re
+import time
+from typing import Any, AsyncIterator, Dict, Protocol, runtime_checkable
 
 from langchain_core.messages import BaseMessage
 from langchain_openai import ChatOpenAI
 
 from emush_rag_chatbot.config import settings
+from emush_rag_chatbot.metrics import LLM_DURATION, LLM_TOKENS
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -18,6 +21,12 @@ class LLM(Protocol):
         """Invoke the language model with the given input"""
         ...
 
+    def astream(
+        self, input: Dict[str, Any] | list[BaseMessage], config: Dict[str, Any] | None = None
+    ) -> AsyncIterator[str]:
+        """Stream the language model response token by token"""
+        ...
+
 
 class OpenAILLM(LLM):
     """OpenAI language model implementation"""
@@ -28,17 +37,44 @@ class OpenAILLM(LLM):
             temperature=settings.TEMPERATURE,
             seed=settings.SEED,
             openai_api_key=settings.OPENAI_API_KEY,
+            stream_usage=True,
         )
 
+    def _count_tokens(self, message: BaseMessage) -> None:
+        """Count the prompt and completion tokens reported in a response"""
+        usage = getattr(message, "usage_metadata", None)
+        if usage:
+            LLM_TOKENS.labels("prompt").inc(usage["input_tokens"])
+            LLM_TOKENS.labels("completion").inc(usage["output_tokens"])
+
     async def invoke(self, input: Dict[str, Any] | list[BaseMessage], config: Dict[str, Any] | None = None) -> str:
         """Invoke the OpenAI language model"""
         try:
-            result = await self.llm.ainvoke(input)
+            with LLM_DURATION.labels("invoke").time():
+                result = await self.llm.ainvoke(input)
+            self._count_tokens(result)
             return result.content
         except Exception as e:
             logger.error(f"Error invoking OpenAI LLM: {e}")
             raise
 
+    async def astream(
+        self, input: Dict[str, Any] | list[BaseMessage], config: Dict[str, Any] | None = None
+    ) -> AsyncIterator[str]:
+        """Stream the OpenAI language model response token by token"""
+        start = time.perf_counter()
+        try:
+            async for chunk in self.llm.astream(input):
+                # Token usage is reported by the last chunk
+                self._count_tokens(chunk)
+                if chunk.content:
+                    yield str(chunk.content)
+        except Exception as e:
+            logger.error(f"Error streaming OpenAI LLM: {e}")
+            raise
+        finally:
+            LLM_DURATION.labels("stream").observe(time.perf_counter() - start)
+
 
 class FakeLLM(LLM):
     """Fake language model for testing"""
@@ -50,3 +86,11 @@ class FakeLLM(LLM):
         """Return a predefined response for testing"""
         logger.info(f"FakeLLM received input: {input}")
         return self.response
+
+    async def astream(
+        self, input: Dict[str, Any] | list[BaseMessage], config: Dict[str, Any] | None = None
+    ) -> AsyncIterator[str]:
+        """Stream the predefined response word by word for testing"""
+        logger.info(f"FakeLLM received input: {input}")
+        for token in re.findall(r"\s*\S+|\s+", self.response):
+            yield token
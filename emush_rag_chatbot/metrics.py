@@ -0,0 +1,25 @@
+from prometheus_client import Counter, Gauge, Histogram
+
+# Request metrics
+REQUESTS_IN_FLIGHT = Gauge("rag_requests_in_flight", "Chat requests being processed", ["endpoint"])
+REQUEST_DURATION = Histogram("rag_request_duration_seconds", "Duration of chat requests", ["endpoint"])
+COALESCED_CALLS = Counter(
+    "rag_coalesced_calls",
+    "Calls starting a computation (leader) or sharing one in flight (follower)",
+    ["call", "role"],
+)
+
+# Pipeline stage metrics
+QUERY_EMBEDDING_DURATION = Histogram("rag_query_embedding_duration_seconds", "Duration of query embeddings")
+RETRIEVAL_DURATION = Histogram("rag_retrieval_duration_seconds", "Duration of vector searches per source", ["source"])
+PROMPT_FORMATTING_DURATION = Histogram("rag_prompt_formatting_duration_seconds", "Duration of prompt formatting")
+LLM_DURATION = Histogram("rag_llm_duration_seconds", "Duration of LLM calls", ["method"])
+
+# Volume metrics
+RETRIEVED_DOCUMENTS = Counter("rag_retrieved_documents", "Documents retrieved as context", ["source"])
+CONTEXT_CHARACTERS = Counter("rag_context_characters", "Characters of retrieved context sent to the LLM")
+CONTEXT_TOKENS_SAVED = Counter("rag_context_tokens_saved", "Estimated context tokens removed by context packing")
+LLM_TOKENS = Counter("rag_llm_tokens", "Tokens consumed by LLM calls", ["type"])
+
+# Cache metrics
+CACHE_LOOKUPS = Counter("rag_cache_lookups", "Cache lookups by result", ["cache", "result"])
@@ -0,0 +1,626 @@
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Sequence, Tuple, overload
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from emush_rag_chatbot.bm25 import BM25Index, BM25Postings
+from emush_rag_chatbot.config import settings
+from emush_rag_chatbot.embedding_cache import CachedEmbeddings
+from emush_rag_chatbot.embeddings import create_embeddings
+from emush_rag_chatbot.metrics import QUERY_EMBEDDING_DURATION, RETRIEVAL_DURATION
+from emush_rag_chatbot.vector_store import VectorStore, embed_queries
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+EMBEDDINGS_FILE = "embeddings.npy"
+TEXTS_FILE = "texts.bin"
+METADATA_FILE = "metadata.bin"
+OFFSETS_FILE = "offsets.npy"
+PARTITIONS_FILE = "partitions.json"
+INT8_EMBEDDINGS_FILE = "embeddings_int8.npy"
+INT8_SCALES_FILE = "scales_int8.npy"
+BINARY_EMBEDDINGS_FILE = "embeddings_binary.npy"
+PREFIX_EMBEDDINGS_FILE = "embeddings_prefix.npy"
+CURRENT_INDEX_LINK = "current"  # Symbolic link to the directory of the published index version
+INDEX_VERSION_PREFIX = "index-"
+SCORING_BLOCK_ROWS = 512  # Upcast blocks small enough to stay in CPU caches
+QUANTIZATIONS = ["none", "int8", "binary"]
+# Number of set bits of every byte value, for NumPy versions without np.bitwise_count
+POPCOUNTS = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1).astype(np.uint16)
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalize vectors so that inner products are cosine similarities"""
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Return the indices of the k highest scores, best first"""
+    if k >= len(scores):
+        return np.argsort(-scores)
+    candidates = np.argpartition(-scores, k)[:k]
+    return candidates[np.argsort(-scores[candidates])]
+
+
+def quantize_int8(matrix: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Quantize rows to int8 with one scale per row
+
+    Args:
+        matrix: Vectors to quantize, one per row
+
+    Returns:
+        Quantized rows and the scales mapping them back to the original values
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    scales = np.abs(matrix).max(axis=1, initial=0) / 127
+    scales[scales == 0] = 1
+    return np.round(matrix / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+
+def quantize_binary(matrix: np.ndarray) -> np.ndarray:
+    """Quantize rows to the sign of each dimension, packed 8 dimensions per byte"""
+    return np.packbits(np.asarray(matrix) > 0, axis=1)
+
+
+def _blockwise_scores(matrix: np.ndarray, query_vectors: np.ndarray) -> np.ndarray:
+    """Multiply a matrix by query vectors, one column each, upcasting it to float32 block by block if needed"""
+    if matrix.dtype == np.float32:
+        return matrix @ query_vectors
+
+    # NumPy has no BLAS kernel for float16 and int8, so upcast the matrix block by block to bound the temporary memory
+    scores = np.empty((len(matrix), query_vectors.shape[1]), dtype=np.float32)
+    for start in range(0, len(matrix), SCORING_BLOCK_ROWS):
+        block = matrix[start : start + SCORING_BLOCK_ROWS]
+        scores[start : start + len(block)] = block.astype(np.float32) @ query_vectors
+    return scores
+
+
+def _bit_counts(values: np.ndarray) -> np.ndarray:
+    """Count the set bits of every byte"""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(values)
+    return POPCOUNTS[values]
+
+
+def _hamming_similarities(packed_matrix: np.ndarray, packed_queries: np.ndarray) -> np.ndarray:
+    """Score packed binary rows against packed binary queries by the number of matching bits"""
+    dimension = packed_matrix.shape[1] * 8
+    scores = np.empty((len(packed_queries), len(packed_matrix)), dtype=np.float32)
+    for start in range(0, len(packed_matrix), SCORING_BLOCK_ROWS):
+        block = packed_matrix[start : start + SCORING_BLOCK_ROWS]
+        for i, packed_query in enumerate(packed_queries):
+            scores[i, start : start + len(block)] = dimension - _bit_counts(block ^ packed_query).sum(axis=1)
+    return scores
+
+
+def published_index_dir(index_dir: Path) -> Path:
+    """
+    Resolve the directory holding the files of the index published in a directory
+
+    Args:
+        index_dir: Directory the index is written to
+
+    Returns:
+        Directory of the current index version, or `index_dir` itself for indexes written before versioning
+    """
+    link = index_dir / CURRENT_INDEX_LINK
+    if link.is_symlink():
+        return index_dir / os.readlink(link)
+    return index_dir
+
+
+class NumpyIndexWriter:
+    """
+    Writes a NumPy index a block of documents at a time, so that the embeddings are never all in memory
+
+    Documents must be written grouped by source, so that each source is a contiguous slice of the matrix, and their
+    number must be known in advance to preallocate the memory-mapped matrices. Every file is written to a new version
+    directory, which `close` publishes by atomically replacing the `current` symbolic link, so that readers always see
+    a complete index and processes mapping the previous version keep valid files. Quantized and shortened copies of the
+    embeddings are only written for the candidate searches they are requested for. The postings of the BM25 index are
+    written along with the documents, in the same rows.
+    """
+
+    def __init__(
+        self,
+        index_dir: Path,
+        rows: int,
+        dtype: str = settings.NUMPY_INDEX_DTYPE,
+        quantizations: Sequence[str] = (settings.NUMPY_INDEX_QUANTIZATION,),
+        prefix_search: bool = settings.NUMPY_INDEX_PREFIX_SEARCH,
+        prefix_dimensions: int = settings.NUMPY_INDEX_PREFIX_DIMENSIONS,
+        bm25: bool = settings.BM25_ENABLED,
+    ):
+        unknown_quantizations = set(quantizations) - set(QUANTIZATIONS)
+        if unknown_quantizations:
+            raise ValueError(
+                f"Unknown quantizations {sorted(unknown_quantizations)}, expected some of {QUANTIZATIONS}"
+            )
+        self.index_dir = index_dir
+        self.rows = rows
+        self.dtype = dtype
+        self.quantizations = set(quantizations)
+        self.prefix_search = prefix_search
+        self.prefix_dimensions = prefix_dimensions
+        self.row = 0
+        self.partitions: Dict[str, List[int]] = {}
+        self.matrices: Dict[str, np.memmap] = {}
+        self.bm25_postings = BM25Postings() if bm25 else None
+        # Chunk texts and metadata are concatenated in UTF-8 blobs, with the start of each document in both blobs
+        self.offsets = np.zeros((rows + 1, 2), dtype=np.int64)
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        self.version_dir = Path(tempfile.mkdtemp(prefix=INDEX_VERSION_PREFIX, dir=self.index_dir))
+        self.version_dir.chmod(0o755)
+        self.texts = open(self.version_dir / TEXTS_FILE, "wb")
+        self.metadata = open(self.version_dir / METADATA_FILE, "wb")
+
+    def _allocate(self, dimension: int) -> None:
+        """Create the memory-mapped matrices once the embedding dimension is known"""
+        shapes: Dict[str, Tuple[Any, Tuple[int, ...]]] = {EMBEDDINGS_FILE: (self.dtype, (self.rows, dimension))}
+        if "int8" in self.quantizations:
+            shapes[INT8_EMBEDDINGS_FILE] = (np.int8, (self.rows, dimension))
+            shapes[INT8_SCALES_FILE] = (np.float32, (self.rows,))
+        if "binary" in self.quantizations:
+            shapes[BINARY_EMBEDDINGS_FILE] = (np.uint8, (self.rows, (dimension + 7) // 8))
+        if self.prefix_search:
+            shapes[PREFIX_EMBEDDINGS_FILE] = (self.dtype, (self.rows, min(self.prefix_dimensions, dimension)))
+        for file, (dtype, shape) in shapes.items():
+            self.matrices[file] = np.lib.format.open_memmap(
+                self.version_dir / file, mode="w+", dtype=dtype, shape=shape
+            )
+
+    def write(self, documents: List[Document], embeddings: np.ndarray) -> None:
+        """
+        Append documents and their embeddings to the index
+
+        Args:
+            documents: Documents, following the previously written ones of their source
+            embeddings: Embeddings of the documents, one row per document
+        """
+        if not documents:
+            return
+        if self.row + len(documents) > self.rows:
+            raise ValueError(f"Writing more than the {self.rows} documents of the index")
+        matrix = normalize_rows(embeddings).astype(self.dtype)
+        if not self.matrices:
+            self._allocate(matrix.shape[1])
+
+        start, end = self.row, self.row + len(documents)
+        self.matrices[EMBEDDINGS_FILE][start:end] = matrix
+        if "int8" in self.quantizations:
+            int8_matrix, int8_scales = quantize_int8(matrix)
+            self.matrices[INT8_EMBEDDINGS_FILE][start:end] = int8_matrix
+            self.matrices[INT8_SCALES_FILE][start:end] = int8_scales
+        if "binary" in self.quantizations:
+            self.matrices[BINARY_EMBEDDINGS_FILE][start:end] = quantize_binary(matrix)
+        if self.prefix_search:
+            prefix_dimensions = self.matrices[PREFIX_EMBEDDINGS_FILE].shape[1]
+            self.matrices[PREFIX_EMBEDDINGS_FILE][start:end] = normalize_rows(matrix[:, :prefix_dimensions])
+
+        for row, doc in enumerate(documents, start=start):
+            source = doc.metadata.get("source", "")
+            partition = self.partitions.setdefault(source, [row, row])
+            if partition[1] != row:
+                raise ValueError(f"Documents of source {source} are not written together")
+            partition[1] = row + 1
+
+            text = doc.page_content.encode("utf-8")
+            metadata = json.dumps(doc.metadata, ensure_ascii=False).encode("utf-8")
+            self.texts.write(text)
+            self.metadata.write(metadata)
+            self.offsets[row + 1] = self.offsets[row] + (len(text), len(metadata))
+        if self.bm25_postings is not None:
+            self.bm25_postings.add_documents(documents)
+        self.row = end
+
+    def close(self) -> None:
+        """Flush every file of the index, then publish it in place of the previous version"""
+        if self.row != self.rows:
+            raise ValueError(f"Only {self.row} of the {self.rows} documents of the index were written")
+        if not self.matrices:
+            self._allocate(0)
+        for matrix in self.matrices.values():
+            matrix.flush()
+        self.matrices.clear()
+        self.texts.close()
+        self.metadata.close()
+        np.save(self.version_dir / OFFSETS_FILE, self.offsets)
+        with open(self.version_dir / PARTITIONS_FILE, "w", encoding="utf-8") as f:
+            json.dump(self.partitions, f, ensure_ascii=False)
+        if self.bm25_postings is not None:
+            self.bm25_postings.save(self.version_dir)
+        self._publish()
+        logger.info(f"Wrote NumPy index of {self.rows} documents to {self.version_dir}")
+
+    def _publish(self) -> None:
+        """
+        Point the `current` link to the new version with a single rename, then delete older versions
+
+        The previous version is kept for processes that resolved the link just before the swap and are still loading
+        it. Older ones, and versions left by interrupted writers, are deleted: processes mapping their files keep them
+        until they unmap them.
+        """
+        link = self.index_dir / CURRENT_INDEX_LINK
+        previous = os.readlink(link) if link.is_symlink() else None
+        temporary_link = self.index_dir / f"{CURRENT_INDEX_LINK}.tmp"
+        temporary_link.unlink(missing_ok=True)
+        os.symlink(self.version_dir.name, temporary_link)
+        os.replace(temporary_link, link)
+        for version_dir in self.index_dir.glob(f"{INDEX_VERSION_PREFIX}*"):
+            if version_dir.name not in (self.version_dir.name, previous):
+                shutil.rmtree(version_dir, ignore_errors=True)
+
+
+def write_numpy_index(
+    index_dir: Path,
+    documents: List[Document],
+    embeddings: np.ndarray,
+    dtype: str = settings.NUMPY_INDEX_DTYPE,
+    quantizations: Sequence[str] = (settings.NUMPY_INDEX_QUANTIZATION,),
+    prefix_search: bool = settings.NUMPY_INDEX_PREFIX_SEARCH,
+    prefix_dimensions: int = settings.NUMPY_INDEX_PREFIX_DIMENSIONS,
+    bm25: bool = settings.BM25_ENABLED,
+) -> None:
+    """
+    Write documents and their embeddings as a NumPy index, partitioned by source
+
+    Args:
+        index_dir: Directory to write the index to
+        documents: Indexed documents
+        embeddings: Embeddings of the documents, one row per document
+        dtype: Storage type of the embeddings (float32 or float16)
+        quantizations: Quantizations ("int8", "binary") to write a quantized copy of the embeddings for
+        prefix_search: Whether to write the L2-renormalized first dimensions of the embeddings (as shortened
+            `text-embedding-3-*` embeddings are)
+        prefix_dimensions: Number of leading dimensions kept in the shortened embeddings
+        bm25: Whether to write the postings of a BM25 index over the documents
+    """
+    # Sort rows by source so that each source is a contiguous slice of the matrix
+    order = sorted(range(len(documents)), key=lambda i: documents[i].metadata.get("source", ""))
+    writer = NumpyIndexWriter(
+        index_dir,
+        len(documents),
+        dtype=dtype,
+        quantizations=quantizations,
+        prefix_search=prefix_search,
+        prefix_dimensions=prefix_dimensions,
+        bm25=bm25,
+    )
+    writer.write([documents[i] for i in order], np.asarray(embeddings)[order] if order else np.zeros((0, 0)))
+    writer.close()
+
+
+def _map_bytes(path: Path) -> np.ndarray:
+    """Memory-map a file as bytes, empty files being impossible to map"""
+    if path.stat().st_size == 0:
+        return np.zeros(0, dtype=np.uint8)
+    return np.memmap(path, dtype=np.uint8, mode="r")
+
+
+class MappedDocuments(Sequence[Document]):
+    """
+    Indexed documents decoded on access from memory-mapped blobs
+
+    Only the documents returned by searches are materialized, and the blobs are read through the OS page cache, so
+    worker processes serving the same index share its memory instead of each holding a copy.
+    """
+
+    def __init__(self, index_dir: Path) -> None:
+        self.offsets = np.load(index_dir / OFFSETS_FILE, mmap_mode="r")
+        self.texts = _map_bytes(index_dir / TEXTS_FILE)
+        self.metadata = _map_bytes(index_dir / METADATA_FILE)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    @overload
+    def __getitem__(self, index: int) -> Document: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> List[Document]: ...
+
+    def __getitem__(self, index: int | slice) -> Document | List[Document]:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(f"Document index {index} out of range")
+        (text_start, metadata_start), (text_end, metadata_end) = self.offsets[index], self.offsets[index + 1]
+        return Document(
+            page_content=self.texts[text_start:text_end].tobytes().decode("utf-8"),
+            metadata=json.loads(self.metadata[metadata_start:metadata_end].tobytes()),
+        )
+
+    def __iter__(self) -> Iterator[Document]:
+        return (self[i] for i in range(len(self)))
+
+
+def load_bm25_index(index_dir: Path) -> BM25Index | None:
+    """
+    Memory-map the BM25 index written with the published NumPy index, searching the documents of its rows
+
+    Args:
+        index_dir: Directory the NumPy index is written to
+
+    Returns:
+        Read-only BM25 index, or None if the NumPy index was written without one
+    """
+    version_dir = published_index_dir(index_dir)
+    if not BM25Index.exists(version_dir):
+        return None
+    return BM25Index.load(version_dir, MappedDocuments(version_dir))
+
+
+class NumpyVectorStore(VectorStore):
+    """
+    In-memory similarity search over a contiguous embedding matrix partitioned by source
+
+    Searches are exact by default. With int8 or binary quantization, or with prefix search, candidates are searched
+    on the quantized or shortened copy of the matrix and only the best candidates of each source are rescored with
+    their full-precision vectors, which stay memory-mapped on disk.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings | None = None,
+        index_dir: Path | None = None,
+        dtype: str = settings.NUMPY_INDEX_DTYPE,
+        quantization: str = settings.NUMPY_INDEX_QUANTIZATION,
+        rescore_candidates: int = settings.NUMPY_INDEX_RESCORE_CANDIDATES,
+        prefix_search: bool = settings.NUMPY_INDEX_PREFIX_SEARCH,
+    ):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown quantization {quantization}, expected one of {QUANTIZATIONS}")
+        if prefix_search and quantization != "none":
+            raise ValueError("Prefix search and quantization cannot be combined")
+        self.embeddings = embeddings or CachedEmbeddings(create_embeddings())
+        self.index_dir = index_dir or settings.NUMPY_INDEX_DIR
+        self.dtype = dtype
+        self.quantization = quantization
+        self.rescore_candidates = rescore_candidates
+        self.prefix_search = prefix_search
+        self._load()
+
+    def _load(self) -> None:
+        """Load every file from the published index version, resolved once so that they all belong to it"""
+        version_dir = published_index_dir(self.index_dir)
+        self.matrix, self.documents, self.partitions = self._load_index(version_dir)
+        self.candidate_matrix, self.int8_scales = self._load_candidate_matrix(version_dir)
+
+    def _load_index(self, version_dir: Path) -> Tuple[np.ndarray, Sequence[Document], Dict[str, Tuple[int, int]]]:
+        """Memory-map the index from disk, or start from an empty index"""
+        if not (version_dir / PARTITIONS_FILE).exists():
+            logger.warning(f"No NumPy index found in {self.index_dir}")
+            return np.zeros((0, 0), dtype=self.dtype), [], {}
+
+        matrix = np.load(version_dir / EMBEDDINGS_FILE, mmap_mode="r")
+        documents = MappedDocuments(version_dir)
+        with open(version_dir / PARTITIONS_FILE, "r", encoding="utf-8") as f:
+            partitions = {source: (start, end) for source, (start, end) in json.load(f).items()}
+        logger.info(f"Loaded NumPy index of {len(documents)} documents from {version_dir}")
+        return matrix, documents, partitions
+
+    def _load_candidate_matrix(self, version_dir: Path) -> Tuple[np.ndarray | None, np.ndarray | None]:
+        """Memory-map the quantized or shortened copy of the matrix searched for candidates, if any"""
+        if not self.documents or (self.quantization == "none" and not self.prefix_search):
+            return None, None
+        if self.prefix_search:
+            files = [PREFIX_EMBEDDINGS_FILE]
+        elif self.quantization == "int8":
+            files = [INT8_EMBEDDINGS_FILE, INT8_SCALES_FILE]
+        else:
+            files = [BINARY_EMBEDDINGS_FILE]
+        missing_files = [file for file in files if not (version_dir / file).exists()]
+        if missing_files:
+            raise ValueError(
+                f"NumPy index in {self.index_dir} has no {', '.join(missing_files)}: index documents again with the "
+                "same NUMPY_INDEX_QUANTIZATION and NUMPY_INDEX_PREFIX_SEARCH settings as the API"
+            )
+        matrices = [np.load(version_dir / file, mmap_mode="r") for file in files]
+        return matrices[0], matrices[1] if len(matrices) > 1 else None
+
+    async def add_documents(self, documents: List[Document]) -> None:
+        """
+        Embed documents, add them to the index and persist it
+
+        Args:
+            documents: List of documents to index
+        """
+        try:
+            vectors = np.asarray(
+                await self.embeddings.aembed_documents([doc.page_content for doc in documents]), dtype=np.float32
+            )
+            all_vectors = np.vstack([self.matrix, vectors]) if len(self.documents) else vectors
+            write_numpy_index(
+                self.index_dir,
+                [*self.documents, *documents],
+                all_vectors,
+                dtype=self.dtype,
+                quantizations=[self.quantization],
+                prefix_search=self.prefix_search,
+            )
+            self._load()
+            logger.info(f"Successfully indexed {len(documents)} documents")
+        except Exception as e:
+            logger.error(f"Error indexing documents: {e}")
+            raise
+
+    def embed_query(self, query: str) -> List[float]:
+        """Embed a query with the embedding model of the store"""
+        with QUERY_EMBEDDING_DURATION.time():
+            return self.embeddings.embed_query(query)
+
+    def embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """Embed several queries in a single request to the embedding model"""
+        return embed_queries(self.embeddings, queries)
+
+    def warm_up(self) -> None:
+        """Read the whole searched matrix once, so that its pages are in memory before the first search"""
+        if self.documents:
+            self._candidate_scores(np.zeros((1, self.matrix.shape[1]), dtype=np.float32))
+            logger.info(f"Loaded NumPy index of {len(self.documents)} documents in memory")
+
+    def _candidate_scores(self, query_vectors: np.ndarray) -> np.ndarray:
+        """
+        Score normalized query vectors against every indexed document in one matrix product
+
+        Scores are cosine similarities for exact searches, and approximations only good for ranking candidates
+        otherwise.
+
+        Args:
+            query_vectors: L2-normalized query vectors, one per row
+
+        Returns:
+            Scores of every document, one row per query
+        """
+        if self.prefix_search:
+            assert self.candidate_matrix is not None
+            prefix_vectors = normalize_rows(query_vectors[:, : self.candidate_matrix.shape[1]])
+            return _blockwise_scores(self.candidate_matrix, prefix_vectors.T).T
+        if self.quantization == "int8":
+            assert self.candidate_matrix is not None and self.int8_scales is not None
+            return (_blockwise_scores(self.candidate_matrix, query_vectors.T) * self.int8_scales[:, None]).T
+        if self.quantization == "binary":
+            assert self.candidate_matrix is not None
+            return _hamming_similarities(self.candidate_matrix, quantize_binary(query_vectors))
+        return _blockwise_scores(self.matrix, query_vectors.T).T
+
+    def _top_rows(self, scores: np.ndarray, rows: np.ndarray, query_vector: np.ndarray, k: int) -> np.ndarray:
+        """
+        Select the k best rows, rescoring the best approximate candidates with their full-precision vectors
+
+        Args:
+            scores: Candidate scores of the rows
+            rows: Matrix rows to select from
+            query_vector: L2-normalized query vector
+            k: Number of rows to select
+
+        Returns:
+            Selected rows, best first
+        """
+        if self.candidate_matrix is None:
+            return rows[top_k_indices(scores, k)]
+        # Candidates are sorted so that only their rows of the full-precision matrix are read from disk, in order
+        candidates = np.sort(rows[top_k_indices(scores, max(k, self.rescore_candidates))])
+        exact_scores = self.matrix[candidates].astype(np.float32) @ query_vector
+        return candidates[top_k_indices(exact_scores, k)]
+
+    def _search_by_sources(
+        self, query_embeddings: List[List[float]], k: int, sources: List[str]
+    ) -> List[Dict[str, List[Document]]]:
+        """
+        Select the top-k documents of each source partition for each query
+
+        Every source is scored in the same matrix product, whose duration is split evenly between the sources in the
+        retrieval duration of each source, so that per-source durations still add up to the time spent searching.
+        """
+        start_time = time.perf_counter()
+        query_vectors = normalize_rows(np.asarray(query_embeddings))
+        all_scores = self._candidate_scores(query_vectors)
+        scoring_duration = (time.perf_counter() - start_time) / max(len(sources), 1)
+        results: List[Dict[str, List[Document]]] = [{} for _ in query_embeddings]
+        for source in sources:
+            start_time = time.perf_counter()
+            start, end = self.partitions.get(source, (0, 0))
+            for result, query_vector, scores in zip(results, query_vectors, all_scores):
+                rows = self._top_rows(scores[start:end], np.arange(start, end), query_vector, k)
+                result[source] = [self.documents[int(row)] for row in rows]
+            RETRIEVAL_DURATION.labels(source).observe(scoring_duration + time.perf_counter() - start_time)
+        return results
+
+    def similarity_search(self, query: str, k: int, filter_metadata: Dict[str, Any] | None = None) -> List[Document]:
+        """
+        Perform similarity search with optional metadata filtering
+
+        Args:
+            query: Search query
+            k: Number of results to return
+            filter_metadata: Optional metadata filters
+
+        Returns:
+            List of relevant documents
+        """
+        try:
+            if not self.documents:
+                return []
+            query_vector = normalize_rows(np.asarray(self.embed_query(query)))
+            scores = self._candidate_scores(query_vector)[0]
+            rows = np.arange(len(self.documents))
+            if filter_metadata:
+                rows = np.array(
+                    [
+                        row
+                        for row, doc in enumerate(self.documents)
+                        if all(doc.metadata.get(key) == value for key, value in filter_metadata.items())
+                    ],
+                    dtype=np.int64,
+                )
+            return [self.documents[int(row)] for row in self._top_rows(scores[rows], rows, query_vector[0], k)]
+        except Exception as e:
+            logger.error(f"Error performing similarity search: {e}")
+            raise
+
+    def similarity_search_by_sources(
+        self, query: str, k: int, sources: List[str], query_embedding: List[float] | None = None
+    ) -> Dict[str, List[Document]]:
+        """
+        Perform similarity search returning the top-k documents of each source
+
+        The query is scored against the whole matrix at once, then the top-k of each source partition is selected.
+
+        Args:
+            query: Search query
+            k: Number of results to return per source
+            sources: Sources to search in
+            query_embedding: Optional precomputed query embedding
+
+        Returns:
+            Relevant documents grouped by source, in the order of `sources`
+        """
+        try:
+            if not self.documents:
+                return {source: [] for source in sources}
+            embedding = query_embedding if query_embedding is not None else self.embed_query(query)
+            return self._search_by_sources([embedding], k, sources)[0]
+        except Exception as e:
+            logger.error(f"Error performing similarity search by sources: {e}")
+            raise
+
+    def similarity_search_by_sources_batch(
+        self, queries: List[str], k: int, sources: List[str], query_embeddings: List[List[float]] | None = None
+    ) -> List[Dict[str, List[Document]]]:
+        """
+        Perform similarity search returning the top-k documents of each source, for several queries
+
+        Every query is scored against the whole matrix in a single matrix product.
+
+        Args:
+            queries: Search queries
+            k: Number of results to return per source and query
+            sources: Sources to search in
+            query_embeddings: Optional precomputed query embeddings
+
+        Returns:
+            Relevant documents grouped by source, for each query in order
+        """
+        try:
+            if not self.documents or not queries:
+                return [{source: [] for source in sources} for _ in queries]
+            embeddings = query_embeddings if query_embeddings is not None else self.embed_queries(queries)
+            return self._search_by_sources(embeddings, k, sources)
+        except Exception as e:
+            logger.error(f"Error performing batch similarity search by sources: {e}")
+            raise
@@ -1,13 +1,26 @@
+import asyncio
 import logging
-from typing import Dict, List, Optional, Tuple
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
 from langchain_core.documents import Document
+from langchain_core.messages import BaseMessage
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
 
+from emush_rag_chatbot.answer_cache import SemanticAnswerCache, answer_cache_version
+from emush_rag_chatbot.chat_history import ChatHistoryManager
 from emush_rag_chatbot.config import settings
+from emush_rag_chatbot.context_packer import ContextPacker
+from emush_rag_chatbot.embedding_cache import normalize_query
 from emush_rag_chatbot.llm import LLM
+from emush_rag_chatbot.metrics import (
+    CACHE_LOOKUPS,
+    CONTEXT_CHARACTERS,
+    PROMPT_FORMATTING_DURATION,
+    RETRIEVED_DOCUMENTS,
+)
 from emush_rag_chatbot.prompts import PROMPTS
+from emush_rag_chatbot.single_flight import SingleFlight
 from emush_rag_chatbot.vector_store import VectorStore
 
 logging.basicConfig(level=logging.INFO)
@@ -25,9 +38,20 @@ Previous conversation:
 class RAGChain:
     """Implements the RAG pipeline for question answering"""
 
-    def __init__(self, vector_store: VectorStore, llm: LLM):
+    def __init__(
+        self,
+        vector_store: VectorStore,
+        llm: LLM,
+        answer_cache: Optional[SemanticAnswerCache] = None,
+        context_packer: Optional[ContextPacker] = None,
+        chat_history_manager: Optional[ChatHistoryManager] = None,
+    ):
         self.vector_store = vector_store
         self.llm = llm
+        self.answer_cache = answer_cache
+        self.context_packer = context_packer or ContextPacker()
+        self.chat_history_manager = chat_history_manager or ChatHistoryManager(llm)
+        self._responses_in_flight: SingleFlight[Tuple[str, List[Document]]] = SingleFlight("generate_response")
         self.prompt = ChatPromptTemplate.from_messages(
             [
                 ("system", SYSTEM_TEMPLATE),
@@ -36,13 +60,12 @@ class RAGChain:
         )
 
     def _format_chat_history(self, history: Optional[List[Dict[str, str]]] = None) -> str:
-        """Format chat history for context"""
-        if not history:
-            return "No previous conversation."
-        return "\n".join([f"Human: {exchange['human']}\nAssistant: {exchange['assistant']}" for exchange in history])
+        """Format chat history for context, summarizing older exchanges"""
+        return self.chat_history_manager.format(history)
 
-    def _format_docs(self, docs: List[Document]) -> str:
-        """Format retrieved documents for context"""
+    def _format_docs(self, docs: List[Document], query: str = "") -> str:
+        """Format retrieved documents for context, packed within the context token budget"""
+        docs, _ = self.context_packer.pack(docs, query)
         return "\n\n".join(
             [
                 f"Source ({doc.metadata.get('source', 'Unknown')}, {doc.metadata.get('link', '#')}): {doc.page_content}"
@@ -50,6 +73,39 @@ class RAGChain:
             ]
         )
 
+    def _retrieve(self, query: str, query_embedding: Optional[List[float]] = None) -> List[Document]:
+        """Retrieve relevant documents, embedding the query once for all sources"""
+        docs_by_source = self.vector_store.similarity_search_by_sources(
+            query, k=settings.TOP_K, sources=settings.SOURCES, query_embedding=query_embedding
+        )
+        return self._merge_sources(docs_by_source)
+
+    def _merge_sources(self, docs_by_source: Dict[str, List[Document]]) -> List[Document]:
+        """List retrieved documents in the configured source priority"""
+        for source in settings.SOURCES:
+            RETRIEVED_DOCUMENTS.labels(source).inc(len(docs_by_source[source]))
+        docs = [doc for source in settings.SOURCES for doc in docs_by_source[source]]
+        logger.info(f"Retrieved {len(docs)} relevant documents")
+        return docs
+
+    def _build_prompt(
+        self, query: str, chat_history: Optional[List[Dict[str, str]]], docs: List[Document]
+    ) -> List[BaseMessage]:
+        """Format the prompt from the query, the chat history and the retrieved documents"""
+        with PROMPT_FORMATTING_DURATION.time():
+            formatted_history = self._format_chat_history(chat_history)
+            formatted_docs = self._format_docs(docs, query)
+            CONTEXT_CHARACTERS.inc(len(formatted_docs))
+            return self.prompt.format_messages(context=formatted_docs, question=query, chat_history=formatted_history)
+
+    def _lookup_answer(
+        self, answer_cache: SemanticAnswerCache, query_embedding: List[float]
+    ) -> Optional[Tuple[str, List[Document]]]:
+        """Look a previously generated answer up in the answer cache"""
+        cached_answer = answer_cache.lookup(query_embedding, version=answer_cache_version())
+        CACHE_LOOKUPS.labels("answer", "miss" if cached_answer is None else "hit").inc()
+        return cached_answer
+
     async def generate_response(
         self,
         query: str,
@@ -58,46 +114,196 @@ class RAGChain:
         """
         Generate a response using the RAG pipeline
 
+        Concurrent calls with the same query and no chat history share a single pipeline run.
+
         Args:
             query: User question
             chat_history: Optional conversation history
-            filter_metadata: Optional metadata filters
 
         Returns:
             Generated response with source citations
         """
+        if chat_history:
+            return await self._generate_response(query, chat_history)
+        response, docs = await self._responses_in_flight.do(
+            normalize_query(query), lambda: self._generate_response(query)
+        )
+        return response, list(docs)
+
+    async def _generate_response(
+        self,
+        query: str,
+        chat_history: Optional[List[Dict[str, str]]] = None,
+    ) -> Tuple[str, List[Document]]:
+        """Run the RAG pipeline for a query"""
         try:
-            # Retrieve relevant documents
-            twinpedia_docs = self.vector_store.similarity_search(
-                query, k=settings.TOP_K, filter_metadata={"source": "Twinpedia"}
-            )
-            mushpedia_docs = self.vector_store.similarity_search(
-                query, k=settings.TOP_K, filter_metadata={"source": "Mushpedia"}
-            )
-            aide_aux_bolets_docs = self.vector_store.similarity_search(
-                query, k=settings.TOP_K, filter_metadata={"source": "Aide aux Bolets"}
-            )
-            mush_forums_docs = self.vector_store.similarity_search(
-                query, k=settings.TOP_K, filter_metadata={"source": "Mush Forums"}
-            )
+            # Answers only depend on the query when there is no chat history, so they can be reused
+            answer_cache = self.answer_cache if not chat_history else None
+            query_embedding = None
+            if answer_cache is not None:
+                query_embedding = await asyncio.to_thread(self.vector_store.embed_query, query)
+                cached_answer = self._lookup_answer(answer_cache, query_embedding)
+                if cached_answer is not None:
+                    logger.info("Answer cache hit, skipping retrieval and generation")
+                    return cached_answer
 
-            docs = twinpedia_docs + mushpedia_docs + aide_aux_bolets_docs + mush_forums_docs
+            # Embedding and vector search are blocking, so they run in a worker thread
+            docs = await asyncio.to_thread(self._retrieve, query, query_embedding)
+            prompt = self._build_prompt(query, chat_history, docs)
 
-            # Format inputs
-            formatted_history = self._format_chat_history(chat_history)
-            formatted_docs = self._format_docs(docs)
+            # Generate response directly using LLM
+            response = await self.llm.invoke(prompt)
+
+            if answer_cache is not None and query_embedding is not None:
+                answer_cache.store(query_embedding, version=answer_cache_version(), response=response, sources=docs)
+
+            return response, docs
+        except Exception as e:
+            logger.error(f"Error generating response: {e}")
+            raise
+
+    async def generate_responses(
+        self, queries: List[str], concurrency: int = settings.BATCH_CONCURRENCY
+    ) -> List[Tuple[str, List[Document]] | Exception]:
+        """
+        Generate responses to several queries without chat history
 
-            logger.info(f"Retrieved {len(docs)} relevant documents")
+        Queries are embedded in a single request and retrieved in a single pass over the index, then answers are
+        generated with bounded concurrency. Identical queries are answered once.
 
-            # Format prompt
-            prompt = self.prompt.format_messages(
-                context=formatted_docs, question=query, chat_history=formatted_history
+        Args:
+            queries: User questions
+            concurrency: Maximum number of concurrent LLM calls
+
+        Returns:
+            Generated response with source citations for each query in order, or the exception raised for it
+        """
+        unique_queries: Dict[str, str] = {}
+        for query in queries:
+            unique_queries.setdefault(normalize_query(query), query)
+        keys = list(unique_queries)
+        results: Dict[str, Tuple[str, List[Document]] | Exception] = {}
+
+        try:
+            query_embeddings = await asyncio.to_thread(self.vector_store.embed_queries, list(unique_queries.values()))
+            if self.answer_cache is not None:
+                for key, query_embedding in zip(keys, query_embeddings):
+                    cached_answer = self._lookup_answer(self.answer_cache, query_embedding)
+                    if cached_answer is not None:
+                        results[key] = cached_answer
+
+            pending = [i for i, key in enumerate(keys) if key not in results]
+            docs_by_source_batch = await asyncio.to_thread(
+                self.vector_store.similarity_search_by_sources_batch,
+                [unique_queries[keys[i]] for i in pending],
+                k=settings.TOP_K,
+                sources=settings.SOURCES,
+                query_embeddings=[query_embeddings[i] for i in pending],
             )
+        except Exception as e:
+            logger.error(f"Error retrieving documents for {len(keys)} queries: {e}")
+            return [e for _ in queries]
 
-            # Generate response directly using LLM
-            response = await self.llm.invoke(prompt)
+        semaphore = asyncio.Semaphore(concurrency)
 
+        async def answer(i: int, docs_by_source: Dict[str, List[Document]]) -> Tuple[str, List[Document]]:
+            query = unique_queries[keys[i]]
+            docs = self._merge_sources(docs_by_source)
+            async with semaphore:
+                response = await self.llm.invoke(self._build_prompt(query, None, docs))
+            if self.answer_cache is not None:
+                self.answer_cache.store(
+                    query_embeddings[i], version=answer_cache_version(), response=response, sources=docs
+                )
             return response, docs
+
+        outcomes = await asyncio.gather(
+            *(answer(i, docs_by_source) for i, docs_by_source in zip(pending, docs_by_source_batch)),
+            return_exceptions=True,
+        )
+        for i, outcome in zip(pending, outcomes):
+            if isinstance(outcome, Exception):
+                logger.error(f"Error generating response to {unique_queries[keys[i]]!r}: {outcome}")
+            elif isinstance(outcome, BaseException):
+                raise outcome
+            results[keys[i]] = outcome
+
+        return [
+            result if isinstance(result, Exception) else (result[0], list(result[1]))
+            for result in (results[normalize_query(query)] for query in queries)
+        ]
+
+    async def warm_up(self, queries: List[str], answer: bool = False) -> None:
+        """
+        Load the index in memory, then run warm-up queries through the pipeline
+
+        Args:
+            queries: Queries to embed and retrieve documents for, filling the query embedding cache
+            answer: Also answer the queries, filling the answer cache
+        """
+        await asyncio.to_thread(self.vector_store.warm_up)
+        if not queries:
+            return
+        try:
+            if answer:
+                results = await self.generate_responses(queries)
+                errors = [result for result in results if isinstance(result, Exception)]
+                if errors:
+                    raise errors[0]
+            else:
+                await asyncio.to_thread(
+                    self.vector_store.similarity_search_by_sources_batch,
+                    queries,
+                    k=settings.TOP_K,
+                    sources=settings.SOURCES,
+                )
+            logger.info(f"Warmed up with {len(queries)} queries")
         except Exception as e:
-            logger.error(f"Error generating response: {e}")
+            # The pipeline can still serve requests, only without warm caches
+            logger.error(f"Error running warm-up queries: {e}")
+
+    async def stream_response(
+        self,
+        query: str,
+        chat_history: Optional[List[Dict[str, str]]] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Stream a response using the RAG pipeline
+
+        Args:
+            query: User question
+            chat_history: Optional conversation history
+
+        Yields:
+            A `sources` event with the retrieved documents, then `token` events as the response is generated
+        """
+        try:
+            answer_cache = self.answer_cache if not chat_history else None
+            query_embedding = None
+            if answer_cache is not None:
+                query_embedding = await asyncio.to_thread(self.vector_store.embed_query, query)
+                cached_answer = self._lookup_answer(answer_cache, query_embedding)
+                if cached_answer is not None:
+                    logger.info("Answer cache hit, skipping retrieval and generation")
+                    cached_response, cached_docs = cached_answer
+                    yield {"event": "sources", "data": cached_docs}
+                    yield {"event": "token", "data": cached_response}
+                    return
+
+            # Embedding and vector search are blocking, so they run in a worker thread
+            docs = await asyncio.to_thread(self._retrieve, query, query_embedding)
+            yield {"event": "sources", "data": docs}
+
+            prompt = self._build_prompt(query, chat_history, docs)
+            tokens = []
+            async for token in self.llm.astream(prompt):
+                tokens.append(token)
+                yield {"event": "token", "data": token}
+
+            if answer_cache is not None and query_embedding is not None:
+                answer_cache.store(
+                    query_embedding, version=answer_cache_version(), response="".join(tokens), sources=docs
+                )
+        except Exception as e:
+            logger.error(f"Error streaming response: {e}")
             raise
@@ -0,0 +1,68 @@
+import asyncio
+import functools
+import logging
+from typing import Awaitable, Callable, Dict, Generic, TypeVar
+
+from emush_rag_chatbot.metrics import COALESCED_CALLS
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class _Call(Generic[T]):
+    """Computation in flight and the number of callers awaiting it"""
+
+    def __init__(self, task: "asyncio.Task[T]") -> None:
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight(Generic[T]):
+    """
+    Coalesces concurrent calls sharing a key into a single computation
+
+    The computation runs in its own task, so a caller being cancelled (e.g. a client disconnecting) does not cancel
+    it for the others; it is only cancelled once every caller is gone. Its result or exception is shared by all
+    callers, and nothing is kept once it completes.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._calls: Dict[str, _Call[T]] = {}
+
+    def _forget(self, key: str, call: _Call[T], _: object = None) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    async def do(self, key: str, function: Callable[[], Awaitable[T]]) -> T:
+        """
+        Await the computation in flight for the key, or start it
+
+        Args:
+            key: Identifier of the computation
+            function: Coroutine function computing the result, called only if no computation is in flight
+
+        Returns:
+            Result of the computation
+        """
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(function()))
+            self._calls[key] = call
+            call.task.add_done_callback(functools.partial(self._forget, key, call))
+            COALESCED_CALLS.labels(self.name, "leader").inc()
+        else:
+            logger.info(f"Joining {self.name} call in flight")
+            COALESCED_CALLS.labels(self.name, "follower").inc()
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # Every caller was cancelled: nobody needs the result anymore
+                self._forget(key, call)
+                call.task.cancel()
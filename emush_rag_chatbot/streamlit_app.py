@@ -1,12 +1,15 @@
-import asyncio
+import importlib.util
 import json
+import uuid
 from pathlib import Path
-from typing import Dict, List
+from typing import Any, Dict, Iterator, List, Tuple
 
 import httpx
 import streamlit as st
 from pydantic import BaseModel
 
+from emush_rag_chatbot.config import settings
+
 # Configure page and paths
 STATIC_DIR = Path(__file__).parent / "static"
 st.set_page_config(
@@ -23,12 +26,29 @@ class ChatMessage(BaseModel):
     assistant: str
 
 
+@st.cache_resource
+def get_http_client() -> httpx.Client:
+    """
+    Get the HTTP client of the API, shared by every session and rerun of the app
+
+    The client keeps connections alive between questions, over HTTP/2 when the `h2` package is installed.
+    """
+    return httpx.Client(
+        base_url=settings.CHATBOT_API_URL,
+        http2=importlib.util.find_spec("h2") is not None,
+        timeout=httpx.Timeout(
+            settings.CHATBOT_API_READ_TIMEOUT_SECONDS, connect=settings.CHATBOT_API_CONNECT_TIMEOUT_SECONDS
+        ),
+    )
+
+
 def initialize_session_state():
     """Initialize session state variables"""
     if "messages" not in st.session_state:
         st.session_state.messages = []
-    if "chat_history" not in st.session_state:
-        st.session_state.chat_history = []
+    if "conversation_id" not in st.session_state:
+        # The API keeps the history of the conversation
+        st.session_state.conversation_id = uuid.uuid4().hex
 
 
 def display_chat_history():
@@ -44,23 +64,42 @@ def display_chat_history():
                         st.markdown(f"**{source['source']}** ([link]({source['link']}))\n\n{source['content']}\n\n---")
 
 
-async def query_chatbot(question: str, chat_history: List[Dict[str, str]]) -> Dict:
-    """Query the chatbot API"""
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(
-                "http://localhost:8000/chat",
-                json={"query": question, "chat_history": chat_history},
-                timeout=30.0,
-            )
-            response.raise_for_status()  # Raise an error for bad status codes
-            return response.json()
-        except httpx.HTTPError as e:
-            st.error(f"HTTP Error: {str(e)}")
-            return {"error": str(e)}
-        except Exception as e:
-            st.error(f"Error: {str(e)}")
-            return {"error": str(e)}
+def iter_sse_events(response: httpx.Response) -> Iterator[Tuple[str, Any]]:
+    """Parse Server-Sent Events with JSON-encoded data from a streaming response"""
+    event, data = "message", ""
+    for line in response.iter_lines():
+        if line.startswith("event:"):
+            event = line[len("event:") :].strip()
+        elif line.startswith("data:"):
+            data += line[len("data:") :].strip()
+        elif not line and data:
+            yield event, json.loads(data)
+            event, data = "message", ""
+
+
+def query_chatbot(question: str, conversation_id: str, sources: List[Dict]) -> Iterator[str]:
+    """
+    Query the chatbot API, streaming response tokens as they are generated
+
+    Args:
+        question: User question
+        conversation_id: Conversation whose previous exchanges are kept by the API
+        sources: List filled with the source documents once they are received
+
+    Yields:
+        Response tokens
+    """
+    with get_http_client().stream(
+        "POST", "/chat/stream", json={"query": question, "conversation_id": conversation_id}
+    ) as response:
+        response.raise_for_status()  # Raise an error for bad status codes
+        for event, data in iter_sse_events(response):
+            if event == "sources":
+                sources.extend(data)
+            elif event == "token":
+                yield data
+            elif event == "error":
+                raise RuntimeError(data["detail"])
 
 
 def main():
@@ -82,37 +121,32 @@ def main():
             st.markdown(question)
 
         with st.chat_message("assistant", avatar=str(STATIC_DIR / "neron_eye.gif")):
-            with st.spinner("Thinking..."):
-                try:
-                    response = asyncio.run(query_chatbot(question, st.session_state.chat_history))
-
-                    if "error" in response:
-                        st.error(response["error"])
-                        return
-
-                    # Display response
-                    st.markdown(response["response"])
-
-                    # Show sources
-                    if response["sources"]:
-                        with st.expander("View sources"):
-                            for source in response["sources"]:
-                                st.markdown(
-                                    f"**{source['source']}** ([link]({source['link']}))\n\n{source['content']}\n\n---"
-                                )
-
-                    # Update chat history
-                    st.session_state.messages.append(
-                        {
-                            "human": question,
-                            "assistant": response["response"],
-                            "sources": response["sources"],
-                        }
-                    )
-                    st.session_state.chat_history.append({"human": question, "assistant": response["response"]})
-
-                except Exception as e:
-                    st.error(f"Error: {str(e)}")
+            try:
+                # Display response as it is generated
+                sources = []
+                answer = str(st.write_stream(query_chatbot(question, st.session_state.conversation_id, sources)))
+
+                # Show sources
+                if sources:
+                    with st.expander("View sources"):
+                        for source in sources:
+                            st.markdown(
+                                f"**{source['source']}** ([link]({source['link']}))\n\n{source['content']}\n\n---"
+                            )
+
+                # Update displayed messages
+                st.session_state.messages.append(
+                    {
+                        "human": question,
+                        "assistant": answer,
+                        "sources": sources,
+                    }
+                )
+
+            except httpx.HTTPError as e:
+                st.error(f"HTTP Error: {str(e)}")
+            except Exception as e:
+                st.error(f"Error: {str(e)}")
 
 
 if __name__ == "__main__":
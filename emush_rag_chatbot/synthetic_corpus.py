@@ -0,0 +1,27 @@
+import json
+import random
+from pathlib import Path
+
+from emush_rag_chatbot.config import settings
+
+WORDS = [
+    "mush", "spore", "daedalus", "humain", "pilgred", "eden", "sol", "hunter", "planète", "laboratoire",
+    "réacteur", "infirmerie", "tabulatrice", "compétence", "mycoscan", "recherche", "projet", "oxygène",
+]  # fmt: skip
+
+
+def write_synthetic_corpus(data_dir: Path, documents: int, mean_length: int) -> None:
+    """Write a JSON array of wiki-like documents of random lengths"""
+    rng = random.Random(settings.SEED)
+    with open(data_dir / "data.json", "w", encoding="utf-8") as f:
+        records = []
+        for i in range(documents):
+            paragraphs = [
+                " ".join(rng.choices(WORDS, k=rng.randint(20, 120))) + "." for _ in range(mean_length // 400 + 1)
+            ]
+            content = "\n\n".join(paragraphs)[: rng.randint(mean_length // 2, mean_length * 3 // 2)]
+            source = settings.SOURCES[i % len(settings.SOURCES)]
+            records.append(
+                {"title": f"Page {i}", "link": f"https://test.com/{i}", "source": source, "content": content}
+            )
+        json.dump(records, f, ensure_ascii=False)
@@ -0,0 +1,9 @@
+import math
+
+# French wiki text averages a bit more than 3 characters per token: overestimating keeps budgets safe
+CHARS_PER_TOKEN = 3
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the number of tokens of a text without loading a tokenizer"""
+    return max(1, math.ceil(len(text) / CHARS_PER_TOKEN))
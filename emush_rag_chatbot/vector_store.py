@@ -1,15 +1,34 @@
+import itertools
 import logging
-from typing import Any, Dict, List, Protocol, runtime_checkable
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Protocol, Tuple, runtime_checkable
 
+import chromadb
+import numpy as np
 from langchain_chroma import Chroma
 from langchain_core.documents import Document
-from langchain_openai import OpenAIEmbeddings
+from langchain_core.embeddings import DeterministicFakeEmbedding, Embeddings
 
 from emush_rag_chatbot.config import settings
+from emush_rag_chatbot.embedding_cache import CachedEmbeddings
+from emush_rag_chatbot.embeddings import create_embeddings
+from emush_rag_chatbot.metrics import QUERY_EMBEDDING_DURATION, RETRIEVAL_DURATION
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+COLLECTION_NAME = (
+    "langchain"  # Default collection of langchain's Chroma wrapper, which existing indexes were built with
+)
+
+
+def embed_queries(embeddings: Embeddings, queries: List[str]) -> List[List[float]]:
+    """Embed several queries in a single request to the embedding model, through its query cache if it has one"""
+    with QUERY_EMBEDDING_DURATION.time():
+        if isinstance(embeddings, CachedEmbeddings):
+            return embeddings.embed_queries(queries)
+        return embeddings.embed_documents(queries)
+
 
 @runtime_checkable
 class VectorStore(Protocol):
@@ -23,32 +42,123 @@ class VectorStore(Protocol):
         """Perform similarity search with optional metadata filtering"""
         ...
 
+    def embed_query(self, query: str) -> List[float]:
+        """Embed a query with the embedding model of the store"""
+        ...
+
+    def similarity_search_by_sources(
+        self, query: str, k: int, sources: List[str], query_embedding: List[float] | None = None
+    ) -> Dict[str, List[Document]]:
+        """Perform similarity search returning the top-k documents of each source, embedding the query once"""
+        ...
+
+    def embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """Embed several queries in a single request to the embedding model"""
+        ...
+
+    def warm_up(self) -> None:
+        """Load the index in memory, so that the first search does not pay for it"""
+        ...
+
+    def similarity_search_by_sources_batch(
+        self, queries: List[str], k: int, sources: List[str], query_embeddings: List[List[float]] | None = None
+    ) -> List[Dict[str, List[Document]]]:
+        """Perform `similarity_search_by_sources` for several queries in a single pass over each source"""
+        ...
+
 
 class ChromaVectorStore(VectorStore):
     """Manages document embeddings and similarity search using Chroma"""
 
-    def __init__(self):
-        self.embeddings = OpenAIEmbeddings(model=settings.EMBEDDING_MODEL, openai_api_key=settings.OPENAI_API_KEY)
+    def __init__(self, embeddings: Embeddings | None = None, persist_directory: Path | None = None):
+        self.embeddings = embeddings or CachedEmbeddings(create_embeddings())
+        self.persist_directory = persist_directory or settings.CHROMA_PERSIST_DIR
         self.vector_store = self._initialize_store()
 
     def _initialize_store(self) -> Chroma:
-        """Initialize the vector store with persistence"""
-        return Chroma(persist_directory=str(settings.CHROMA_PERSIST_DIR), embedding_function=self.embeddings)
+        """
+        Initialize the vector store with persistence
 
-    async def add_documents(self, documents: List[Document]) -> None:
+        The Chroma client and collection are kept for the bulk operations langchain does not expose, such as upserting
+        precomputed embeddings or querying several embeddings at once.
+        """
+        self.client = chromadb.PersistentClient(path=str(self.persist_directory))
+        self.collection = self.client.get_or_create_collection(COLLECTION_NAME, embedding_function=None)
+        return Chroma(client=self.client, collection_name=COLLECTION_NAME, embedding_function=self.embeddings)
+
+    async def add_documents(self, documents: List[Document], ids: List[str] | None = None) -> None:
         """
         Index documents in the vector store
 
         Args:
             documents: List of documents to index
+            ids: Optional identifiers of the documents, existing documents with the same identifiers are replaced
+        """
+        try:
+            await self.vector_store.aadd_documents(documents, ids=ids)
+            logger.info(f"Successfully indexed {len(documents)} documents")
+        except Exception as e:
+            logger.error(f"Error indexing documents: {e}")
+            raise
+
+    def add_embeddings(self, documents: List[Document], embeddings: List[List[float]], ids: List[str]) -> None:
+        """
+        Insert documents with precomputed embeddings in bulk, replacing documents with the same identifiers
+
+        Args:
+            documents: List of documents to index
+            embeddings: Embeddings of the documents
+            ids: Identifiers of the documents
         """
         try:
-            await self.vector_store.aadd_documents(documents)
+            max_batch_size = self.client.get_max_batch_size()
+            for start in range(0, len(documents), max_batch_size):
+                end = start + max_batch_size
+                self.collection.upsert(
+                    ids=ids[start:end],
+                    embeddings=embeddings[start:end],  # type: ignore[arg-type]
+                    documents=[doc.page_content for doc in documents[start:end]],
+                    metadatas=[doc.metadata for doc in documents[start:end]],
+                )
             logger.info(f"Successfully indexed {len(documents)} documents")
         except Exception as e:
             logger.error(f"Error indexing documents: {e}")
             raise
 
+    def delete_documents(self, ids: List[str]) -> None:
+        """
+        Remove documents from the vector store
+
+        Args:
+            ids: Identifiers of the documents to remove
+        """
+        try:
+            if ids:
+                self.vector_store.delete(ids=ids)
+            logger.info(f"Successfully deleted {len(ids)} documents")
+        except Exception as e:
+            logger.error(f"Error deleting documents: {e}")
+            raise
+
+    def reset(self) -> None:
+        """Delete every indexed document, along with the embedding dimension fixed by the collection"""
+        try:
+            self.client.delete_collection(COLLECTION_NAME)
+            self.vector_store = self._initialize_store()
+            logger.info("Successfully reset the vector store")
+        except Exception as e:
+            logger.error(f"Error resetting the vector store: {e}")
+            raise
+
+    def embedding_dimension(self) -> int | None:
+        """Return the dimension of the indexed embeddings, or None if nothing is indexed"""
+        embeddings = self.collection.get(limit=1, include=["embeddings"])["embeddings"]
+        return len(embeddings[0]) if embeddings is not None and len(embeddings) else None
+
+    def get_ids(self) -> List[str]:
+        """Return the identifiers of every indexed document"""
+        return list(self.vector_store.get(include=[])["ids"])
+
     def similarity_search(self, query: str, k: int, filter_metadata: Dict[str, Any] | None = None) -> List[Document]:
         """
         Perform similarity search with optional metadata filtering
@@ -67,12 +177,156 @@ class ChromaVectorStore(VectorStore):
             logger.error(f"Error performing similarity search: {e}")
             raise
 
+    def get_documents_and_embeddings(self) -> Tuple[List[Document], List[List[float]]]:
+        """Return every indexed document with its stored embedding"""
+        data = self.vector_store.get(include=["documents", "metadatas", "embeddings"])
+        documents = [
+            Document(page_content=content, metadata=metadata)
+            for content, metadata in zip(data["documents"], data["metadatas"])
+        ]
+        return documents, list(data["embeddings"])
+
+    def count_documents_by_source(self, batch_size: int = settings.INDEX_WRITE_BATCH_SIZE) -> Dict[str, int]:
+        """Count indexed documents by source, reading their metadata a page at a time"""
+        counts: Dict[str, int] = {}
+        for offset in itertools.count(0, batch_size):
+            metadatas = self.vector_store.get(include=["metadatas"], limit=batch_size, offset=offset)["metadatas"]
+            for metadata in metadatas:
+                source = metadata.get("source", "")
+                counts[source] = counts.get(source, 0) + 1
+            if len(metadatas) < batch_size:
+                return counts
+        raise RuntimeError("Unreachable")
+
+    def iter_documents_and_embeddings(
+        self, source: str, batch_size: int = settings.INDEX_WRITE_BATCH_SIZE
+    ) -> Iterator[Tuple[List[Document], np.ndarray]]:
+        """
+        Stream the indexed documents of a source with their stored embeddings, a page at a time
+
+        Args:
+            source: Source of the documents
+            batch_size: Number of documents per page
+
+        Yields:
+            Documents of a page and their embeddings, one row per document
+        """
+        for offset in itertools.count(0, batch_size):
+            data = self.vector_store.get(
+                where={"source": source},
+                include=["documents", "metadatas", "embeddings"],
+                limit=batch_size,
+                offset=offset,
+            )
+            documents = [
+                Document(page_content=content, metadata=metadata)
+                for content, metadata in zip(data["documents"], data["metadatas"])
+            ]
+            if documents:
+                yield documents, np.asarray(data["embeddings"], dtype=np.float32)
+            if len(documents) < batch_size:
+                return
+
+    def embed_query(self, query: str) -> List[float]:
+        """Embed a query with the embedding model of the store"""
+        with QUERY_EMBEDDING_DURATION.time():
+            return self.embeddings.embed_query(query)
+
+    def similarity_search_by_sources(
+        self, query: str, k: int, sources: List[str], query_embedding: List[float] | None = None
+    ) -> Dict[str, List[Document]]:
+        """
+        Perform similarity search returning the top-k documents of each source
+
+        The query is embedded once and the same vector is used to search each source partition,
+        instead of paying one embedding round trip per source.
+
+        Args:
+            query: Search query
+            k: Number of results to return per source
+            sources: Sources to search in
+            query_embedding: Optional precomputed query embedding
+
+        Returns:
+            Relevant documents grouped by source, in the order of `sources`
+        """
+        try:
+            embedding = query_embedding if query_embedding is not None else self.embed_query(query)
+            docs_by_source = {}
+            for source in sources:
+                with RETRIEVAL_DURATION.labels(source).time():
+                    docs_by_source[source] = self.vector_store.similarity_search_by_vector(
+                        embedding, k=k, filter={"source": source}
+                    )
+            return docs_by_source
+        except Exception as e:
+            logger.error(f"Error performing similarity search by sources: {e}")
+            raise
+
+    def embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """Embed several queries in a single request to the embedding model"""
+        return embed_queries(self.embeddings, queries)
+
+    def warm_up(self) -> None:
+        """Load the HNSW index in memory by searching it with the embedding of an indexed document"""
+        try:
+            embeddings = self.collection.peek(1)["embeddings"]
+            if embeddings is not None and len(embeddings):
+                self.vector_store.similarity_search_by_vector(list(embeddings[0]), k=1)
+            logger.info("Loaded Chroma index")
+        except Exception as e:
+            logger.error(f"Error loading Chroma index: {e}")
+            raise
+
+    def similarity_search_by_sources_batch(
+        self, queries: List[str], k: int, sources: List[str], query_embeddings: List[List[float]] | None = None
+    ) -> List[Dict[str, List[Document]]]:
+        """
+        Perform similarity search returning the top-k documents of each source, for several queries
+
+        Queries are embedded in a single request, and each source partition is searched once for all of them.
+
+        Args:
+            queries: Search queries
+            k: Number of results to return per source and query
+            sources: Sources to search in
+            query_embeddings: Optional precomputed query embeddings
+
+        Returns:
+            Relevant documents grouped by source, for each query in order
+        """
+        try:
+            if not queries:
+                return []
+            embeddings = query_embeddings if query_embeddings is not None else self.embed_queries(queries)
+            results: List[Dict[str, List[Document]]] = [{} for _ in queries]
+            for source in sources:
+                with RETRIEVAL_DURATION.labels(source).time():
+                    response = self.collection.query(
+                        query_embeddings=embeddings,  # type: ignore[arg-type]
+                        n_results=k,
+                        where={"source": source},
+                        include=["documents", "metadatas"],
+                    )
+                for result, contents, metadatas in zip(
+                    results, response["documents"] or [], response["metadatas"] or []
+                ):
+                    result[source] = [
+                        Document(page_content=content or "", metadata=dict(metadata or {}))
+                        for content, metadata in zip(contents, metadatas)
+                    ]
+            return results
+        except Exception as e:
+            logger.error(f"Error performing batch similarity search by sources: {e}")
+            raise
+
 
 class FakeVectorStore(VectorStore):
     """A fake vector store implementation for testing"""
 
-    def __init__(self, documents: List[Document] | None = None):
+    def __init__(self, documents: List[Document] | None = None, embeddings: Embeddings | None = None):
         self.documents = documents or []
+        self.embeddings = embeddings or DeterministicFakeEmbedding(size=16)
 
     async def add_documents(self, documents: List[Document]) -> None:
         """Add documents to the fake store"""
@@ -89,3 +343,52 @@ class FakeVectorStore(VectorStore):
                 if all(doc.metadata.get(key) == value for key, value in filter_metadata.items())
             ]
         return filtered_docs[:k]
+
+    def embed_query(self, query: str) -> List[float]:
+        """Embed a query with fake deterministic embeddings"""
+        return self.embeddings.embed_query(query)
+
+    def similarity_search_by_sources(
+        self, query: str, k: int, sources: List[str], query_embedding: List[float] | None = None
+    ) -> Dict[str, List[Document]]:
+        """Return a subset of stored documents for each source, ignoring actual similarity"""
+        return {source: self.similarity_search(query, k=k, filter_metadata={"source": source}) for source in sources}
+
+    def embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """Embed queries with fake deterministic embeddings"""
+        return self.embeddings.embed_documents(queries)
+
+    def warm_up(self) -> None:
+        """Nothing to load for the fake store"""
+
+    def similarity_search_by_sources_batch(
+        self, queries: List[str], k: int, sources: List[str], query_embeddings: List[List[float]] | None = None
+    ) -> List[Dict[str, List[Document]]]:
+        """Return a subset of stored documents for each source and query, ignoring actual similarity"""
+        return [self.similarity_search_by_sources(query, k=k, sources=sources) for query in queries]
+
+
+def create_vector_store() -> VectorStore:
+    """
+    Create the vector store backend selected by settings, fused with BM25 results when its index exists
+
+    The BM25 index is the one written with the NumPy index, whatever the backend, and is memory-mapped.
+    """
+    vector_store: VectorStore
+    if settings.VECTOR_STORE == "numpy":
+        from emush_rag_chatbot.numpy_vector_store import NumpyVectorStore
+
+        vector_store = NumpyVectorStore()
+    elif settings.VECTOR_STORE == "chroma":
+        vector_store = ChromaVectorStore()
+    else:
+        raise ValueError(f"Unknown vector store: {settings.VECTOR_STORE}")
+
+    if settings.BM25_ENABLED:
+        from emush_rag_chatbot.hybrid_vector_store import HybridVectorStore
+        from emush_rag_chatbot.numpy_vector_store import load_bm25_index
+
+        bm25_index = load_bm25_index(settings.NUMPY_INDEX_DIR)
+        if bm25_index is not None:
+            return HybridVectorStore(vector_store, bm25_index)
+    return vector_store
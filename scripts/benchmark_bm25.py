@@ -0,0 +1,92 @@
+import argparse
+import logging
+import statistics
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+from emush_rag_chatbot.benchmarking import (
+    can_embed_queries,
+    create_embeddings,
+    embed_questions,
+    load_questions,
+    summarize_latencies,
+)
+from emush_rag_chatbot.config import settings
+from emush_rag_chatbot.hybrid_vector_store import HybridVectorStore
+from emush_rag_chatbot.numpy_vector_store import load_bm25_index
+from emush_rag_chatbot.vector_store import ChromaVectorStore
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def time_calls(questions: List[str], call: Callable[[int, str], object]) -> Dict[str, float]:
+    """Time a call made for each question"""
+    latencies = []
+    for i, question in enumerate(questions):
+        start = time.perf_counter()
+        call(i, question)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return summarize_latencies(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare BM25, hybrid and vector-only retrieval")
+    parser.add_argument("--chroma-dir", type=Path, default=settings.CHROMA_PERSIST_DIR)
+    parser.add_argument("--numpy-index", type=Path, default=settings.NUMPY_INDEX_DIR, help="Holds the BM25 index")
+    parser.add_argument("--dataset", type=Path, default=Path(__file__).parent / settings.EVALUATION_DATASET)
+    args = parser.parse_args()
+
+    embeddings = create_embeddings()
+    vector_store = ChromaVectorStore(embeddings=embeddings, persist_directory=args.chroma_dir)
+    bm25_index = load_bm25_index(args.numpy_index)
+    if bm25_index is None:
+        raise ValueError(f"No BM25 index in {args.numpy_index}: index documents with BM25_ENABLED=true")
+    hybrid_store = HybridVectorStore(vector_store, bm25_index, fast_path_enabled=True)
+    questions = load_questions([args.dataset])
+
+    results: Dict[str, Dict[str, float]] = {}
+    if can_embed_queries():
+        results["query_embedding"] = time_calls(questions, lambda _, question: embeddings.embed_query(question))
+    query_embeddings = embed_questions(embeddings, questions, dimension=vector_store.embedding_dimension() or 1)
+
+    def search_kwargs(i: int) -> Dict:
+        return {"k": settings.TOP_K, "sources": settings.SOURCES, "query_embedding": query_embeddings[i]}
+
+    results["bm25"] = time_calls(
+        questions,
+        lambda _, question: bm25_index.search_by_sources(question, k=settings.TOP_K, sources=settings.SOURCES),
+    )
+    results["vector"] = time_calls(
+        questions, lambda i, question: vector_store.similarity_search_by_sources(question, **search_kwargs(i))
+    )
+    results["hybrid"] = time_calls(
+        questions, lambda i, question: hybrid_store.similarity_search_by_sources(question, **search_kwargs(i))
+    )
+
+    # Measure how often the fast path would skip the query embedding, and how much hybrid results differ
+    decisive_queries = sum(
+        hybrid_store.is_decisive(
+            bm25_index.search_by_sources(question, k=hybrid_store.candidates, sources=settings.SOURCES)
+        )
+        for question in questions
+    )
+    overlaps = []
+    for i, question in enumerate(questions):
+        vector_docs = vector_store.similarity_search_by_sources(question, **search_kwargs(i))
+        hybrid_docs = hybrid_store.similarity_search_by_sources(question, **search_kwargs(i))
+        for source in settings.SOURCES:
+            if vector_docs[source]:
+                expected = {doc.page_content for doc in vector_docs[source]}
+                overlaps.append(len(expected & {doc.page_content for doc in hybrid_docs[source]}) / len(expected))
+
+    print(f"\nRetrieval over {len(bm25_index.documents)} documents and {len(questions)} queries:")
+    for retriever, metrics in results.items():
+        print(f"{retriever}: " + ", ".join(f"{name}={value:.3f}" for name, value in metrics.items()))
+    print(f"Fast path rate (query embeddings skipped): {decisive_queries / len(questions):.2%}")
+    print(f"Hybrid top-{settings.TOP_K} overlap with vector-only: {statistics.mean(overlaps) if overlaps else 0:.2%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+import argparse
+import logging
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import List
+
+from emush_rag_chatbot.config import settings
+from emush_rag_chatbot.document_loader import Document, DocumentLoader
+from emush_rag_chatbot.synthetic_corpus import write_synthetic_corpus
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def load(data_dir: Path, workers: int, records_per_task: int, chunk_size: int) -> List[Document]:
+    loader = DocumentLoader(
+        str(data_dir), chunk_size=chunk_size, chunk_overlap=100, workers=workers, records_per_task=records_per_task
+    )
+    return list(loader.iter_documents())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure DocumentLoader speedup versus worker count")
+    parser.add_argument("--documents", type=int, default=5_000)
+    parser.add_argument("--mean-length", type=int, default=30_000, help="Mean document length in characters")
+    parser.add_argument("--chunk-size", type=int, default=1_000)
+    parser.add_argument("--records-per-task", type=int, default=settings.LOADER_RECORDS_PER_TASK)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        write_synthetic_corpus(Path(data_dir), args.documents, args.mean_length)
+        corpus_size = (Path(data_dir) / "data.json").stat().st_size
+
+        start = time.perf_counter()
+        serial_chunks = load(Path(data_dir), 1, args.records_per_task, args.chunk_size)
+        serial_seconds = time.perf_counter() - start
+
+        print(f"\nSplitting {args.documents} documents ({corpus_size / 1e6:.1f} MB) on {os.cpu_count()} cores:")
+        print(f"workers=1: {serial_seconds:.2f}s, {len(serial_chunks)} chunks")
+        workers = 2
+        while workers <= args.max_workers:
+            start = time.perf_counter()
+            chunks = load(Path(data_dir), workers, args.records_per_task, args.chunk_size)
+            seconds = time.perf_counter() - start
+            identical = "identical" if chunks == serial_chunks else "DIFFERENT"
+            print(f"workers={workers}: {seconds:.2f}s, speedup={serial_seconds / seconds:.2f}x, chunks {identical}")
+            workers *= 2
+
+
+if __name__ == "__main__":
+    main()
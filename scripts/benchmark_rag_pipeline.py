@@ -0,0 +1,183 @@
+import argparse
+import asyncio
+import datetime
+import json
+import logging
+import tempfile
+import time
+import uuid
+from importlib.metadata import version
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from emush_rag_chatbot.benchmarking import load_questions, summarize_latencies
+from emush_rag_chatbot.config import settings
+from emush_rag_chatbot.document_loader import DocumentLoader, to_langchain_document
+from emush_rag_chatbot.index_manifest import chunk_id
+from emush_rag_chatbot.ingestion import EmbeddingPipeline
+from emush_rag_chatbot.llm import FakeLLM
+from emush_rag_chatbot.rag_chain import RAGChain
+from emush_rag_chatbot.synthetic_corpus import write_synthetic_corpus
+from emush_rag_chatbot.vector_store import ChromaVectorStore
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def time_calls(questions: List[str], call: Callable[[str], object], repeats: int) -> Dict[str, float]:
+    """Time a call made for each question"""
+    latencies = []
+    for _ in range(repeats):
+        for question in questions:
+            start = time.perf_counter()
+            call(question)
+            latencies.append((time.perf_counter() - start) * 1000)
+    return summarize_latencies(latencies)
+
+
+async def time_async_calls(questions: List[str], call: Callable[[str], Any], repeats: int) -> Dict[str, float]:
+    """Time a coroutine awaited for each question, one at a time"""
+    latencies = []
+    for _ in range(repeats):
+        for question in questions:
+            start = time.perf_counter()
+            await call(question)
+            latencies.append((time.perf_counter() - start) * 1000)
+    return summarize_latencies(latencies)
+
+
+def save_results(record: Dict, output_file: Path) -> None:
+    """Append a benchmark record to the JSON results file"""
+    existing_results = []
+    if output_file.exists():
+        with open(output_file, "r", encoding="utf-8") as f:
+            existing_results = json.load(f)
+
+    existing_results.append(record)
+
+    with open(output_file, "w", encoding="utf-8") as f:
+        json.dump(existing_results, f, indent=2, ensure_ascii=False)
+
+
+def compare_with_previous(record: Dict, output_file: Path) -> None:
+    """Print the change of each metric since the previous run with the same parameters"""
+    with open(output_file, "r", encoding="utf-8") as f:
+        previous_runs = [run for run in json.load(f)[:-1] if run["params"] == record["params"]]
+    if not previous_runs:
+        return
+
+    previous = previous_runs[-1]
+    print(f"\nChange since {previous['version']} ({previous['timestamp']}):")
+    for benchmark, metrics in record["results"].items():
+        changes = [
+            f"{name}={(value / previous['results'][benchmark][name] - 1):+.1%}"
+            for name, value in metrics.items()
+            if previous["results"].get(benchmark, {}).get(name)
+        ]
+        print(f"{benchmark}: " + ", ".join(changes))
+
+
+async def run_benchmarks(args: argparse.Namespace, work_dir: Path) -> Dict[str, Dict[str, float]]:
+    """Run every benchmark on a synthetic corpus written to a working directory"""
+    results = {}
+    data_dir = work_dir / "data"
+    data_dir.mkdir()
+    write_synthetic_corpus(data_dir, args.documents, args.mean_length)
+
+    # Loading: parse and split the corpus
+    start = time.perf_counter()
+    chunks = [
+        to_langchain_document(doc)
+        for doc in DocumentLoader(str(data_dir), chunk_size=args.chunk_size).iter_documents()
+    ]
+    seconds = time.perf_counter() - start
+    corpus_size = (data_dir / "data.json").stat().st_size
+    results["loading"] = {"chunks_per_second": len(chunks) / seconds, "mb_per_second": corpus_size / 1e6 / seconds}
+
+    # Indexing: embed chunks with a deterministic local embedding function and write them to Chroma
+    embeddings = DeterministicFakeEmbedding(size=args.embedding_size)
+    vector_store = ChromaVectorStore(embeddings=embeddings, persist_directory=work_dir / "chroma")
+    start = time.perf_counter()
+    stats = await EmbeddingPipeline(embeddings, vector_store).run((chunk_id(doc), doc) for doc in chunks)
+    seconds = time.perf_counter() - start
+    results["indexing"] = {"chunks_per_second": stats.chunks / seconds, "tokens_per_second": stats.tokens / seconds}
+
+    questions = load_questions([args.dataset])
+    results["similarity_search"] = time_calls(
+        questions, lambda question: vector_store.similarity_search(question, k=settings.TOP_K), args.repeats
+    )
+    results["similarity_search_by_sources"] = time_calls(
+        questions,
+        lambda question: vector_store.similarity_search_by_sources(
+            question, k=settings.TOP_K, sources=settings.SOURCES
+        ),
+        args.repeats,
+    )
+
+    # Prompt formatting, with the documents retrieved for each question and a chat history of 10 exchanges
+    rag_chain = RAGChain(vector_store=vector_store, llm=FakeLLM())
+    docs_by_question = {question: rag_chain._retrieve(question) for question in questions}
+    chat_history = [{"human": question, "assistant": question} for question in questions[:10]]
+    results["format_docs"] = time_calls(
+        questions, lambda question: rag_chain._format_docs(docs_by_question[question]), args.repeats * 10
+    )
+    results["format_chat_history"] = time_calls(
+        questions, lambda _: rag_chain._format_chat_history(chat_history), args.repeats * 10
+    )
+    results["build_prompt"] = time_calls(
+        questions,
+        lambda question: rag_chain._build_prompt(question, chat_history, docs_by_question[question]),
+        args.repeats * 10,
+    )
+
+    # End to end, with a fake LLM so that only the pipeline overhead is measured
+    results["generate_response"] = await time_async_calls(
+        questions, lambda question: rag_chain.generate_response(question, chat_history), args.repeats
+    )
+    return results
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark the RAG pipeline offline on a synthetic corpus")
+    parser.add_argument("--documents", type=int, default=1_000)
+    parser.add_argument("--mean-length", type=int, default=10_000, help="Mean document length in characters")
+    parser.add_argument("--chunk-size", type=int, default=10_000)
+    parser.add_argument("--embedding-size", type=int, default=256)
+    parser.add_argument("--dataset", type=Path, default=Path(__file__).parent / settings.EVALUATION_DATASET)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--output", type=Path, default=Path(__file__).parent / "benchmark_results.json")
+    args = parser.parse_args()
+
+    # FakeLLM logs every prompt, which would dominate end-to-end latencies
+    logging.getLogger("emush_rag_chatbot").setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        results = await run_benchmarks(args, Path(work_dir))
+
+    record = {
+        "benchmark_id": str(uuid.uuid4()),
+        "timestamp": datetime.datetime.now().isoformat(),
+        "version": version("emush-rag-chatbot"),
+        "params": {
+            "documents": args.documents,
+            "mean_length": args.mean_length,
+            "chunk_size": args.chunk_size,
+            "embedding_size": args.embedding_size,
+            "dataset_name": args.dataset.name,
+            "top_k": settings.TOP_K,
+        },
+        "results": results,
+    }
+    save_results(record, args.output)
+
+    print(f"\nRAG pipeline benchmark over {args.documents} documents:")
+    for benchmark, metrics in results.items():
+        print(f"{benchmark}: " + ", ".join(f"{name}={value:.3f}" for name, value in metrics.items()))
+    compare_with_previous(record, args.output)
+    print(f"\nResults saved to: {args.output}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,120 @@
+import argparse
+import logging
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+import numpy as np
+from langchain_core.documents import Document
+
+from emush_rag_chatbot.benchmarking import create_embeddings, embed_questions, load_questions, summarize_latencies
+from emush_rag_chatbot.config import settings
+from emush_rag_chatbot.numpy_vector_store import NumpyVectorStore, write_numpy_index
+from emush_rag_chatbot.vector_store import ChromaVectorStore, VectorStore
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def time_searches(
+    vector_store: VectorStore, questions: List[str], query_embeddings: List[List[float]], repeats: int
+) -> Dict[str, float]:
+    """Time per-source similarity searches with precomputed query embeddings, in milliseconds"""
+    latencies = []
+    for _ in range(repeats):
+        for question, query_embedding in zip(questions, query_embeddings):
+            start = time.perf_counter()
+            vector_store.similarity_search_by_sources(
+                question, k=settings.TOP_K, sources=settings.SOURCES, query_embedding=query_embedding
+            )
+            latencies.append((time.perf_counter() - start) * 1000)
+    return summarize_latencies(latencies)
+
+
+def recall_at_k(
+    reference: VectorStore, candidate: VectorStore, questions: List[str], query_embeddings: List[List[float]]
+) -> float:
+    """Fraction of the reference top-k documents of each source also returned by the candidate store"""
+    matches, total = 0, 0
+    for question, query_embedding in zip(questions, query_embeddings):
+        expected = reference.similarity_search_by_sources(
+            question, k=settings.TOP_K, sources=settings.SOURCES, query_embedding=query_embedding
+        )
+        actual = candidate.similarity_search_by_sources(
+            question, k=settings.TOP_K, sources=settings.SOURCES, query_embedding=query_embedding
+        )
+        for source in settings.SOURCES:
+            expected_contents = {_document_key(doc) for doc in expected[source]}
+            matches += len(expected_contents & {_document_key(doc) for doc in actual[source]})
+            total += len(expected_contents)
+    return matches / total if total else 1.0
+
+
+def _document_key(doc: Document) -> str:
+    return f"{doc.metadata.get('link', '')}:{doc.page_content}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare ChromaVectorStore and NumpyVectorStore search latencies")
+    parser.add_argument("--chroma-dir", type=Path, default=settings.CHROMA_PERSIST_DIR)
+    parser.add_argument(
+        "--datasets",
+        type=Path,
+        nargs="+",
+        default=[Path(__file__).parent / "test_set_v2.csv", Path(__file__).parent / settings.EVALUATION_DATASET],
+    )
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    # Build the NumPy index from the Chroma collection, so both stores search the same data
+    embeddings = create_embeddings()
+    chroma_store = ChromaVectorStore(embeddings=embeddings, persist_directory=args.chroma_dir)
+    documents, stored_embeddings = chroma_store.get_documents_and_embeddings()
+    if not documents:
+        raise ValueError(f"No documents indexed in {args.chroma_dir}")
+
+    questions = load_questions(args.datasets)
+    query_embeddings = embed_questions(embeddings, questions, dimension=len(stored_embeddings[0]))
+
+    results = {"chroma": time_searches(chroma_store, questions, query_embeddings, args.repeats)}
+    with tempfile.TemporaryDirectory() as index_dir:
+        # Quantized and prefix searches rescore their candidates with the float32 vectors
+        write_numpy_index(
+            Path(index_dir) / "float32",
+            documents,
+            np.asarray(stored_embeddings),
+            dtype="float32",
+            quantizations=["int8", "binary"],
+            prefix_search=True,
+        )
+        write_numpy_index(Path(index_dir) / "float16", documents, np.asarray(stored_embeddings), dtype="float16")
+        variants: Dict[str, Dict[str, Any]] = {
+            "numpy_float32": {"dtype": "float32"},
+            "numpy_float16": {"dtype": "float16"},
+            "numpy_int8": {"dtype": "float32", "quantization": "int8"},
+            "numpy_binary": {"dtype": "float32", "quantization": "binary"},
+            "numpy_prefix": {"dtype": "float32", "prefix_search": True},
+        }
+        for backend, options in variants.items():
+            numpy_store = NumpyVectorStore(
+                embeddings=embeddings,
+                index_dir=Path(index_dir) / options["dtype"],
+                **{"quantization": "none", "prefix_search": False, **options},
+            )
+            searched_matrix = (
+                numpy_store.matrix if numpy_store.candidate_matrix is None else numpy_store.candidate_matrix
+            )
+            results[backend] = {
+                **time_searches(numpy_store, questions, query_embeddings, args.repeats),
+                "searched_matrix_mb": searched_matrix.nbytes / 1024**2,
+                "recall_at_k_vs_chroma": recall_at_k(chroma_store, numpy_store, questions, query_embeddings),
+            }
+
+    print(f"\nSearch latency over {len(documents)} documents and {len(questions)} queries:")
+    for backend, metrics in results.items():
+        print(f"{backend}: " + ", ".join(f"{name}={value:.3f}" for name, value in metrics.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,30 @@
+import argparse
 import asyncio
 import csv
 import datetime
 import json
 import logging
+import time
 import uuid
 from pathlib import Path
-from typing import Dict, List
+from typing import Any, Dict, List
 
 from langchain_core.output_parsers import JsonOutputParser
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_openai import ChatOpenAI
 from tqdm import tqdm
 
+from emush_rag_chatbot.benchmarking import summarize_latencies
 from emush_rag_chatbot.config import settings
+from emush_rag_chatbot.llm import OpenAILLM
 from emush_rag_chatbot.rag_chain import RAGChain
+from emush_rag_chatbot.vector_store import create_vector_store
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+STAGES = ["retrieval", "generation", "judging"]
+
 EVAL_PROMPT = """You are an expert evaluator for question-answering systems. 
 Your task is to evaluate the quality of an AI assistant's response compared to the ground truth answer.
 
@@ -42,14 +49,59 @@ Provide your evaluation in JSON format with the following fields:
 Be strict in your evaluation. The response should be marked down for any inaccuracies or missing key information."""
 
 
+def rag_params() -> Dict[str, Any]:
+    """Parameters of the evaluated RAG, identifying comparable runs"""
+    return {
+        "top_k": settings.TOP_K,
+        "model": settings.CHAT_MODEL,
+        "temperature": settings.TEMPERATURE,
+        "prompt_version": settings.PROMPT_VERSION,
+    }
+
+
+class EvaluationCheckpoint:
+    """Append-only JSONL log of evaluated cases, so an interrupted run resumes where it stopped"""
+
+    def __init__(self, path: Path, dataset_name: str):
+        self.path = path
+        self.header = {"dataset_name": dataset_name, "rag_params": rag_params()}
+
+    def load(self) -> Dict[int, Dict]:
+        """Load the results of the cases already evaluated by a run with the same dataset and parameters"""
+        if not self.path.exists():
+            return {}
+        with open(self.path, "r", encoding="utf-8") as f:
+            lines = [json.loads(line) for line in f if line.strip()]
+        if not lines or lines[0] != self.header:
+            logger.warning(f"Ignoring checkpoint {self.path} of a run with another dataset or parameters")
+            return {}
+        return {line["case_index"]: line["result"] for line in lines[1:]}
+
+    def start(self, completed: Dict[int, Dict]) -> None:
+        """Start a checkpoint, keeping the completed cases"""
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write(json.dumps(self.header, ensure_ascii=False) + "\n")
+            for case_index, result in sorted(completed.items()):
+                f.write(json.dumps({"case_index": case_index, "result": result}, ensure_ascii=False) + "\n")
+
+    def append(self, case_index: int, result: Dict) -> None:
+        """Record an evaluated case"""
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"case_index": case_index, "result": result}, ensure_ascii=False) + "\n")
+
+    def remove(self) -> None:
+        self.path.unlink(missing_ok=True)
+
+
 class RAGEvaluator:
-    def __init__(self):
-        self.rag_chain = RAGChain()
+    def __init__(self, rag_chain: RAGChain, concurrency: int = settings.EVALUATION_CONCURRENCY):
+        self.rag_chain = rag_chain
+        self.concurrency = concurrency
         self.evaluator_llm = ChatOpenAI(
             model=settings.EVALUATION_MODEL,
             temperature=settings.TEMPERATURE,
             seed=settings.SEED,
-            openai_api_key=settings.OPENAI_API_KEY,
+            openai_api_key=settings.OPENAI_API_KEY,  # type: ignore[call-arg]
         )
         self.eval_prompt = ChatPromptTemplate.from_messages([("system", EVAL_PROMPT)])
         self.output_parser = JsonOutputParser()
@@ -62,33 +114,73 @@ class RAGEvaluator:
 
         return result
 
-    async def evaluate_test_set(self, test_file: Path) -> List[Dict]:
-        """Evaluate entire test set"""
-        results = []
+    async def evaluate_case(self, case: Dict[str, str]) -> Dict:
+        """Generate and evaluate the response to a test case, timing each stage"""
+        latencies = {}
+        start = time.perf_counter()
+        tokens = []
+        async for event in self.rag_chain.stream_response(case["question"]):
+            if event["event"] == "sources":
+                latencies["retrieval"] = time.perf_counter() - start
+            else:
+                tokens.append(event["data"])
+        response = "".join(tokens)
+        latencies["generation"] = time.perf_counter() - start - latencies["retrieval"]
+
+        start = time.perf_counter()
+        evaluation = await self.evaluate_single_response(
+            question=case["question"], ground_truth=case["ground_truth"], response=response
+        )
+        latencies["judging"] = time.perf_counter() - start
+
+        return {
+            "question": case["question"],
+            "ground_truth": case["ground_truth"],
+            "rag_response": response,
+            "evaluation": evaluation,
+            "latencies_ms": {stage: latency * 1000 for stage, latency in latencies.items()},
+        }
+
+    async def evaluate_test_set(self, test_file: Path, checkpoint: EvaluationCheckpoint) -> List[Dict]:
+        """
+        Evaluate entire test set, evaluating up to `concurrency` cases at once
 
+        Evaluated cases are checkpointed as they complete. If some cases fail, the others are still evaluated and
+        the error is raised at the end, so running the evaluation again only evaluates the failed cases.
+        """
         with open(test_file, "r", encoding="utf-8") as f:
             reader = csv.DictReader(f, delimiter=";")
             test_cases = list(reader)
 
-        for case in tqdm(test_cases, desc="Evaluating responses"):
-            # Generate RAG response
-            response, _ = await self.rag_chain.generate_response(case["question"])
+        results = checkpoint.load()
+        if results:
+            logger.info(f"Resuming evaluation: {len(results)}/{len(test_cases)} cases already evaluated")
+        checkpoint.start(results)
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        errors = []
 
-            # Evaluate response
-            evaluation = await self.evaluate_single_response(
-                question=case["question"], ground_truth=case["ground_truth"], response=response
-            )
+        async def evaluate(case_index: int, case: Dict[str, str]) -> None:
+            async with semaphore:
+                try:
+                    result = await self.evaluate_case(case)
+                except Exception as e:
+                    logger.error(f"Error evaluating case {case_index}: {e}")
+                    errors.append(e)
+                    return
+            results[case_index] = result
+            checkpoint.append(case_index, result)
+            pbar.update(1)
 
-            results.append(
-                {
-                    "question": case["question"],
-                    "ground_truth": case["ground_truth"],
-                    "rag_response": response,
-                    "evaluation": evaluation,
-                }
-            )
+        with tqdm(total=len(test_cases), initial=len(results), desc="Evaluating responses") as pbar:
+            await asyncio.gather(*(evaluate(i, case) for i, case in enumerate(test_cases) if i not in results))
 
-        return results
+        if errors:
+            raise RuntimeError(
+                f"{len(errors)} cases failed, run the evaluation again to resume from {checkpoint.path}"
+            ) from errors[0]
+
+        return [results[i] for i in range(len(test_cases))]
 
     def calculate_avg_scores(self, results: List[Dict]) -> Dict:
         """Calculate average scores from evaluation results"""
@@ -101,23 +193,22 @@ class RAGEvaluator:
 
         return avg_scores
 
-    def save_results(self, results: List[Dict], output_file: Path):
+    def calculate_latencies(self, results: List[Dict]) -> Dict:
+        """Calculate mean, median and 95th percentile latencies of each stage, in milliseconds"""
+        return {stage: summarize_latencies([r["latencies_ms"][stage] for r in results]) for stage in STAGES}
+
+    def save_results(self, results: List[Dict], output_file: Path, dataset_name: str):
         """Save evaluation results to JSON file"""
         # Add metadata to results
         evaluation_record = {
             "evaluation_id": str(uuid.uuid4()),
             "timestamp": datetime.datetime.now().isoformat(),
-            "dataset_name": settings.EVALUATION_DATASET,
-            "rag_params": {
-                "top_k": settings.TOP_K,
-                "model": settings.CHAT_MODEL,
-                "temperature": settings.TEMPERATURE,
-                "prompt_version": settings.PROMPT_VERSION,
-            },
+            "dataset_name": dataset_name,
+            "rag_params": rag_params(),
             "scores": self.calculate_avg_scores(results),
+            "latencies": self.calculate_latencies(results),
             "results": results,
         }
-
         # Save as JSON, loading existing results if file exists
         output_file = output_file.with_suffix(".json")
         existing_results = []
@@ -136,27 +227,42 @@ class RAGEvaluator:
 
 
 async def main():
-    evaluator = RAGEvaluator()
-
     # Get script directory
     script_dir = Path(__file__).parent
-    test_file = script_dir / settings.EVALUATION_DATASET
+
+    parser = argparse.ArgumentParser(description="Evaluate RAG responses with an LLM judge")
+    parser.add_argument("--dataset", type=Path, default=script_dir / settings.EVALUATION_DATASET)
+    parser.add_argument("--concurrency", type=int, default=settings.EVALUATION_CONCURRENCY)
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint of an interrupted run")
+    args = parser.parse_args()
+
     output_file = script_dir / "evaluation_results"  # Extension will be added in save_results
+    checkpoint = EvaluationCheckpoint(script_dir / "evaluation_checkpoint.jsonl", dataset_name=args.dataset.name)
+    if args.restart:
+        checkpoint.remove()
+
+    # Cached answers would skip retrieval and generation, so the evaluated chain has no answer cache
+    rag_chain = RAGChain(vector_store=create_vector_store(), llm=OpenAILLM())
+    evaluator = RAGEvaluator(rag_chain, concurrency=args.concurrency)
 
     # Run evaluation
-    results = await evaluator.evaluate_test_set(test_file)
+    results = await evaluator.evaluate_test_set(args.dataset, checkpoint)
 
     # Save results
-    evaluator.save_results(results, output_file)
+    evaluator.save_results(results, output_file, dataset_name=args.dataset.name)
+    checkpoint.remove()
 
     # Calculate and display average scores
     avg_scores = evaluator.calculate_avg_scores(results)
+    latencies = evaluator.calculate_latencies(results)
 
     print("\nEvaluation Results:")
     print(f"Average Correctness Score: {avg_scores['correctness']:.2f}/5")
     print(f"Average Completeness Score: {avg_scores['completeness']:.2f}/5")
     print(f"Average Relevance Score: {avg_scores['relevance']:.2f}/5")
     print(f"Average Overall Score: {avg_scores['overall']:.2f}/5")
+    for stage, metrics in latencies.items():
+        print(f"{stage.capitalize()} latency: mean={metrics['mean_ms']:.0f}ms, p95={metrics['p95_ms']:.0f}ms")
     print(f"\nDetailed results saved to: {output_file.with_suffix('.json')}")
 
 
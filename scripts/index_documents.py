@@ -1,47 +1,96 @@
 import asyncio
 import logging
+import sys
 
-from langchain_core.documents import Document as LangchainDocument
 from tqdm import tqdm
 
 from emush_rag_chatbot.config import settings
-from emush_rag_chatbot.document_loader import DocumentLoader
+from emush_rag_chatbot.document_loader import DocumentLoader, to_langchain_document
+from emush_rag_chatbot.embeddings import is_local_model
+from emush_rag_chatbot.index_manifest import IndexManifest, IndexUpdate
+from emush_rag_chatbot.ingestion import EmbeddingPipeline
+from emush_rag_chatbot.numpy_vector_store import NumpyIndexWriter
 from emush_rag_chatbot.vector_store import ChromaVectorStore
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+def export_indexes(vector_store: ChromaVectorStore) -> None:
+    """
+    Export indexed documents to the memory-mapped index of NumpyVectorStore, along with the BM25 index
+
+    Documents are read from Chroma a page at a time, source by source, and their embeddings written to the memory-mapped
+    NumPy index as they are read, so embeddings are never all in memory. Only BM25 postings are held until the end.
+    """
+    counts = vector_store.count_documents_by_source()
+    writer = NumpyIndexWriter(settings.NUMPY_INDEX_DIR, sum(counts.values()))
+    for source in sorted(counts):
+        # Reuse the embeddings stored in Chroma, so the NumPy index costs no embedding call
+        for documents, embeddings in vector_store.iter_documents_and_embeddings(source):
+            writer.write(documents, embeddings)
+    writer.close()
+
+
 async def main():
-    """Index documents from the data directory into the vector store"""
+    """Index new and changed documents from the data directory into the vector store"""
     try:
         # Initialize document loader and vector store
         loader = DocumentLoader(str(settings.DATA_DIR))
         vector_store = ChromaVectorStore()
+        manifest = IndexManifest.load(settings.INDEX_MANIFEST_PATH)
 
-        # Load documents
-        documents = loader.load_documents()
+        # Embeddings of different models cannot be compared: re-embed every chunk when the model or dimension changed.
+        # The dimension of indexes built before manifests recorded it is read from the collection.
+        dimension = len(vector_store.embeddings.embed_query("dimension"))
+        if manifest.dimension is None:
+            manifest.dimension = vector_store.embedding_dimension()
+        if not manifest.uses_embeddings(settings.EMBEDDING_MODEL, dimension):
+            logger.warning(
+                f"Embedding model changed from {manifest.embedding_model} ({manifest.dimension} dimensions) to "
+                f"{settings.EMBEDDING_MODEL} ({dimension} dimensions): embedding every chunk again"
+            )
+            vector_store.reset()
+            manifest = IndexManifest()
+        manifest.embedding_model, manifest.dimension = settings.EMBEDDING_MODEL, dimension
 
-        # Convert to Langchain documents
-        langchain_docs = []
-        for doc in documents:
-            langchain_docs.append(
-                LangchainDocument(
-                    page_content=doc.content, metadata={"title": doc.title, "source": doc.source, "link": doc.link}
-                )
+        # Compare streamed chunks with indexed chunks. Without a manifest, compare with the collection to drop chunks
+        # indexed before manifests existed.
+        update = IndexUpdate(manifest, indexed_ids=None if manifest.chunks else set(vector_store.get_ids()))
+        chunks = (to_langchain_document(doc) for doc in loader.iter_documents())
+
+        # Embed new and changed chunks as they are loaded, concurrently under the API rate limits, writing them in bulk
+        if is_local_model():
+            # Local embeddings are not rate limited, and run on the CPU so concurrent batches would not help
+            pipeline = EmbeddingPipeline(
+                vector_store.embeddings,
+                vector_store,
+                concurrency=1,
+                requests_per_minute=sys.maxsize,
+                tokens_per_minute=sys.maxsize,
             )
+        else:
+            pipeline = EmbeddingPipeline(vector_store.embeddings, vector_store)
+        with tqdm(desc="Indexing documents", unit="chunk") as pbar:
+            stats = await pipeline.run(update.new_chunks(chunks), on_progress=pbar.update)
+        logger.info(f"Index changes: {update.summary()}")
+
+        # Stale chunks are only known once every chunk was loaded. Chunks of files which failed to load were not all
+        # seen, so they would be taken for stale chunks: keep every indexed chunk then.
+        if not loader.failed_files:
+            vector_store.delete_documents(sorted(update.removed))
 
-        # Process documents in batches
-        batch_size = 10
-        total_batches = (len(langchain_docs) + batch_size - 1) // batch_size
+        update.apply(remove_stale=not loader.failed_files)
+        manifest.save(settings.INDEX_MANIFEST_PATH)
+        logger.info(f"Successfully indexed {stats.summary()}")
 
-        with tqdm(total=total_batches, desc="Indexing documents") as pbar:
-            for i in range(0, len(langchain_docs), batch_size):
-                batch = langchain_docs[i : i + batch_size]
-                await vector_store.add_documents(batch)
-                pbar.update(1)
+        export_indexes(vector_store)
 
-        logger.info(f"Successfully indexed {len(documents)} documents in {total_batches} batches")
+        if loader.failed_files:
+            raise RuntimeError(
+                f"Failed to load {', '.join(map(str, loader.failed_files))}: stale chunks were not deleted, fix these "
+                "files and index documents again"
+            )
 
     except Exception as e:
         logger.error(f"Error indexing documents: {e}")
@@ -0,0 +1,244 @@
+import argparse
+import asyncio
+import json
+import logging
+import math
+import random
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List
+
+import httpx
+from langchain_core.embeddings import DeterministicFakeEmbedding, Embeddings
+from langchain_core.messages import BaseMessage
+
+from emush_rag_chatbot.answer_cache import SemanticAnswerCache
+from emush_rag_chatbot.api import app, get_rag_chain
+from emush_rag_chatbot.benchmarking import load_questions, percentile
+from emush_rag_chatbot.config import settings
+from emush_rag_chatbot.document_loader import DocumentLoader, to_langchain_document
+from emush_rag_chatbot.index_manifest import chunk_id
+from emush_rag_chatbot.ingestion import EmbeddingPipeline
+from emush_rag_chatbot.llm import FakeLLM
+from emush_rag_chatbot.rag_chain import RAGChain
+from emush_rag_chatbot.synthetic_corpus import write_synthetic_corpus
+from emush_rag_chatbot.vector_store import ChromaVectorStore
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+LOOP_LAG_INTERVAL_SECONDS = 0.01
+
+
+class LatencyDistribution:
+    """Log-normal latency distribution, defined by its median and the standard deviation of its logarithm"""
+
+    def __init__(self, median_ms: float, sigma: float, rng: random.Random):
+        self.median_ms = median_ms
+        self.sigma = sigma
+        self.rng = rng
+
+    def sample(self) -> float:
+        """Draw a latency, in seconds"""
+        return self.median_ms / 1000 * math.exp(self.sigma * self.rng.gauss(0, 1))
+
+
+class LatencyLLM(FakeLLM):
+    """Fake language model answering after a latency drawn from a distribution"""
+
+    def __init__(self, latency: LatencyDistribution, response: str = "This is a test response"):
+        super().__init__(response)
+        self.latency = latency
+
+    async def invoke(self, input: Dict[str, Any] | list[BaseMessage], config: Dict[str, Any] | None = None) -> str:
+        await asyncio.sleep(self.latency.sample())
+        return self.response
+
+    async def astream(
+        self, input: Dict[str, Any] | list[BaseMessage], config: Dict[str, Any] | None = None
+    ) -> AsyncIterator[str]:
+        await asyncio.sleep(self.latency.sample())
+        async for token in super().astream(input, config):
+            yield token
+
+
+class LatencyEmbeddings(Embeddings):
+    """
+    Embeddings embedding queries after a latency drawn from a distribution
+
+    Like the OpenAI client called by the vector stores, synchronous query embeddings block the calling thread, so
+    they block the event loop when called from an endpoint.
+    """
+
+    def __init__(self, embeddings: Embeddings, latency: LatencyDistribution):
+        self.embeddings = embeddings
+        self.latency = latency
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        time.sleep(self.latency.sample())
+        return self.embeddings.embed_query(text)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        await asyncio.sleep(self.latency.sample())
+        return self.embeddings.embed_query(text)
+
+
+@dataclass
+class RequestResult:
+    latency_ms: float
+    ok: bool
+
+
+async def build_rag_chain(args: argparse.Namespace, work_dir: Path, rng: random.Random) -> RAGChain:
+    """Index a synthetic corpus in Chroma and build a RAG chain served by latency-injecting stand-ins"""
+    data_dir = work_dir / "data"
+    data_dir.mkdir()
+    write_synthetic_corpus(data_dir, args.documents, mean_length=10_000)
+    chunks = (to_langchain_document(doc) for doc in DocumentLoader(str(data_dir)).iter_documents())
+
+    embeddings = LatencyEmbeddings(
+        DeterministicFakeEmbedding(size=args.embedding_size),
+        LatencyDistribution(args.embedding_latency_ms, args.embedding_latency_sigma, rng),
+    )
+    vector_store = ChromaVectorStore(embeddings=embeddings, persist_directory=work_dir / "chroma")
+    await EmbeddingPipeline(embeddings, vector_store).run((chunk_id(doc), doc) for doc in chunks)
+
+    return RAGChain(
+        vector_store=vector_store,
+        llm=LatencyLLM(LatencyDistribution(args.llm_latency_ms, args.llm_latency_sigma, rng)),
+        answer_cache=SemanticAnswerCache() if args.answer_cache else None,
+    )
+
+
+async def send_request(client: httpx.AsyncClient, payload: Dict, stream: bool) -> RequestResult:
+    """Send a chat request, reading the whole response"""
+    start = time.perf_counter()
+    try:
+        if stream:
+            async with client.stream("POST", "/chat/stream", json=payload) as response:
+                body = "".join([chunk async for chunk in response.aiter_text()])
+            ok = response.status_code == 200 and "event: error" not in body
+        else:
+            response = await client.post("/chat", json=payload)
+            ok = response.status_code == 200
+    except Exception as e:
+        logger.error(f"Request failed: {e}")
+        ok = False
+    return RequestResult(latency_ms=(time.perf_counter() - start) * 1000, ok=ok)
+
+
+async def measure_loop_lag(lags: List[float], stop: asyncio.Event) -> None:
+    """Measure how late the event loop wakes up a sleeping task, in milliseconds"""
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(LOOP_LAG_INTERVAL_SECONDS)
+        lags.append((time.perf_counter() - start - LOOP_LAG_INTERVAL_SECONDS) * 1000)
+
+
+async def run_load(args: argparse.Namespace, questions: List[str], rng: random.Random) -> Dict[str, Any]:
+    """
+    Drive the API in-process for `duration` seconds
+
+    With an arrival rate, requests arrive as a Poisson process (open loop) and at most `concurrency` of them are
+    served at once, queueing time included in latencies. Without one, `concurrency` clients send requests back to
+    back (closed loop).
+    """
+    results: List[RequestResult] = []
+    lags: List[float] = []
+    stop = asyncio.Event()
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    def next_payload() -> tuple[Dict, bool]:
+        payload: Dict[str, Any] = {"query": rng.choice(questions)}
+        if rng.random() < args.history_ratio:
+            payload["chat_history"] = [{"human": rng.choice(questions), "assistant": "This is a test response"}]
+        return payload, rng.random() < args.stream_ratio
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://load-test", timeout=None) as client:
+
+        async def open_loop_request() -> None:
+            start = time.perf_counter()
+            async with semaphore:
+                result = await send_request(client, *next_payload())
+            results.append(RequestResult(latency_ms=(time.perf_counter() - start) * 1000, ok=result.ok))
+
+        async def closed_loop_client(deadline: float) -> None:
+            while time.perf_counter() < deadline:
+                results.append(await send_request(client, *next_payload()))
+
+        lag_monitor = asyncio.create_task(measure_loop_lag(lags, stop))
+        start = time.perf_counter()
+        deadline = start + args.duration
+        if args.rate:
+            requests = []
+            while time.perf_counter() < deadline:
+                requests.append(asyncio.create_task(open_loop_request()))
+                await asyncio.sleep(rng.expovariate(args.rate))
+            await asyncio.gather(*requests)
+        else:
+            await asyncio.gather(*(closed_loop_client(deadline) for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await lag_monitor
+
+    latencies = [result.latency_ms for result in results if result.ok]
+    errors = sum(not result.ok for result in results)
+    return {
+        "requests": len(results),
+        "errors": errors,
+        "error_rate": errors / len(results) if results else 0.0,
+        "throughput_rps": len(latencies) / elapsed,
+        "latency_ms": {f"p{q}": percentile(latencies, q / 100) for q in [50, 95, 99]},
+        "loop_lag_ms": {"p50": percentile(lags, 0.5), "p99": percentile(lags, 0.99), "max": max(lags, default=0.0)},
+    }
+
+
+async def main():
+    script_dir = Path(__file__).parent
+
+    parser = argparse.ArgumentParser(description="Load test the chat API with latency-injecting LLM and embeddings")
+    parser.add_argument("--duration", type=float, default=30, help="Test duration in seconds")
+    parser.add_argument("--concurrency", type=int, default=16, help="Clients, or maximum requests served at once")
+    parser.add_argument("--rate", type=float, help="Arrival rate in requests per second (closed loop if not set)")
+    parser.add_argument("--stream-ratio", type=float, default=0.0, help="Fraction of requests to /chat/stream")
+    parser.add_argument("--history-ratio", type=float, default=0.0, help="Fraction of requests with chat history")
+    parser.add_argument("--datasets", type=Path, nargs="+", default=sorted(script_dir.glob("test_set*.csv")))
+    parser.add_argument("--documents", type=int, default=1_000, help="Documents of the synthetic corpus")
+    parser.add_argument("--embedding-size", type=int, default=256)
+    parser.add_argument("--llm-latency-ms", type=float, default=1_000, help="Median LLM latency")
+    parser.add_argument("--llm-latency-sigma", type=float, default=0.5)
+    parser.add_argument("--embedding-latency-ms", type=float, default=150, help="Median query embedding latency")
+    parser.add_argument("--embedding-latency-sigma", type=float, default=0.3)
+    parser.add_argument("--answer-cache", action="store_true", help="Enable the semantic answer cache")
+    parser.add_argument("--output", type=Path, help="Write the report to a JSON file")
+    args = parser.parse_args()
+
+    rng = random.Random(settings.SEED)
+    with tempfile.TemporaryDirectory() as work_dir:
+        rag_chain = await build_rag_chain(args, Path(work_dir), rng)
+        app.dependency_overrides[get_rag_chain] = lambda: rag_chain
+
+        # Per-request logs would dominate the measured loop lag
+        logging.getLogger("emush_rag_chatbot").setLevel(logging.WARNING)
+        report = await run_load(args, load_questions(args.datasets), rng)
+
+    mode = f"{args.rate} requests/s" if args.rate else "closed loop"
+    print(f"\nLoad test over {args.duration}s, {mode}, concurrency {args.concurrency}:")
+    print(f"Requests: {report['requests']}, errors: {report['errors']} ({report['error_rate']:.1%})")
+    print(f"Throughput: {report['throughput_rps']:.1f} requests/s")
+    print("Latency: " + ", ".join(f"{name}={value:.0f}ms" for name, value in report["latency_ms"].items()))
+    print("Event loop lag: " + ", ".join(f"{name}={value:.1f}ms" for name, value in report["loop_lag_ms"].items()))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"params": {k: str(v) for k, v in vars(args).items()}, "report": report}, f, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,77 @@
+import asyncio
+from typing import List
+
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from emush_rag_chatbot.llm import FakeLLM
+
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+    """Deterministic fake embeddings counting query and document embedding calls"""
+
+    query_calls: int = 0
+
+    document_calls: int = 0
+
+    def embed_query(self, text: str) -> List[float]:
+        self.query_calls += 1
+        return super().embed_query(text)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.document_calls += 1
+        return super().embed_documents(texts)
+
+
+class CountingLLM(FakeLLM):
+    """Fake language model recording its prompts, answering after an optional delay"""
+
+    def __init__(self, response: str = "This is a test response", delay: float = 0.0):
+        super().__init__(response=response)
+        self.delay = delay
+        self.prompts: List[str] = []
+
+    @property
+    def calls(self) -> int:
+        return len(self.prompts)
+
+    async def invoke(self, input, config=None):
+        self.prompts.append(input[0].content)
+        await asyncio.sleep(self.delay)
+        # `{calls}` in the response is replaced by the number of calls, to tell responses apart
+        return self.response.format(calls=self.calls)
+
+
+class FailingLLM(FakeLLM):
+    """Fake language model failing for questions about bolets"""
+
+    async def invoke(self, input, config=None):
+        if "bolets" in str(input[-1].content):
+            raise RuntimeError("LLM unavailable")
+        return await super().invoke(input, config)
+
+    async def astream(self, input, config=None):
+        if "bolets" in str(input[-1].content):
+            raise RuntimeError("LLM unavailable")
+        async for token in super().astream(input, config):
+            yield token
+
+
+@pytest.fixture
+def embeddings():
+    return CountingEmbeddings(size=8)
+
+
+@pytest.fixture
+def llm():
+    return CountingLLM(response="summary {calls}")
+
+
+@pytest.fixture
+def slow_llm():
+    return CountingLLM(response="Mushrooms are fungi", delay=0.05)
+
+
+@pytest.fixture
+def failing_llm():
+    return FailingLLM(response="Fungi")
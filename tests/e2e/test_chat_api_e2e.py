@@ -43,3 +43,16 @@ def test_chat_endpoint_basic(client):
         assert source.content
         assert source.source in ["Twinpedia", "Mushpedia", "Aide aux Bolets", "Mush Forums"]
         assert source.link
+
+
+def test_chat_stream_endpoint(client):
+    """Test streaming chat interaction sends sources, tokens, then done"""
+    request = ChatRequest(query="What are mushrooms in eMush?")
+    with client.stream("POST", "/chat/stream", json=request.model_dump()) as response:
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = [line.removeprefix("event: ") for line in response.iter_lines() if line.startswith("event: ")]
+
+    assert events[0] == "sources"
+    assert "token" in events
+    assert events[-1] == "done"
@@ -0,0 +1,50 @@
+import pytest
+from langchain_core.documents import Document
+
+from emush_rag_chatbot.answer_cache import SemanticAnswerCache
+
+
+@pytest.fixture
+def answer_cache():
+    return SemanticAnswerCache(similarity_threshold=0.9, max_size=2)
+
+
+@pytest.fixture
+def sources():
+    return [Document(page_content="Mushrooms are fungi", metadata={"source": "Twinpedia"})]
+
+
+def test_lookup_returns_answer_of_similar_query(answer_cache, sources):
+    """Test that a near-duplicate query is answered from the cache"""
+    answer_cache.store([1.0, 0.0, 0.0], version="v1", response="Fungi", sources=sources)
+
+    assert answer_cache.lookup([0.99, 0.05, 0.0], version="v1") == ("Fungi", sources)
+    assert answer_cache.hits == 1
+
+
+def test_lookup_misses_dissimilar_query(answer_cache, sources):
+    """Test that a query outside of the similarity threshold is not answered from the cache"""
+    answer_cache.store([1.0, 0.0, 0.0], version="v1", response="Fungi", sources=sources)
+
+    assert answer_cache.lookup([0.0, 1.0, 0.0], version="v1") is None
+    assert answer_cache.misses == 1
+
+
+def test_version_change_invalidates_answers(answer_cache, sources):
+    """Test that answers computed with other settings are dropped"""
+    answer_cache.store([1.0, 0.0, 0.0], version="v1", response="Fungi", sources=sources)
+
+    assert answer_cache.lookup([1.0, 0.0, 0.0], version="v2") is None
+    assert answer_cache.stats()["size"] == 0
+
+
+def test_least_recently_used_answer_is_evicted(answer_cache, sources):
+    """Test that the cache stays bounded by evicting the least recently used answer"""
+    answer_cache.store([1.0, 0.0, 0.0], version="v1", response="first", sources=sources)
+    answer_cache.store([0.0, 1.0, 0.0], version="v1", response="second", sources=sources)
+    answer_cache.lookup([1.0, 0.0, 0.0], version="v1")
+    answer_cache.store([0.0, 0.0, 1.0], version="v1", response="third", sources=sources)
+
+    assert answer_cache.lookup([1.0, 0.0, 0.0], version="v1") == ("first", sources)
+    assert answer_cache.lookup([0.0, 1.0, 0.0], version="v1") is None
+    assert answer_cache.lookup([0.0, 0.0, 1.0], version="v1") == ("third", sources)
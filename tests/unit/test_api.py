@@ -0,0 +1,82 @@
+import json
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from langchain_core.documents import Document
+
+from emush_rag_chatbot.api import app, get_rag_chain
+from emush_rag_chatbot.rag_chain import RAGChain
+from emush_rag_chatbot.vector_store import FakeVectorStore
+
+
+@pytest.fixture
+def rag_chain(failing_llm):
+    documents = [
+        Document(page_content="Mushrooms are fungi", metadata={"source": "Twinpedia"}),
+        Document(page_content="Bolets are a type of mushroom", metadata={"source": "Aide aux Bolets"}),
+    ]
+    return RAGChain(vector_store=FakeVectorStore(documents=documents), llm=failing_llm)
+
+
+@pytest.fixture
+def client(rag_chain):
+    app.dependency_overrides[get_rag_chain] = lambda: rag_chain
+    yield TestClient(app)
+    app.dependency_overrides.clear()
+
+
+def read_events(client, query):
+    """Send a query to the streaming endpoint, and return its Server-Sent Events as (event, data) pairs"""
+    with client.stream("POST", "/chat/stream", json={"query": query}) as response:
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        lines = [line for line in response.iter_lines() if line]
+    return [
+        (event.removeprefix("event: "), json.loads(data.removeprefix("data: ")))
+        for event, data in zip(lines[::2], lines[1::2])
+    ]
+
+
+def test_chat_stream_endpoint_sends_sources_tokens_then_done(client):
+    """Test that the streaming endpoint sends the sources, then the response tokens, then a done event"""
+    events = read_events(client, "What are mushrooms?")
+
+    assert events[0][0] == "sources"
+    assert [source["source"] for source in events[0][1]] == ["Twinpedia", "Aide aux Bolets"]
+    assert all(event == "token" for event, _ in events[1:-1])
+    assert "".join(data for _, data in events[1:-1]) == "Fungi"
+    assert events[-1] == ("done", {})
+
+
+def test_chat_stream_endpoint_sends_error_event(client):
+    """Test that an error occurring once the stream started is sent as an error event"""
+    events = read_events(client, "What are bolets?")
+
+    assert [event for event, _ in events] == ["sources", "error"]
+    assert "LLM unavailable" in events[-1][1]["detail"]
+
+
+def test_chat_batch_endpoint_returns_results_with_errors(client):
+    """Test that the batch endpoint returns a response or an error for each query, in order"""
+    response = client.post("/chat/batch", json={"queries": ["What are mushrooms?", "What are bolets?"]})
+
+    results = response.json()["results"]
+    assert response.status_code == 200
+    assert results[0]["response"] == "Fungi"
+    assert results[0]["sources"][0]["source"] == "Twinpedia"
+    assert results[1]["response"] is None
+    assert "LLM unavailable" in results[1]["error"]
+
+
+def test_ready_endpoint_reports_warm_up(client):
+    """Test that the app becomes ready once the RAG chain is warmed up at startup"""
+    with client:
+        deadline = time.monotonic() + 5
+        while client.get("/ready").status_code != 200 and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        response = client.get("/ready")
+
+    assert response.status_code == 200
+    assert response.json() == {"status": "ready"}
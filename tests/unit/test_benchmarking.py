@@ -0,0 +1,23 @@
+from emush_rag_chatbot.benchmarking import load_questions, percentile, summarize_latencies
+
+
+def test_load_questions_reads_comma_and_semicolon_separated_test_sets(tmp_path):
+    """Test that questions of both test set formats are loaded once, in order"""
+    (tmp_path / "test_set.csv").write_text("question,ground_truth\nWhat are mushs?,Aliens\n", encoding="utf-8")
+    (tmp_path / "test_set_v2.csv").write_text(
+        "question;ground_truth\nHow to repair the PILGRED?;With a wrench, quickly\nWhat are mushs?;Aliens\n",
+        encoding="utf-8",
+    )
+
+    assert load_questions([tmp_path / "test_set.csv", tmp_path / "test_set_v2.csv"]) == [
+        "What are mushs?",
+        "How to repair the PILGRED?",
+    ]
+
+
+def test_summarize_latencies():
+    """Test that latencies are summarized by their mean and nearest-rank percentiles"""
+    latencies = [float(latency) for latency in range(1, 101)]
+
+    assert summarize_latencies(latencies) == {"mean_ms": 50.5, "p50_ms": 51.0, "p95_ms": 96.0}
+    assert percentile([], 0.95) == 0.0
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+
+from emush_rag_chatbot.bm25 import BM25Index, tokenize
+
+
+@pytest.fixture
+def test_documents():
+    return [
+        Document(
+            page_content="La liste d'Eleesha contient au moins un Mush alpha.",
+            metadata={"source": "Mushpedia", "title": "Tabulatrice"},
+        ),
+        Document(
+            page_content="Bidouiller coûte 2 PA.",
+            metadata={"source": "Twinpedia", "title": "Compétences"},
+        ),
+        Document(
+            page_content="L'écholocateur augmente les chances de visiter une section hydrocarbure.",
+            metadata={"source": "Mushpedia", "title": "Écholocateur"},
+        ),
+    ]
+
+
+@pytest.fixture
+def bm25_index(test_documents):
+    return BM25Index(test_documents)
+
+
+def test_tokenize_folds_case_and_accents():
+    """Test that tokens are lowercase, accent-free and without stopwords"""
+    assert tokenize("Le méssage de l'Écholocateur") == ["message", "echolocateur"]
+
+
+def test_search_finds_exact_game_terms(bm25_index):
+    """Test that exact game terms rank their document first"""
+    results = bm25_index.search("liste d'eleesha", k=2)
+
+    assert results[0][0].metadata["title"] == "Tabulatrice"
+    assert len(results) == 1
+
+
+def test_add_documents_extends_index(bm25_index):
+    """Test that documents added later are found in their source"""
+    bm25_index.add_documents([Document(page_content="Le PILGRED est réparé.", metadata={"source": "Mush Forums"})])
+
+    results = bm25_index.search_by_sources("pilgred", k=1, sources=["Mush Forums", "Mushpedia"])
+
+    assert [doc.page_content for doc, _ in results["Mush Forums"]] == ["Le PILGRED est réparé."]
+    assert results["Mushpedia"] == []
+
+
+def test_search_by_sources(bm25_index):
+    """Test that results are grouped by source"""
+    results = bm25_index.search_by_sources(
+        "echolocateur bidouiller", k=3, sources=["Mushpedia", "Twinpedia", "Mush Forums"]
+    )
+
+    assert [doc.metadata["title"] for doc, _ in results["Mushpedia"]] == ["Écholocateur"]
+    assert [doc.metadata["title"] for doc, _ in results["Twinpedia"]] == ["Compétences"]
+    assert results["Mush Forums"] == []
+
+
+def test_save_and_load(bm25_index, test_documents, tmp_path):
+    """Test that a persisted index is memory-mapped, returns the same results and is read-only"""
+    bm25_index.save(tmp_path)
+
+    loaded_index = BM25Index.load(tmp_path, test_documents)
+
+    assert isinstance(loaded_index.posting_rows, np.memmap)
+    assert loaded_index.search("tabulatrice", k=1) == bm25_index.search("tabulatrice", k=1)
+    assert loaded_index.search_by_sources("echolocateur", k=1, sources=["Mushpedia"]) == bm25_index.search_by_sources(
+        "echolocateur", k=1, sources=["Mushpedia"]
+    )
+    with pytest.raises(ValueError):
+        loaded_index.add_documents(test_documents)
+    with pytest.raises(ValueError):
+        BM25Index.load(tmp_path, test_documents[:2])
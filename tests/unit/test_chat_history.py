@@ -0,0 +1,91 @@
+import pytest
+
+from emush_rag_chatbot.chat_history import ChatHistoryManager
+
+
+def make_history(turns: int):
+    return [{"human": f"question {i}", "assistant": f"answer {i}"} for i in range(turns)]
+
+
+def test_format_keeps_short_history_verbatim(llm):
+    """Test that short conversations are sent as is, without summarization"""
+    manager = ChatHistoryManager(llm, max_turns=4)
+
+    formatted = manager.format(make_history(2))
+
+    assert formatted == "Human: question 0\nAssistant: answer 0\nHuman: question 1\nAssistant: answer 1"
+    assert llm.prompts == []
+
+
+@pytest.mark.asyncio
+async def test_format_replaces_older_exchanges_with_summary(llm):
+    """Test that exchanges past the turn budget are replaced by their summary"""
+    manager = ChatHistoryManager(llm, max_turns=2)
+    history = make_history(5)
+    await manager.summarize(history[:3])
+
+    formatted = manager.format(history)
+
+    assert formatted.startswith("Summary of the earlier conversation: summary 1\n")
+    assert "question 2" not in formatted
+    assert formatted.endswith("Human: question 4\nAssistant: answer 4")
+
+
+@pytest.mark.asyncio
+async def test_format_summarizes_ahead_of_the_conversation_incrementally(llm):
+    """Test that each exchange is summarized once, before the request where it is folded"""
+    manager = ChatHistoryManager(llm, max_turns=2)
+    history = make_history(6)
+
+    for turns in range(1, len(history) + 1):
+        formatted = manager.format(history[:turns])
+        await manager.wait_for_summaries()
+        if turns > 2:
+            assert f"Summary of the earlier conversation: summary {turns - 2}" in formatted
+
+    # One summary per folded exchange, the next one included, each extending the previous one with a single exchange
+    assert len(llm.prompts) == 5
+    assert "summary 2" in llm.prompts[2]
+    assert "question 2" in llm.prompts[2] and "question 1" not in llm.prompts[2]
+
+
+def test_format_respects_token_budget(llm):
+    """Test that long exchanges are folded even within the turn budget"""
+    manager = ChatHistoryManager(llm, max_turns=4, max_tokens=50)
+    history = [{"human": "x" * 300, "assistant": "y"}, {"human": "short question", "assistant": "short answer"}]
+
+    formatted = manager.format(history)
+
+    assert formatted == "Human: short question\nAssistant: short answer"
+
+
+def test_format_keeps_unsummarized_exchanges_verbatim_within_token_budget(llm):
+    """Test that older exchanges are not dropped while their summary is not ready yet"""
+    manager = ChatHistoryManager(llm, max_turns=2, max_tokens=1_000)
+    history = make_history(4)
+
+    formatted = manager.format(history)
+
+    assert "Summary of the earlier conversation" not in formatted
+    assert formatted.startswith("Human: question 0\n")
+    assert formatted.endswith("Human: question 3\nAssistant: answer 3")
+
+
+@pytest.mark.asyncio
+async def test_failed_background_summary_is_retried(llm, monkeypatch):
+    """Test that a failed background summary is forgotten so that the next exchange schedules it again"""
+    manager = ChatHistoryManager(llm, max_turns=2)
+    history = make_history(3)
+
+    async def fail(input, config=None):
+        raise RuntimeError("LLM unavailable")
+
+    monkeypatch.setattr(llm, "invoke", fail)
+    manager.format(history)
+    await manager.wait_for_summaries()
+    assert manager._pending == {}
+
+    monkeypatch.undo()
+    manager.format(history)
+    await manager.wait_for_summaries()
+    assert llm.prompts
@@ -0,0 +1,101 @@
+from langchain_core.documents import Document
+
+from emush_rag_chatbot.context_packer import EXCERPT_MARKER, ContextPacker, clean_content, excerpt
+
+
+def make_document(content: str, source: str = "Mushpedia", link: str = "https://mushpedia.com/page", chunk: int = 0):
+    return Document(page_content=content, metadata={"source": source, "link": link, "title": "Page", "chunk": chunk})
+
+
+def test_clean_content_removes_wiki_boilerplate():
+    """Test that navigation lines, footers and extra whitespace are removed"""
+    content = (
+        "Jump to: navigation, search\nFrom Twinpedia\n\nMushrooms    are fungi.\n\n\n\nThey grow in the garden.\n"
+        'Retrieved from "https://twin.tithom.fr/emush/Mushrooms"\nNavigation menu\nPersonal tools'
+    )
+
+    assert clean_content(content) == "Mushrooms are fungi.\n\nThey grow in the garden."
+
+
+def test_pack_drops_duplicate_and_overlapping_content():
+    """Test that duplicates are dropped and the overlap between consecutive chunks is sent once"""
+    overlap = "The Daedalus is the ship of the crew."
+    docs = [
+        make_document(f"Mushrooms are fungi. {overlap}", chunk=0),
+        make_document(f"{overlap} It travels towards Sol.", chunk=1),
+        make_document(f"Mushrooms are fungi. {overlap}", link="https://mushpedia.com/copy"),
+        make_document("Mushrooms are fungi.", source="Twinpedia", link="https://twin.tithom.fr/emush"),
+    ]
+
+    packed, stats = ContextPacker(max_tokens=1_000).pack(docs)
+
+    assert [doc.page_content for doc in packed] == [f"Mushrooms are fungi. {overlap}", "It travels towards Sol."]
+    assert stats.dropped_documents == 2
+    assert stats.saved_tokens > 0
+
+
+def test_pack_keeps_best_ranked_duplicate_whatever_its_chunk_index():
+    """Test that the best-ranked copy of duplicated content is kept even if another copy has a lower chunk index"""
+    docs = [
+        make_document("Spores infect the crew." * 5, link="https://mushpedia.com/spores", chunk=3),
+        make_document("Hunters attack the ship." * 5, link="https://mushpedia.com/hunters"),
+        make_document("Spores infect the crew." * 5, link="https://mushpedia.com/copy", chunk=0),
+    ]
+
+    packed, _ = ContextPacker(max_tokens=40, min_excerpt_tokens=100).pack(docs)
+
+    assert [doc.metadata["link"] for doc in packed] == ["https://mushpedia.com/spores"]
+
+
+def test_pack_strips_overlap_only_after_previous_chunk_is_packed():
+    """Test that a chunk ranked before the previous chunk of its document is sent whole"""
+    overlap = "The Daedalus is the ship of the crew."
+    docs = [
+        make_document(f"{overlap} It travels towards Sol.", chunk=1),
+        make_document(f"Mushrooms are fungi. {overlap}", chunk=0),
+    ]
+
+    packed, _ = ContextPacker(max_tokens=1_000).pack(docs)
+
+    assert [doc.page_content for doc in packed] == [doc.page_content for doc in docs]
+
+
+def test_pack_fills_budget_by_rank_within_source():
+    """Test that each source keeps its best document before lower-ranked ones are considered"""
+    docs = [
+        make_document("a" * 300, link="https://mushpedia.com/1"),
+        make_document("b" * 300, link="https://mushpedia.com/2"),
+        make_document("c" * 300, source="Twinpedia", link="https://twin.tithom.fr/1"),
+    ]
+
+    packed, stats = ContextPacker(max_tokens=200, min_excerpt_tokens=50).pack(docs)
+
+    assert [doc.metadata["link"] for doc in packed] == ["https://mushpedia.com/1", "https://twin.tithom.fr/1"]
+    assert stats.packed_tokens <= 200
+    assert stats.dropped_documents == 1
+
+
+def test_pack_excerpts_around_query_terms():
+    """Test that a document too long for the remaining budget is cut to the paragraphs matching the query"""
+    paragraphs = ["The garden grows plants. " * 4, "Hunters attack the ship during travels. " * 3, "Pilots fly. " * 8]
+    docs = [make_document("\n\n".join(paragraphs))]
+
+    packed, stats = ContextPacker(max_tokens=60, min_excerpt_tokens=20).pack(docs, query="Comment tuer les hunters ?")
+
+    assert packed[0].page_content == paragraphs[1].strip() + EXCERPT_MARKER
+    assert stats.excerpted_documents == 1
+
+
+def test_excerpt_cuts_long_paragraph_at_word_boundary():
+    """Test that a single paragraph longer than the budget is cut between words"""
+    assert excerpt("mushrooms are fungi growing everywhere", "fungi", 22) == "mushrooms are" + EXCERPT_MARKER
+
+
+def test_pack_keeps_documents_within_budget_unchanged():
+    """Test that clean documents fitting the budget are sent as is"""
+    docs = [make_document("Mushrooms are fungi."), make_document("Hunters attack.", source="Twinpedia")]
+
+    packed, stats = ContextPacker(max_tokens=1_000).pack(docs)
+
+    assert packed == docs
+    assert stats.saved_tokens == 0
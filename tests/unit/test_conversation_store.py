@@ -0,0 +1,147 @@
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi.testclient import TestClient
+from langchain_core.documents import Document
+
+from emush_rag_chatbot import api
+from emush_rag_chatbot.api import app, get_conversation_store, get_rag_chain
+from emush_rag_chatbot.conversation_store import ConversationStore
+from emush_rag_chatbot.llm import FakeLLM
+from emush_rag_chatbot.rag_chain import RAGChain
+from emush_rag_chatbot.vector_store import FakeVectorStore
+
+
+class HistoryRecordingRAGChain(RAGChain):
+    """RAG chain recording the chat history of each request"""
+
+    def __init__(self):
+        documents = [Document(page_content="Mushrooms are fungi", metadata={"source": "Twinpedia"})]
+        super().__init__(vector_store=FakeVectorStore(documents=documents), llm=FakeLLM(response="Fungi"))
+        self.chat_histories = []
+
+    async def generate_response(self, query, chat_history=None):
+        self.chat_histories.append(chat_history)
+        return await super().generate_response(query, chat_history)
+
+    async def stream_response(self, query, chat_history=None):
+        self.chat_histories.append(chat_history)
+        async for event in super().stream_response(query, chat_history):
+            yield event
+
+
+@pytest.fixture
+def client():
+    rag_chain = HistoryRecordingRAGChain()
+    store = ConversationStore(persist_path=None)
+    app.dependency_overrides[get_rag_chain] = lambda: rag_chain
+    app.dependency_overrides[get_conversation_store] = lambda: store
+    yield TestClient(app), rag_chain
+    app.dependency_overrides.clear()
+
+
+def test_get_conversation_store_is_created_once_across_threads(monkeypatch):
+    """Test that concurrent requests share a single conversation store"""
+    created = []
+
+    def slow_store():
+        time.sleep(0.05)
+        created.append(ConversationStore(persist_path=None))
+        return created[-1]
+
+    monkeypatch.setattr(api, "ConversationStore", slow_store)
+    monkeypatch.setattr(api, "_conversation_store", None)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        stores = list(executor.map(lambda _: get_conversation_store(), range(8)))
+
+    assert len(created) == 1
+    assert all(store is created[0] for store in stores)
+
+
+def test_append_and_get():
+    """Test that exchanges are appended in order and unknown conversations are empty"""
+    store = ConversationStore(persist_path=None)
+
+    store.append("conversation", "What are mushrooms?", "Fungi")
+    store.append("conversation", "And bolets?", "Mushrooms")
+
+    assert store.get("conversation") == [
+        {"human": "What are mushrooms?", "assistant": "Fungi"},
+        {"human": "And bolets?", "assistant": "Mushrooms"},
+    ]
+    assert store.get("unknown") == []
+
+
+def test_lru_and_ttl_eviction():
+    """Test that least recently used and expired conversations are forgotten"""
+    store = ConversationStore(max_size=1, persist_path=None)
+    store.append("first", "question", "answer")
+    store.append("second", "question", "answer")
+
+    assert store.get("first") == []
+
+    expiring_store = ConversationStore(ttl_seconds=-1, persist_path=None)
+    expiring_store.append("conversation", "question", "answer")
+    assert expiring_store.get("conversation") == []
+
+
+def test_persistent_store_survives_restart(tmp_path):
+    """Test that conversations persisted to SQLite are reloaded by a new store instance"""
+    persist_path = tmp_path / "conversations.sqlite3"
+    ConversationStore(persist_path=persist_path).append("conversation", "What are mushrooms?", "Fungi")
+
+    store = ConversationStore(persist_path=persist_path)
+    store.append("conversation", "And bolets?", "Mushrooms")
+
+    assert [exchange["human"] for exchange in ConversationStore(persist_path=persist_path).get("conversation")] == [
+        "What are mushrooms?",
+        "And bolets?",
+    ]
+
+
+def test_expired_conversations_are_purged_from_persistent_store(tmp_path):
+    """Test that expired conversations are deleted from SQLite on open and when appending, even if never requested"""
+    persist_path = tmp_path / "conversations.sqlite3"
+    ConversationStore(ttl_seconds=None, persist_path=persist_path).append("forgotten", "question", "answer")
+
+    store = ConversationStore(ttl_seconds=3600, persist_path=persist_path)
+    connection = sqlite3.connect(persist_path)
+    assert connection.execute("SELECT COUNT(*) FROM exchanges").fetchone() == (1,)
+    connection.execute("UPDATE conversations SET updated_at = 0")
+    connection.commit()
+    store._next_purge = 0
+    store.append("conversation", "What are mushrooms?", "Fungi")
+
+    assert connection.execute("SELECT conversation_id FROM conversations").fetchall() == [("conversation",)]
+    assert connection.execute("SELECT COUNT(*) FROM exchanges").fetchone() == (1,)
+    ConversationStore(ttl_seconds=-1, persist_path=persist_path)
+    assert connection.execute("SELECT COUNT(*) FROM conversations").fetchone() == (0,)
+
+
+def test_chat_endpoint_keeps_conversation_server_side(client):
+    """Test that turns of a conversation are appended server-side and sent back to the RAG chain"""
+    test_client, rag_chain = client
+
+    first = test_client.post("/chat", json={"query": "What are mushrooms?", "conversation_id": "conversation"})
+    with test_client.stream("POST", "/chat/stream", json={"query": "And bolets?", "conversation_id": "conversation"}):
+        pass
+    test_client.post("/chat", json={"query": "Thanks", "conversation_id": "conversation"})
+
+    assert first.json()["conversation_id"] == "conversation"
+    assert rag_chain.chat_histories == [
+        [],
+        [{"human": "What are mushrooms?", "assistant": "Fungi"}],
+        [{"human": "What are mushrooms?", "assistant": "Fungi"}, {"human": "And bolets?", "assistant": "Fungi"}],
+    ]
+
+
+def test_chat_endpoint_rejects_history_with_conversation_id(client):
+    """Test that a request cannot carry both a chat history and a conversation identifier"""
+    test_client, _ = client
+
+    response = test_client.post("/chat", json={"query": "Hi", "chat_history": [], "conversation_id": "conversation"})
+
+    assert response.status_code == 422
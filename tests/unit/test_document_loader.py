@@ -0,0 +1,139 @@
+import json
+
+import pytest
+
+from emush_rag_chatbot.document_loader import DocumentLoader, iter_json_records, to_langchain_document
+from emush_rag_chatbot.synthetic_corpus import write_synthetic_corpus
+
+
+def make_record(i: int, content: str = "Mushs infect humans") -> dict:
+    return {"title": f"Page {i}", "link": f"http://test.com/{i}", "source": "Mushpedia", "content": content}
+
+
+@pytest.fixture
+def records():
+    return [make_record(i, content=f"Page {i} content, with brackets ] and braces }} {i}") for i in range(50)]
+
+
+def test_iter_json_records_parses_array_incrementally(tmp_path, records):
+    """Test that records of a JSON array are parsed even when they span several reads"""
+    file_path = tmp_path / "data.json"
+    file_path.write_text(json.dumps(records, indent=4), encoding="utf-8")
+
+    assert list(iter_json_records(file_path, read_size=7)) == records
+
+
+def test_iter_json_records_parses_jsonl_and_single_record(tmp_path, records):
+    """Test that JSONL files and files holding a single record are supported"""
+    (tmp_path / "data.jsonl").write_text("\n".join(json.dumps(record) for record in records) + "\n", encoding="utf-8")
+    (tmp_path / "single.json").write_text(json.dumps(records[0]), encoding="utf-8")
+
+    assert list(iter_json_records(tmp_path / "data.jsonl")) == records
+    assert list(iter_json_records(tmp_path / "single.json", read_size=5)) == [records[0]]
+
+
+def test_iter_json_records_raises_on_truncated_array(tmp_path, records):
+    """Test that a truncated file is reported instead of silently ignored"""
+    file_path = tmp_path / "data.json"
+    file_path.write_text(json.dumps(records)[:-10], encoding="utf-8")
+
+    with pytest.raises(json.JSONDecodeError):
+        list(iter_json_records(file_path, read_size=64))
+
+
+def test_iter_json_records_raises_on_malformed_record_without_reading_the_rest(tmp_path, records):
+    """Test that a syntax error is raised at once, instead of being retried with the rest of the file"""
+    file_path = tmp_path / "data.json"
+    tail = ", ".join(json.dumps(record) for record in records * 200)
+    file_path.write_text(f'[{json.dumps(records[0])}, {{"title": "x",, "content": "y"}}, {tail}]', encoding="utf-8")
+
+    parsed = []
+    with pytest.raises(json.JSONDecodeError) as error:
+        for record in iter_json_records(file_path, read_size=64):
+            parsed.append(record)
+
+    assert parsed == [records[0]]
+    # Only the buffer around the malformed record was read
+    assert len(error.value.doc) < 1024
+
+
+def test_iter_documents_splits_long_documents(tmp_path):
+    """Test that long documents are split into numbered chunks while short ones are kept whole"""
+    long_content = " ".join(["Spores"] * 100)
+    records = [make_record(0), make_record(1, content=long_content)]
+    (tmp_path / "data.json").write_text(json.dumps(records), encoding="utf-8")
+    (tmp_path / "single.json").write_text(json.dumps(make_record(2)), encoding="utf-8")
+    loader = DocumentLoader(str(tmp_path), chunk_size=100, chunk_overlap=0)
+
+    documents = list(loader.iter_documents())
+
+    assert [doc.title for doc in documents[:1]] == ["Page 0"]
+    chunks = [doc for doc in documents if doc.title == "Page 1"]
+    assert len(chunks) > 1
+    assert [doc.metadata["chunk"] for doc in chunks] == list(range(len(chunks)))
+    assert all(doc.metadata["total_chunks"] == len(chunks) for doc in chunks)
+    assert documents[-1].title == "Page 2"
+
+
+def test_iter_documents_skips_invalid_records(tmp_path):
+    """Test that a record without content is skipped without dropping the rest of the file"""
+    records = [make_record(0), {"title": "Broken"}, make_record(1)]
+    (tmp_path / "data.jsonl").write_text("\n".join(json.dumps(record) for record in records), encoding="utf-8")
+
+    documents = DocumentLoader(str(tmp_path)).load_documents()
+
+    assert [doc.title for doc in documents] == ["Page 0", "Page 1"]
+
+
+def test_process_pool_gives_the_same_chunks_as_serial_mode(tmp_path):
+    """Test that splitting documents in worker processes keeps the serial output and order"""
+    records = [make_record(i, content=" ".join([f"Spores{i}"] * (i * 10 + 1))) for i in range(30)]
+    (tmp_path / "data.json").write_text(json.dumps(records), encoding="utf-8")
+    (tmp_path / "more.jsonl").write_text("\n".join(json.dumps(record) for record in records[:5]), encoding="utf-8")
+
+    serial = list(DocumentLoader(str(tmp_path), chunk_size=100, chunk_overlap=10).iter_documents())
+    parallel = list(
+        DocumentLoader(str(tmp_path), chunk_size=100, chunk_overlap=10, workers=2, records_per_task=4).iter_documents()
+    )
+
+    assert len(serial) > len(records)
+    assert parallel == serial
+
+
+def test_synthetic_corpus_chunks_convert_to_langchain_documents(tmp_path):
+    """Test that chunks of the synthetic corpus become Langchain documents carrying their title, source and position"""
+    write_synthetic_corpus(tmp_path, documents=3, mean_length=2_000)
+
+    documents = [
+        to_langchain_document(doc)
+        for doc in DocumentLoader(str(tmp_path), chunk_size=500, chunk_overlap=0).iter_documents()
+    ]
+
+    assert {doc.metadata["title"] for doc in documents} == {"Page 0", "Page 1", "Page 2"}
+    assert all(doc.page_content and doc.metadata["source"] for doc in documents)
+    assert max(doc.metadata["chunk"] for doc in documents) > 0
+
+
+def test_iter_documents_records_files_failing_to_load(tmp_path):
+    """Test that files which cannot be parsed are recorded, while other files are still loaded"""
+    (tmp_path / "broken.jsonl").write_text("{not json}\n", encoding="utf-8")
+    (tmp_path / "data.json").write_text(json.dumps([make_record(0)]), encoding="utf-8")
+    loader = DocumentLoader(str(tmp_path))
+
+    documents = loader.load_documents()
+
+    assert [doc.title for doc in documents] == ["Page 0"]
+    assert loader.failed_files == [tmp_path / "broken.jsonl"]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_iter_documents_keeps_records_read_before_a_parsing_error(tmp_path, workers):
+    """Test that records parsed before a malformed line are loaded, and the file still reported as failed"""
+    lines = [json.dumps(make_record(i)) for i in range(3)] + ["{not json}", json.dumps(make_record(3))]
+    (tmp_path / "data.jsonl").write_text("\n".join(lines), encoding="utf-8")
+    loader = DocumentLoader(str(tmp_path), workers=workers, records_per_task=2)
+
+    documents = loader.load_documents()
+
+    assert [doc.title for doc in documents] == ["Page 0", "Page 1", "Page 2"]
+    assert loader.failed_files == [tmp_path / "data.jsonl"]
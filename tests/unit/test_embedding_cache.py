@@ -0,0 +1,98 @@
+import sqlite3
+
+from emush_rag_chatbot.embedding_cache import CachedEmbeddings, normalize_query
+
+
+def test_normalize_query():
+    """Test that case and whitespace differences are normalized away"""
+    assert normalize_query("  Liste   d'Eleesha\n") == normalize_query("liste d'eleesha")
+
+
+def test_cache_hit_skips_embedding_model(embeddings):
+    """Test that a repeated query is served from the cache"""
+    cache = CachedEmbeddings(embeddings, model="test-model", max_size=10, ttl_seconds=None, persist_path=None)
+
+    first = cache.embed_query("How to become mush?")
+    second = cache.embed_query("how to become MUSH?")
+
+    assert first == second
+    assert embeddings.query_calls == 1
+    assert cache.hits == 1
+    assert cache.misses == 1
+
+
+def test_lru_eviction(embeddings):
+    """Test that the least recently used entry is evicted when the cache is full"""
+    cache = CachedEmbeddings(embeddings, model="test-model", max_size=2, ttl_seconds=None, persist_path=None)
+
+    cache.embed_query("first")
+    cache.embed_query("second")
+    cache.embed_query("first")
+    cache.embed_query("third")
+    cache.embed_query("second")
+
+    assert embeddings.query_calls == 4
+    assert cache.stats()["size"] == 2
+
+
+def test_ttl_expiration(embeddings):
+    """Test that expired entries are recomputed"""
+    cache = CachedEmbeddings(embeddings, model="test-model", max_size=10, ttl_seconds=-1, persist_path=None)
+
+    cache.embed_query("first")
+    cache.embed_query("first")
+
+    assert embeddings.query_calls == 2
+
+
+def test_persistent_cache_survives_restart(embeddings, tmp_path):
+    """Test that embeddings persisted to SQLite are reused by a new cache instance"""
+    persist_path = tmp_path / "embedding_cache.sqlite3"
+    CachedEmbeddings(embeddings, model="test-model", persist_path=persist_path).embed_query("first")
+
+    restarted_cache = CachedEmbeddings(embeddings, model="test-model", persist_path=persist_path)
+    embedding = restarted_cache.embed_query("first")
+
+    assert embedding == embeddings.embed_query("first")
+    assert restarted_cache.hits == 1
+
+
+def test_persistent_cache_is_keyed_by_model(embeddings, tmp_path):
+    """Test that embeddings from another model are not reused"""
+    persist_path = tmp_path / "embedding_cache.sqlite3"
+    CachedEmbeddings(embeddings, model="old-model", persist_path=persist_path).embed_query("first")
+
+    new_model_cache = CachedEmbeddings(embeddings, model="new-model", persist_path=persist_path)
+    new_model_cache.embed_query("first")
+
+    assert new_model_cache.hits == 0
+    assert new_model_cache.misses == 1
+
+
+def test_persistent_cache_is_pruned_on_open_and_write(embeddings, tmp_path):
+    """Test that expired embeddings and the oldest ones beyond the maximum size are deleted from SQLite"""
+    persist_path = tmp_path / "embedding_cache.sqlite3"
+    cache = CachedEmbeddings(embeddings, model="test-model", max_size=2, ttl_seconds=None, persist_path=persist_path)
+    for query in ["first", "second", "third"]:
+        cache.embed_query(query)
+
+    connection = sqlite3.connect(persist_path)
+    assert connection.execute("SELECT query FROM query_embeddings ORDER BY created_at").fetchall() == [
+        ("second",),
+        ("third",),
+    ]
+    CachedEmbeddings(embeddings, model="test-model", ttl_seconds=-1, persist_path=persist_path)
+    assert connection.execute("SELECT COUNT(*) FROM query_embeddings").fetchone() == (0,)
+
+
+def test_embed_queries_batches_cache_misses(embeddings):
+    """Test that several queries are embedded in one call for the cache misses only"""
+    cache = CachedEmbeddings(embeddings, model="test-model", persist_path=None)
+    cache.embed_query("first")
+
+    vectors = cache.embed_queries(["First", "second", "SECOND", "third"])
+
+    assert embeddings.document_calls == 1
+    assert vectors == [embeddings.embed_query(query) for query in ["first", "second", "second", "third"]]
+    assert cache.embed_queries(["second", "third"]) == vectors[2:]
+    assert embeddings.document_calls == 1
@@ -0,0 +1,49 @@
+import numpy as np
+from langchain_openai import OpenAIEmbeddings
+
+from emush_rag_chatbot.config import settings
+from emush_rag_chatbot.embeddings import HashingEmbeddings, create_embeddings, is_local_model
+
+
+def test_hashing_embeddings_are_normalized_and_deterministic():
+    """Test that texts get unit vectors of the configured size, identical in batch and one by one"""
+    embeddings = HashingEmbeddings(size=256)
+    texts = ["Quand on prend un objet caché", "La tabulatrice liste les compétences", ""]
+
+    vectors = np.asarray(embeddings.embed_documents(texts))
+
+    assert vectors.shape == (3, 256)
+    np.testing.assert_allclose(np.linalg.norm(vectors[:2], axis=1), 1, rtol=1e-6)
+    assert not vectors[2].any()
+    np.testing.assert_allclose(vectors[0], embeddings.embed_query(texts[0]), rtol=1e-6)
+
+
+def test_hashing_embeddings_rank_related_texts_higher():
+    """Test that texts sharing words, up to accents and inflections, are more similar than unrelated texts"""
+    embeddings = HashingEmbeddings()
+    query, related, unrelated = np.asarray(
+        embeddings.embed_documents(
+            [
+                "Quand on prend un objet caché, tout le monde voit le message ?",
+                "Prendre un objet cache laisse un message public",
+                "La tabulatrice liste les compétences de l'équipage",
+            ]
+        )
+    )
+
+    assert query @ related > 0.3
+    assert query @ related > query @ unrelated + 0.2
+
+
+def test_create_embeddings_selects_provider_from_model_name(monkeypatch):
+    """Test that hashing models are local and other model names are OpenAI models"""
+    monkeypatch.setattr(settings, "OPENAI_API_KEY", "test")
+
+    local_embeddings = create_embeddings("hashing-128")
+
+    assert isinstance(local_embeddings, HashingEmbeddings)
+    assert local_embeddings.size == 128
+    assert isinstance(create_embeddings("hashing"), HashingEmbeddings)
+    assert isinstance(create_embeddings("text-embedding-3-large"), OpenAIEmbeddings)
+    assert is_local_model("hashing-128")
+    assert not is_local_model("text-embedding-3-large")
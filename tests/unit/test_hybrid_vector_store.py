@@ -0,0 +1,63 @@
+import pytest
+from langchain_core.documents import Document
+
+from emush_rag_chatbot.bm25 import BM25Index
+from emush_rag_chatbot.hybrid_vector_store import HybridVectorStore, reciprocal_rank_fusion
+from emush_rag_chatbot.vector_store import FakeVectorStore
+
+
+@pytest.fixture
+def test_documents():
+    return [
+        Document(page_content="Mushrooms are fungi", metadata={"source": "Twinpedia", "link": "http://test.com/1"}),
+        Document(page_content="Bidouiller coûte 2 PA", metadata={"source": "Twinpedia", "link": "http://test.com/2"}),
+        Document(page_content="Spores infect humans", metadata={"source": "Twinpedia", "link": "http://test.com/3"}),
+    ]
+
+
+@pytest.fixture
+def vector_store(test_documents, embeddings):
+    return FakeVectorStore(documents=test_documents, embeddings=embeddings)
+
+
+def test_reciprocal_rank_fusion(test_documents):
+    """Test that documents ranked well by several rankings come first"""
+    first, second, third = test_documents
+
+    fused = reciprocal_rank_fusion([[first, second, third], [second, third]], k=2)
+
+    assert fused == [second, third]
+
+
+def test_hybrid_search_fuses_lexical_results(vector_store, test_documents):
+    """Test that a lexical match absent from the vector top-k is fused in"""
+    hybrid_store = HybridVectorStore(vector_store, BM25Index(test_documents), candidates=1, fast_path_enabled=False)
+
+    docs = hybrid_store.similarity_search_by_sources("bidouiller", k=2, sources=["Twinpedia"])["Twinpedia"]
+
+    assert {doc.page_content for doc in docs} == {"Mushrooms are fungi", "Bidouiller coûte 2 PA"}
+
+
+def test_fast_path_skips_query_embedding(vector_store, test_documents, embeddings):
+    """Test that a decisive lexical match is returned without embedding the query"""
+    hybrid_store = HybridVectorStore(
+        vector_store, BM25Index(test_documents), fast_path_enabled=True, fast_path_min_score=0.5
+    )
+
+    docs = hybrid_store.similarity_search_by_sources("bidouiller", k=2, sources=["Twinpedia"])["Twinpedia"]
+
+    assert [doc.page_content for doc in docs] == ["Bidouiller coûte 2 PA"]
+    assert embeddings.query_calls == 0
+    assert hybrid_store.fast_path_hits == 1
+
+
+def test_fast_path_falls_back_to_hybrid_search(vector_store, test_documents):
+    """Test that queries without a decisive lexical match use the vector store"""
+    hybrid_store = HybridVectorStore(
+        vector_store, BM25Index(test_documents), fast_path_enabled=True, fast_path_min_score=100
+    )
+
+    docs = hybrid_store.similarity_search_by_sources("bidouiller", k=3, sources=["Twinpedia"])["Twinpedia"]
+
+    assert len(docs) == 3
+    assert hybrid_store.fast_path_hits == 0
@@ -0,0 +1,120 @@
+import pytest
+from langchain_core.documents import Document
+
+from emush_rag_chatbot.index_manifest import IndexManifest, IndexUpdate, chunk_id, index_version
+
+
+def make_document(link: str, content: str, chunk: int = 0) -> Document:
+    return Document(page_content=content, metadata={"title": link, "link": link, "chunk": chunk})
+
+
+@pytest.fixture
+def indexed_documents():
+    return [
+        make_document("http://test.com/mush", "Mushs infect humans", chunk=0),
+        make_document("http://test.com/mush", "Spores are needed", chunk=1),
+        make_document("http://test.com/pilgred", "Repair the PILGRED"),
+    ]
+
+
+@pytest.fixture
+def manifest(indexed_documents):
+    manifest = IndexManifest()
+    manifest.apply(manifest.diff(indexed_documents))
+    return manifest
+
+
+def test_chunk_id_depends_on_content_and_position():
+    """Test that chunk identifiers change with the content or the chunk index"""
+    doc = make_document("http://test.com/mush", "Mushs infect humans")
+
+    assert chunk_id(doc) == chunk_id(make_document("http://test.com/mush", "Mushs infect humans"))
+    assert chunk_id(doc) != chunk_id(make_document("http://test.com/mush", "Mushs infect humans", chunk=1))
+    assert chunk_id(doc) != chunk_id(make_document("http://test.com/mush", "Mushs infect everyone"))
+
+
+def test_diff_of_unchanged_corpus_is_empty(manifest, indexed_documents):
+    """Test that re-indexing the same documents embeds nothing"""
+    diff = manifest.diff(indexed_documents)
+
+    assert diff.added == {}
+    assert diff.removed == set()
+    assert len(diff.unchanged) == 3
+
+
+def test_diff_detects_changed_and_removed_documents(manifest, indexed_documents):
+    """Test that only changed chunks are added, and chunks of changed or removed documents are deleted"""
+    changed_chunk = make_document("http://test.com/mush", "Spores are not needed", chunk=1)
+
+    diff = manifest.diff([indexed_documents[0], changed_chunk])
+
+    assert list(diff.added) == [chunk_id(changed_chunk)]
+    assert diff.removed == {chunk_id(indexed_documents[1]), chunk_id(indexed_documents[2])}
+    assert diff.removed_links == {"http://test.com/pilgred"}
+    assert diff.unchanged == {chunk_id(indexed_documents[0])}
+
+
+def test_save_and_load(manifest, indexed_documents, tmp_path):
+    """Test that a persisted manifest gives the same diff"""
+    manifest.save(tmp_path / "index_manifest.json")
+
+    loaded_manifest = IndexManifest.load(tmp_path / "index_manifest.json")
+
+    assert loaded_manifest.chunks == manifest.chunks
+    assert loaded_manifest.diff(indexed_documents).added == {}
+
+
+def test_save_and_load_embedding_model(manifest, tmp_path):
+    """Test that the embedding model and dimension are persisted, and that a change of either is detected"""
+    manifest.embedding_model, manifest.dimension = "text-embedding-3-large", 3072
+    manifest.save(tmp_path / "index_manifest.json")
+
+    loaded_manifest = IndexManifest.load(tmp_path / "index_manifest.json")
+
+    assert loaded_manifest.uses_embeddings("text-embedding-3-large", 3072)
+    assert not loaded_manifest.uses_embeddings("text-embedding-3-small", 1536)
+    assert not loaded_manifest.uses_embeddings("text-embedding-3-large", 256)
+    assert IndexManifest(manifest.chunks).uses_embeddings("text-embedding-3-small", 1536)
+
+
+def test_load_missing_manifest(tmp_path):
+    """Test that a missing manifest is empty"""
+    assert IndexManifest.load(tmp_path / "index_manifest.json").chunks == {}
+
+
+def test_index_version_follows_indexed_chunks(manifest, indexed_documents, tmp_path):
+    """Test that the index version changes with the indexed chunks and is read from the saved manifest"""
+    path = tmp_path / "index_manifest.json"
+    assert index_version(path) == ""
+    manifest.save(path)
+    version = index_version(path)
+
+    manifest.apply(manifest.diff(indexed_documents[:2]))
+    manifest.save(path)
+
+    assert index_version(path) == manifest.version != version
+
+
+def test_index_update_streams_new_chunks(manifest, indexed_documents):
+    """Test that a streamed update yields new chunks once and finds stale chunks after the stream is exhausted"""
+    new_chunk = make_document("http://test.com/eden", "Travel to Eden")
+    update = IndexUpdate(manifest)
+
+    new_chunks = list(update.new_chunks([indexed_documents[0], new_chunk, new_chunk]))
+
+    assert new_chunks == [(chunk_id(new_chunk), new_chunk)]
+    assert update.removed == {chunk_id(indexed_documents[1]), chunk_id(indexed_documents[2])}
+    assert update.removed_links == {"http://test.com/pilgred"}
+    update.apply()
+    assert set(manifest.chunks) == {chunk_id(indexed_documents[0]), chunk_id(new_chunk)}
+
+
+def test_index_update_keeps_stale_chunks_when_asked(manifest, indexed_documents):
+    """Test that unseen chunks stay in the manifest when stale chunks must not be removed"""
+    new_chunk = make_document("http://test.com/eden", "Travel to Eden")
+    update = IndexUpdate(manifest)
+    list(update.new_chunks([new_chunk]))
+
+    update.apply(remove_stale=False)
+
+    assert set(manifest.chunks) == {*(chunk_id(doc) for doc in indexed_documents), chunk_id(new_chunk)}
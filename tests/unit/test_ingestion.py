@@ -0,0 +1,150 @@
+import asyncio
+import time
+from typing import List
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from emush_rag_chatbot.ingestion import EmbeddingPipeline, RateLimiter, token_batches
+from emush_rag_chatbot.vector_store import ChromaVectorStore
+
+
+class RateLimitError(Exception):
+    """Error raised by a fake embedding API exceeding its rate limit"""
+
+    status_code = 429
+
+
+class FlakyEmbeddings(DeterministicFakeEmbedding):
+    """Deterministic fake embeddings rejecting the first requests as rate limited"""
+
+    failures: int = 0
+    requests: int = 0
+    in_flight: int = 0
+    max_in_flight: int = 0
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.requests += 1
+        if self.failures > 0:
+            self.failures -= 1
+            raise RateLimitError("Too Many Requests")
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        return self.embed_documents(texts)
+
+
+class RecordingWriter:
+    """Writer recording the bulk writes it receives"""
+
+    def __init__(self) -> None:
+        self.writes: List[List[str]] = []
+
+    def add_embeddings(self, documents: List[Document], embeddings: List[List[float]], ids: List[str]) -> None:
+        assert len(documents) == len(embeddings) == len(ids)
+        self.writes.append(ids)
+
+
+@pytest.fixture
+def documents():
+    return [
+        (f"id-{i}", Document(page_content=f"Document {i} " * 10, metadata={"source": "Mushpedia"})) for i in range(20)
+    ]
+
+
+def make_pipeline(embeddings, writer, **kwargs) -> EmbeddingPipeline:
+    options = {
+        "concurrency": 3,
+        "requests_per_minute": 10_000,
+        "tokens_per_minute": 10_000_000,
+        "max_batch_tokens": 100,
+        "max_batch_documents": 4,
+        "write_batch_size": 8,
+        "max_retries": 3,
+        "initial_backoff_seconds": 0.001,
+    }
+    return EmbeddingPipeline(embeddings, writer, **{**options, **kwargs})
+
+
+def test_token_batches_respect_token_and_document_bounds(documents):
+    """Test that batches never exceed the token and document budgets, and keep every document in order"""
+    batches = list(token_batches(documents, max_tokens=100, max_documents=4))
+
+    assert [id for batch in batches for id, _, _ in batch] == [id for id, _ in documents]
+    for batch in batches:
+        assert len(batch) <= 4
+        assert sum(tokens for _, _, tokens in batch) <= 100
+
+
+def test_token_batches_keep_oversized_document_alone():
+    """Test that a document larger than the token budget still gets its own batch"""
+    documents = [("small", Document(page_content="a")), ("large", Document(page_content="a" * 1000))]
+
+    batches = list(token_batches(documents, max_tokens=10, max_documents=10))
+
+    assert [[id for id, _, _ in batch] for batch in batches] == [["small"], ["large"]]
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_waits_for_the_token_budget():
+    """Test that a request exceeding the remaining token budget waits for the bucket to refill"""
+    limiter = RateLimiter(requests_per_minute=100, tokens_per_minute=6000)
+
+    await limiter.acquire(6000)
+    start = time.monotonic()
+    await limiter.acquire(10)
+
+    # 10 tokens refill in 0.1 second at 6000 tokens per minute
+    assert time.monotonic() - start >= 0.09
+
+
+@pytest.mark.asyncio
+async def test_pipeline_embeds_every_document_with_bounded_concurrency(documents):
+    """Test that every document is written in bulk with at most `concurrency` requests in flight"""
+    embeddings = FlakyEmbeddings(size=8)
+    writer = RecordingWriter()
+    progress = []
+
+    stats = await make_pipeline(embeddings, writer).run(documents, on_progress=progress.append)
+
+    assert sorted(id for write in writer.writes for id in write) == sorted(id for id, _ in documents)
+    assert all(len(write) <= 8 + 4 for write in writer.writes)
+    assert len(writer.writes) < stats.requests
+    assert embeddings.max_in_flight <= 3
+    assert sum(progress) == stats.chunks == len(documents)
+
+
+@pytest.mark.asyncio
+async def test_pipeline_retries_rate_limited_requests(documents):
+    """Test that HTTP 429 answers are retried with backoff instead of failing the run"""
+    embeddings = FlakyEmbeddings(size=8, failures=2)
+    writer = RecordingWriter()
+
+    stats = await make_pipeline(embeddings, writer).run(documents)
+
+    assert stats.retries == 2
+    assert stats.chunks == len(documents)
+
+
+@pytest.mark.asyncio
+async def test_pipeline_gives_up_after_max_retries(documents):
+    """Test that persistent rate limiting eventually raises"""
+    embeddings = FlakyEmbeddings(size=8, failures=100)
+
+    with pytest.raises(RateLimitError):
+        await make_pipeline(embeddings, RecordingWriter(), max_retries=2).run(documents)
+
+
+@pytest.mark.asyncio
+async def test_pipeline_writes_to_chroma(tmp_path, documents):
+    """Test that precomputed embeddings are written to Chroma under their identifiers"""
+    embeddings = FlakyEmbeddings(size=8)
+    vector_store = ChromaVectorStore(embeddings=embeddings, persist_directory=tmp_path / "chroma")
+
+    await make_pipeline(embeddings, vector_store).run(documents)
+
+    assert sorted(vector_store.get_ids()) == sorted(id for id, _ in documents)
+    results = vector_store.similarity_search(documents[3][1].page_content, k=1)
+    assert results[0].page_content == documents[3][1].page_content
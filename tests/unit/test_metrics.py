@@ -0,0 +1,37 @@
+import pytest
+from fastapi.testclient import TestClient
+from langchain_core.documents import Document
+from prometheus_client import REGISTRY
+
+from emush_rag_chatbot.api import app
+from emush_rag_chatbot.llm import FakeLLM
+from emush_rag_chatbot.rag_chain import RAGChain
+from emush_rag_chatbot.vector_store import FakeVectorStore
+
+
+def sample_value(name, labels=None):
+    return REGISTRY.get_sample_value(name, labels or {}) or 0.0
+
+
+@pytest.mark.asyncio
+async def test_rag_chain_records_stage_metrics():
+    """Test that generating a response records retrieved documents and prompt formatting duration"""
+    documents = [Document(page_content="Mushrooms are fungi", metadata={"source": "Twinpedia"})]
+    rag_chain = RAGChain(vector_store=FakeVectorStore(documents=documents), llm=FakeLLM())
+    retrieved_documents = sample_value("rag_retrieved_documents_total", {"source": "Twinpedia"})
+    prompt_formattings = sample_value("rag_prompt_formatting_duration_seconds_count")
+
+    await rag_chain.generate_response("What are mushrooms?")
+
+    assert sample_value("rag_retrieved_documents_total", {"source": "Twinpedia"}) == retrieved_documents + 1
+    assert sample_value("rag_prompt_formatting_duration_seconds_count") == prompt_formattings + 1
+
+
+def test_metrics_endpoint():
+    """Test that the metrics endpoint exposes pipeline metrics"""
+    response = TestClient(app).get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=")
+    assert "# TYPE rag_retrieval_duration_seconds histogram" in response.text
+    assert "# TYPE rag_requests_in_flight gauge" in response.text
@@ -0,0 +1,284 @@
+import numpy as np
+import pytest
+import pytest_asyncio
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from prometheus_client import REGISTRY
+
+from emush_rag_chatbot.bm25 import BM25Index
+from emush_rag_chatbot.numpy_vector_store import (
+    MappedDocuments,
+    NumpyIndexWriter,
+    NumpyVectorStore,
+    load_bm25_index,
+    published_index_dir,
+    quantize_int8,
+    top_k_indices,
+    write_numpy_index,
+)
+
+
+@pytest.fixture
+def embeddings():
+    return DeterministicFakeEmbedding(size=32)
+
+
+@pytest.fixture
+def test_documents():
+    return [
+        Document(page_content=f"{source} document {i}", metadata={"source": source, "link": f"http://test.com/{i}"})
+        for source in ["Twinpedia", "Mushpedia", "Aide aux Bolets"]
+        for i in range(5)
+    ]
+
+
+@pytest_asyncio.fixture
+async def numpy_vector_store(embeddings, test_documents, tmp_path):
+    vector_store = NumpyVectorStore(embeddings=embeddings, index_dir=tmp_path / "numpy_index")
+    await vector_store.add_documents(test_documents)
+    return vector_store
+
+
+def test_top_k_indices():
+    """Test that the indices of the best scores are returned best first"""
+    scores = np.array([0.1, 0.9, 0.5, 0.7, 0.3])
+
+    assert top_k_indices(scores, 3).tolist() == [1, 3, 2]
+    assert top_k_indices(scores, 10).tolist() == [1, 3, 2, 4, 0]
+
+
+@pytest.mark.asyncio
+async def test_similarity_search_by_sources_is_exact(numpy_vector_store, embeddings, test_documents):
+    """Test that each source gets its exact top-k documents by cosine similarity"""
+    query = "Mushpedia document 3"
+    docs_by_source = numpy_vector_store.similarity_search_by_sources(
+        query, k=2, sources=["Mushpedia", "Twinpedia", "Mush Forums"]
+    )
+
+    query_vector = np.asarray(embeddings.embed_query(query))
+    for source in ["Mushpedia", "Twinpedia"]:
+        source_docs = [doc for doc in test_documents if doc.metadata["source"] == source]
+        vectors = np.asarray(embeddings.embed_documents([doc.page_content for doc in source_docs]))
+        similarities = vectors @ query_vector / np.linalg.norm(vectors, axis=1)
+        expected = [source_docs[i].page_content for i in np.argsort(-similarities)[:2]]
+        assert [doc.page_content for doc in docs_by_source[source]] == expected
+    assert docs_by_source["Mushpedia"][0].page_content == query
+    assert docs_by_source["Mush Forums"] == []
+
+
+@pytest.mark.asyncio
+async def test_similarity_search_with_metadata_filter(numpy_vector_store):
+    """Test that metadata filters restrict the searched documents"""
+    docs = numpy_vector_store.similarity_search("Twinpedia document 1", k=3, filter_metadata={"source": "Twinpedia"})
+
+    assert len(docs) == 3
+    assert docs[0].page_content == "Twinpedia document 1"
+    assert all(doc.metadata["source"] == "Twinpedia" for doc in docs)
+
+
+@pytest.mark.asyncio
+async def test_index_is_memory_mapped_on_load(numpy_vector_store, embeddings, tmp_path):
+    """Test that a new store memory-maps the index written by a previous one"""
+    reloaded_store = NumpyVectorStore(embeddings=embeddings, index_dir=tmp_path / "numpy_index")
+
+    assert isinstance(reloaded_store.matrix, np.memmap)
+    assert len(reloaded_store.documents) == 15
+    assert reloaded_store.similarity_search_by_sources("Aide aux Bolets document 2", k=1, sources=["Aide aux Bolets"])[
+        "Aide aux Bolets"
+    ][0].page_content == ("Aide aux Bolets document 2")
+
+
+@pytest.mark.asyncio
+async def test_float16_index_returns_same_results(embeddings, test_documents, tmp_path):
+    """Test that storing embeddings as float16 keeps the same top results"""
+    vector_store = NumpyVectorStore(embeddings=embeddings, index_dir=tmp_path / "numpy_index", dtype="float16")
+    await vector_store.add_documents(test_documents)
+
+    docs = vector_store.similarity_search("Mushpedia document 4", k=1)
+
+    assert vector_store.matrix.dtype == np.float16
+    assert docs[0].page_content == "Mushpedia document 4"
+
+
+@pytest.mark.asyncio
+async def test_similarity_search_by_sources_batch_matches_single_searches(numpy_vector_store):
+    """Test that batch search returns the same documents as one search per query"""
+    queries = ["Mushpedia document 3", "Twinpedia document 1", "Aide aux Bolets document 4"]
+    sources = ["Twinpedia", "Mushpedia", "Aide aux Bolets"]
+
+    results = numpy_vector_store.similarity_search_by_sources_batch(queries, k=2, sources=sources)
+
+    assert results == [
+        numpy_vector_store.similarity_search_by_sources(query, k=2, sources=sources) for query in queries
+    ]
+
+
+@pytest.mark.asyncio
+async def test_similarity_search_records_stage_metrics(numpy_vector_store):
+    """Test that searches record query embedding and per-source retrieval durations"""
+
+    def count(name, labels=None):
+        return REGISTRY.get_sample_value(name, labels or {}) or 0.0
+
+    embeddings = count("rag_query_embedding_duration_seconds_count")
+    retrievals = count("rag_retrieval_duration_seconds_count", {"source": "Mushpedia"})
+
+    numpy_vector_store.similarity_search_by_sources("Mushpedia document 3", k=2, sources=["Mushpedia", "Twinpedia"])
+    numpy_vector_store.similarity_search_by_sources_batch(["a", "b"], k=2, sources=["Mushpedia"])
+
+    assert count("rag_query_embedding_duration_seconds_count") == embeddings + 2
+    assert count("rag_retrieval_duration_seconds_count", {"source": "Mushpedia"}) == retrievals + 2
+
+
+def test_mapped_documents_are_decoded_on_access(embeddings, tmp_path):
+    """Test that documents are read back from the memory-mapped blobs, grouped by source"""
+    documents = [
+        Document(page_content="Écholocateur : +1 section", metadata={"source": "Twinpedia", "chunk": 1}),
+        Document(page_content="", metadata={"source": "Mushpedia"}),
+        Document(page_content="Tabulatrice", metadata={"source": "Twinpedia", "title": "Équipement"}),
+    ]
+    write_numpy_index(tmp_path, documents, np.asarray(embeddings.embed_documents(["a", "b", "c"])))
+
+    mapped_documents = MappedDocuments(published_index_dir(tmp_path))
+
+    assert len(mapped_documents) == 3
+    assert list(mapped_documents) == [documents[1], documents[0], documents[2]]
+    assert mapped_documents[-1] == documents[2]
+    with pytest.raises(IndexError):
+        mapped_documents[3]
+
+
+def test_quantize_int8_keeps_inner_products():
+    """Test that int8 rows scaled back are close to the original rows"""
+    matrix = np.random.default_rng(0).normal(size=(10, 64)).astype(np.float32)
+
+    quantized, scales = quantize_int8(matrix)
+
+    assert quantized.dtype == np.int8
+    np.testing.assert_allclose(quantized * scales[:, None], matrix, atol=float(scales.max()) / 2 + 1e-6)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("quantization", ["int8", "binary"])
+async def test_quantized_search_rescores_candidates(
+    numpy_vector_store, embeddings, test_documents, tmp_path, quantization
+):
+    """Test that rescoring every candidate of a source gives the exact results, and few candidates the best one"""
+    queries = ["Mushpedia document 3", "Twinpedia document 1", "Aide aux Bolets document 4"]
+    sources = ["Twinpedia", "Mushpedia", "Aide aux Bolets"]
+    vectors = np.asarray(embeddings.embed_documents([doc.page_content for doc in test_documents]))
+    write_numpy_index(tmp_path / "quantized_index", test_documents, vectors, quantizations=[quantization])
+    quantized_store = NumpyVectorStore(
+        embeddings=embeddings, index_dir=tmp_path / "quantized_index", quantization=quantization, rescore_candidates=5
+    )
+    narrow_store = NumpyVectorStore(
+        embeddings=embeddings, index_dir=tmp_path / "quantized_index", quantization=quantization, rescore_candidates=3
+    )
+
+    assert quantized_store.similarity_search_by_sources_batch(queries, k=2, sources=sources) == (
+        numpy_vector_store.similarity_search_by_sources_batch(queries, k=2, sources=sources)
+    )
+    assert narrow_store.similarity_search("Mushpedia document 3", k=1)[0].page_content == "Mushpedia document 3"
+
+
+@pytest.mark.asyncio
+async def test_prefix_search_reranks_shortlist_with_full_vectors(
+    numpy_vector_store, embeddings, test_documents, tmp_path
+):
+    """Test that candidates are searched on renormalized prefixes and reranked with the full vectors"""
+    queries = ["Mushpedia document 3", "Twinpedia document 1", "Aide aux Bolets document 4"]
+    sources = ["Twinpedia", "Mushpedia", "Aide aux Bolets"]
+    vectors = np.asarray(embeddings.embed_documents([doc.page_content for doc in test_documents]))
+    write_numpy_index(tmp_path / "prefix_index", test_documents, vectors, prefix_search=True, prefix_dimensions=8)
+
+    prefix_store = NumpyVectorStore(
+        embeddings=embeddings, index_dir=tmp_path / "prefix_index", prefix_search=True, rescore_candidates=5
+    )
+
+    assert prefix_store.candidate_matrix is not None
+    assert prefix_store.candidate_matrix.shape == (15, 8)
+    np.testing.assert_allclose(np.linalg.norm(prefix_store.candidate_matrix, axis=1), 1, rtol=1e-6)
+    assert prefix_store.similarity_search_by_sources_batch(queries, k=2, sources=sources) == (
+        numpy_vector_store.similarity_search_by_sources_batch(queries, k=2, sources=sources)
+    )
+    with pytest.raises(ValueError):
+        NumpyVectorStore(
+            embeddings=embeddings, index_dir=tmp_path / "prefix_index", prefix_search=True, quantization="int8"
+        )
+
+
+def test_index_writer_writes_blocks_like_a_single_write(embeddings, test_documents, tmp_path):
+    """Test that writing an index block by block gives the same files, and that sources must not be interleaved"""
+    documents = sorted(test_documents, key=lambda doc: doc.metadata["source"])
+    vectors = np.asarray(embeddings.embed_documents([doc.page_content for doc in documents]))
+    write_numpy_index(tmp_path / "single", documents, vectors)
+
+    writer = NumpyIndexWriter(tmp_path / "blocks", len(documents))
+    for start in range(0, len(documents), 4):
+        writer.write(documents[start : start + 4], vectors[start : start + 4])
+    writer.close()
+
+    single_dir, blocks_dir = published_index_dir(tmp_path / "single"), published_index_dir(tmp_path / "blocks")
+    for file in sorted(path.name for path in single_dir.iterdir()):
+        assert (blocks_dir / file).read_bytes() == (single_dir / file).read_bytes()
+    interleaved_writer = NumpyIndexWriter(tmp_path / "interleaved", 3)
+    with pytest.raises(ValueError):
+        interleaved_writer.write([documents[0], documents[5], documents[1]], vectors[[0, 5, 1]])
+
+
+@pytest.mark.asyncio
+async def test_new_index_version_is_published_atomically(numpy_vector_store, embeddings, test_documents, tmp_path):
+    """Test that writing an index publishes a new version without touching the one mapped by a running store"""
+    index_dir = tmp_path / "numpy_index"
+    first_version = published_index_dir(index_dir)
+    vectors = np.asarray(embeddings.embed_documents([doc.page_content for doc in test_documents]))
+
+    write_numpy_index(index_dir, test_documents[:3], vectors[:3])
+    write_numpy_index(index_dir, test_documents[:2], vectors[:2])
+
+    assert (index_dir / "current").is_symlink()
+    assert len(NumpyVectorStore(embeddings=embeddings, index_dir=index_dir).documents) == 2
+    # The previous version is kept for stores loading it, older ones are deleted
+    assert len(list(index_dir.glob("index-*"))) == 2
+    assert not first_version.exists()
+    assert len(numpy_vector_store.documents) == 15
+    assert numpy_vector_store.similarity_search("Mushpedia document 4", k=1)[0].page_content == "Mushpedia document 4"
+
+
+@pytest.mark.asyncio
+async def test_only_configured_candidate_copies_are_written(numpy_vector_store, embeddings, tmp_path):
+    """Test that exact search indexes hold no quantized nor shortened copy, and that searching a missing copy fails"""
+    files = {path.name for path in published_index_dir(tmp_path / "numpy_index").iterdir()}
+
+    assert {file for file in files if not file.startswith("bm25")} == {
+        "embeddings.npy",
+        "offsets.npy",
+        "texts.bin",
+        "metadata.bin",
+        "partitions.json",
+    }
+    with pytest.raises(ValueError, match="embeddings_binary.npy"):
+        NumpyVectorStore(embeddings=embeddings, index_dir=tmp_path / "numpy_index", quantization="binary")
+
+
+def test_bm25_index_is_written_with_the_numpy_index(embeddings, tmp_path):
+    """Test that the BM25 index written with the NumPy index is memory-mapped and returns its mapped documents"""
+    documents = [
+        Document(page_content="Tabulatrice et liste d'Eleesha", metadata={"source": "Twinpedia"}),
+        Document(page_content="Réparer le PILGRED", metadata={"source": "Mushpedia"}),
+        Document(page_content="Le PILGRED mène à la planète Sol", metadata={"source": "Mushpedia"}),
+    ]
+    vectors = np.asarray(embeddings.embed_documents([doc.page_content for doc in documents]))
+    write_numpy_index(tmp_path / "numpy_index", documents, vectors)
+
+    bm25_index = load_bm25_index(tmp_path / "numpy_index")
+    results = bm25_index.search_by_sources("pilgred planète", k=1, sources=["Mushpedia", "Twinpedia", "Mush Forums"])
+
+    assert isinstance(bm25_index.documents, MappedDocuments)
+    assert results == BM25Index(documents).search_by_sources(
+        "pilgred planète", k=1, sources=["Mushpedia", "Twinpedia", "Mush Forums"]
+    )
+    assert [doc for doc, _ in results["Mushpedia"]] == [documents[2]]
+    assert results["Twinpedia"] == results["Mush Forums"] == []
+    write_numpy_index(tmp_path / "without_bm25", documents, vectors, bm25=False)
+    assert load_bm25_index(tmp_path / "without_bm25") is None
@@ -1,6 +1,9 @@
+import threading
+
 import pytest
 from langchain_core.documents import Document
 
+from emush_rag_chatbot.answer_cache import SemanticAnswerCache
 from emush_rag_chatbot.llm import FakeLLM
 from emush_rag_chatbot.rag_chain import RAGChain
 from emush_rag_chatbot.vector_store import FakeVectorStore
@@ -81,3 +84,134 @@ def test_empty_chat_history(rag_chain):
     """Test formatting empty chat history"""
     assert rag_chain._format_chat_history(None) == "No previous conversation."
     assert rag_chain._format_chat_history([]) == "No previous conversation."
+
+
+@pytest.mark.asyncio
+async def test_generate_response_groups_documents_by_source(rag_chain):
+    """Test that retrieved documents follow the configured source priority"""
+    _, docs = await rag_chain.generate_response("What are mushrooms?")
+
+    assert [doc.metadata["source"] for doc in docs] == ["Twinpedia", "Aide aux Bolets"]
+
+
+@pytest.mark.asyncio
+async def test_generate_response_reuses_cached_answer(fake_vector_store, fake_llm):
+    """Test that a repeated query without chat history is answered from the answer cache"""
+    rag_chain = RAGChain(vector_store=fake_vector_store, llm=fake_llm, answer_cache=SemanticAnswerCache())
+    first_response, first_docs = await rag_chain.generate_response("What are mushrooms?")
+
+    fake_llm.response = "Another response"
+    second_response, second_docs = await rag_chain.generate_response("What are mushrooms?")
+
+    assert second_response == first_response
+    assert second_docs == first_docs
+
+
+@pytest.mark.asyncio
+async def test_generate_response_skips_answer_cache_with_chat_history(fake_vector_store, fake_llm):
+    """Test that queries with chat history are always answered by the LLM"""
+    rag_chain = RAGChain(vector_store=fake_vector_store, llm=fake_llm, answer_cache=SemanticAnswerCache())
+    chat_history = [{"human": "What are mushrooms?", "assistant": "Mushrooms are fungi"}]
+    await rag_chain.generate_response("Tell me more", chat_history=chat_history)
+
+    fake_llm.response = "Another response"
+    response, _ = await rag_chain.generate_response("Tell me more", chat_history=chat_history)
+
+    assert response == "Another response"
+
+
+@pytest.mark.asyncio
+async def test_stream_response_sends_sources_then_tokens(rag_chain):
+    """Test that streaming sends the sources first, then the response tokens"""
+    events = [event async for event in rag_chain.stream_response("What are mushrooms?")]
+
+    assert events[0]["event"] == "sources"
+    assert [doc.metadata["source"] for doc in events[0]["data"]] == ["Twinpedia", "Aide aux Bolets"]
+    assert all(event["event"] == "token" for event in events[1:])
+    assert "".join(event["data"] for event in events[1:]) == "This is a test response about mushrooms"
+
+
+@pytest.mark.asyncio
+async def test_generate_responses_keeps_order_and_isolates_errors(fake_vector_store, failing_llm):
+    """Test that batch results follow the query order, with an exception for failed queries only"""
+    rag_chain = RAGChain(vector_store=fake_vector_store, llm=failing_llm)
+
+    results = await rag_chain.generate_responses(["What are mushrooms?", "What are bolets?", "what are MUSHROOMS?"])
+
+    assert results[0][0] == "Fungi"
+    assert isinstance(results[1], RuntimeError)
+    assert results[2][0] == "Fungi"
+    assert [doc.metadata["source"] for doc in results[0][1]] == ["Twinpedia", "Aide aux Bolets"]
+
+
+@pytest.mark.asyncio
+async def test_generate_responses_embeds_queries_once(fake_vector_store, fake_llm, monkeypatch):
+    """Test that a batch embeds all its distinct queries in a single call"""
+    calls = []
+    embed_queries = fake_vector_store.embed_queries
+    monkeypatch.setattr(
+        fake_vector_store, "embed_queries", lambda queries: calls.append(queries) or embed_queries(queries)
+    )
+    rag_chain = RAGChain(vector_store=fake_vector_store, llm=fake_llm)
+
+    await rag_chain.generate_responses(["What are mushrooms?", "What are bolets?", "What are mushrooms?"])
+
+    assert calls == [["What are mushrooms?", "What are bolets?"]]
+
+
+@pytest.mark.asyncio
+async def test_generate_responses_embeds_and_retrieves_off_the_event_loop(fake_vector_store, fake_llm, monkeypatch):
+    """Test that batch embedding and retrieval run in worker threads, leaving the event loop free"""
+    threads = []
+    for method in ["embed_queries", "similarity_search_by_sources_batch"]:
+        original = getattr(fake_vector_store, method)
+        monkeypatch.setattr(
+            fake_vector_store,
+            method,
+            lambda *args, original=original, **kwargs: (
+                threads.append(threading.get_ident()) or original(*args, **kwargs)
+            ),
+        )
+    rag_chain = RAGChain(vector_store=fake_vector_store, llm=fake_llm)
+
+    await rag_chain.generate_responses(["What are mushrooms?"])
+
+    assert len(threads) == 2
+    assert threading.get_ident() not in threads
+
+
+@pytest.mark.asyncio
+async def test_warm_up_answers_queries_into_answer_cache(fake_vector_store, fake_llm):
+    """Test that answered warm-up queries are served from the answer cache"""
+    rag_chain = RAGChain(vector_store=fake_vector_store, llm=fake_llm, answer_cache=SemanticAnswerCache())
+    await rag_chain.warm_up(["What are mushrooms?"], answer=True)
+
+    fake_llm.response = "Another response"
+    response, _ = await rag_chain.generate_response("What are mushrooms?")
+
+    assert response == "This is a test response about mushrooms"
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("stream", [False, True])
+async def test_single_query_embeds_and_retrieves_off_the_event_loop(fake_vector_store, fake_llm, monkeypatch, stream):
+    """Test that answering and streaming embed the query and retrieve documents in worker threads"""
+    threads = []
+    for method in ["embed_query", "similarity_search_by_sources"]:
+        original = getattr(fake_vector_store, method)
+        monkeypatch.setattr(
+            fake_vector_store,
+            method,
+            lambda *args, original=original, **kwargs: (
+                threads.append(threading.get_ident()) or original(*args, **kwargs)
+            ),
+        )
+    rag_chain = RAGChain(vector_store=fake_vector_store, llm=fake_llm, answer_cache=SemanticAnswerCache())
+
+    if stream:
+        [event async for event in rag_chain.stream_response("What are mushrooms?")]
+    else:
+        await rag_chain.generate_response("What are mushrooms?")
+
+    assert len(threads) == 2
+    assert threading.get_ident() not in threads
@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+from langchain_core.documents import Document
+from prometheus_client import REGISTRY
+
+from emush_rag_chatbot.rag_chain import RAGChain
+from emush_rag_chatbot.single_flight import SingleFlight
+from emush_rag_chatbot.vector_store import FakeVectorStore
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_computation():
+    """Test that concurrent calls with the same key run the function once and get its result"""
+    single_flight = SingleFlight[int]("test")
+    calls = 0
+
+    async def compute():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return 42
+
+    results = await asyncio.gather(*(single_flight.do("key", compute) for _ in range(5)))
+    await single_flight.do("key", compute)
+
+    assert results == [42] * 5
+    assert calls == 2
+
+
+@pytest.mark.asyncio
+async def test_errors_are_propagated_to_every_caller():
+    """Test that every caller gets the exception, and that the next call retries"""
+    single_flight = SingleFlight[int]("test")
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("LLM unavailable")
+
+    results = await asyncio.gather(*(single_flight.do("key", fail) for _ in range(3)), return_exceptions=True)
+
+    assert all(isinstance(result, ValueError) for result in results)
+    assert await single_flight.do("key", lambda: asyncio.sleep(0, result=1)) == 1
+
+
+@pytest.mark.asyncio
+async def test_cancelling_a_caller_does_not_cancel_the_others():
+    """Test that the computation survives a cancelled caller and is cancelled once every caller is gone"""
+    single_flight = SingleFlight[int]("test")
+    started = asyncio.Event()
+    finished = asyncio.Event()
+
+    async def compute():
+        started.set()
+        try:
+            await asyncio.sleep(0.05)
+            return 42
+        finally:
+            finished.set()
+
+    first = asyncio.create_task(single_flight.do("key", compute))
+    second = asyncio.create_task(single_flight.do("key", compute))
+    await started.wait()
+    first.cancel()
+
+    assert await second == 42
+    with pytest.raises(asyncio.CancelledError):
+        await first
+
+    finished.clear()
+    only = asyncio.create_task(single_flight.do("other", compute))
+    await asyncio.sleep(0.01)
+    only.cancel()
+    await finished.wait()
+    assert single_flight._calls == {}
+
+
+@pytest.mark.asyncio
+async def test_generate_response_coalesces_identical_queries(slow_llm):
+    """Test that identical concurrent queries without history share one LLM call"""
+    documents = [Document(page_content="Mushrooms are fungi", metadata={"source": "Twinpedia"})]
+    rag_chain = RAGChain(vector_store=FakeVectorStore(documents=documents), llm=slow_llm)
+    labels = {"call": "generate_response", "role": "follower"}
+    followers = REGISTRY.get_sample_value("rag_coalesced_calls_total", labels) or 0.0
+
+    results = await asyncio.gather(
+        rag_chain.generate_response("What are mushrooms?"),
+        rag_chain.generate_response("what are  MUSHROOMS?"),
+        rag_chain.generate_response("What are mushrooms?", [{"human": "Hi", "assistant": "Hello"}]),
+    )
+
+    assert [response for response, _ in results] == ["Mushrooms are fungi"] * 3
+    assert slow_llm.calls == 2
+    assert REGISTRY.get_sample_value("rag_coalesced_calls_total", labels) == followers + 1
@@ -0,0 +1,86 @@
+import pytest
+import pytest_asyncio
+from langchain_core.documents import Document
+
+from emush_rag_chatbot.vector_store import ChromaVectorStore
+
+
+@pytest.fixture
+def test_documents():
+    return [
+        Document(page_content=f"{source} document {i}", metadata={"source": source, "link": f"http://test.com/{i}"})
+        for source in ["Twinpedia", "Mushpedia", "Aide aux Bolets"]
+        for i in range(3)
+    ]
+
+
+@pytest_asyncio.fixture
+async def chroma_vector_store(embeddings, test_documents, tmp_path):
+    vector_store = ChromaVectorStore(embeddings=embeddings, persist_directory=tmp_path / "chroma_db")
+    await vector_store.add_documents(test_documents)
+    return vector_store
+
+
+@pytest.mark.asyncio
+async def test_similarity_search_by_sources_returns_top_k_per_source(chroma_vector_store):
+    """Test that each requested source gets its own top-k documents"""
+    docs_by_source = chroma_vector_store.similarity_search_by_sources(
+        "Mushpedia document 1", k=2, sources=["Twinpedia", "Mushpedia", "Mush Forums"]
+    )
+
+    assert list(docs_by_source) == ["Twinpedia", "Mushpedia", "Mush Forums"]
+    assert len(docs_by_source["Twinpedia"]) == 2
+    assert all(doc.metadata["source"] == "Twinpedia" for doc in docs_by_source["Twinpedia"])
+    assert all(doc.metadata["source"] == "Mushpedia" for doc in docs_by_source["Mushpedia"])
+    assert docs_by_source["Mush Forums"] == []
+
+
+@pytest.mark.asyncio
+async def test_similarity_search_by_sources_embeds_query_once(chroma_vector_store, embeddings):
+    """Test that the query is embedded once whatever the number of sources"""
+    chroma_vector_store.similarity_search_by_sources(
+        "What are mushrooms?", k=3, sources=["Twinpedia", "Mushpedia", "Aide aux Bolets", "Mush Forums"]
+    )
+
+    assert embeddings.query_calls == 1
+
+
+@pytest.mark.asyncio
+async def test_add_documents_with_ids_replaces_existing_documents(embeddings, test_documents, tmp_path):
+    """Test that re-adding documents with the same identifiers does not duplicate them"""
+    vector_store = ChromaVectorStore(embeddings=embeddings, persist_directory=tmp_path / "chroma_db")
+    ids = [f"id-{i}" for i in range(len(test_documents))]
+
+    await vector_store.add_documents(test_documents, ids=ids)
+    await vector_store.add_documents(test_documents, ids=ids)
+
+    assert sorted(vector_store.get_ids()) == sorted(ids)
+
+
+@pytest.mark.asyncio
+async def test_delete_documents(embeddings, test_documents, tmp_path):
+    """Test that deleted documents are no longer indexed"""
+    vector_store = ChromaVectorStore(embeddings=embeddings, persist_directory=tmp_path / "chroma_db")
+    ids = [f"id-{i}" for i in range(len(test_documents))]
+    await vector_store.add_documents(test_documents, ids=ids)
+
+    vector_store.delete_documents(ids[:2])
+
+    assert sorted(vector_store.get_ids()) == sorted(ids[2:])
+
+
+@pytest.mark.asyncio
+async def test_documents_and_embeddings_are_read_by_pages(chroma_vector_store, test_documents):
+    """Test that documents are counted and streamed by source, a page at a time"""
+    pages = list(chroma_vector_store.iter_documents_and_embeddings("Mushpedia", batch_size=2))
+
+    assert chroma_vector_store.count_documents_by_source(batch_size=2) == {
+        "Twinpedia": 3,
+        "Mushpedia": 3,
+        "Aide aux Bolets": 3,
+    }
+    assert [len(documents) for documents, _ in pages] == [2, 1]
+    assert [embeddings.shape for _, embeddings in pages] == [(2, 8), (1, 8)]
+    assert {doc.page_content for documents, _ in pages for doc in documents} == {
+        doc.page_content for doc in test_documents if doc.metadata["source"] == "Mushpedia"
+    }